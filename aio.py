@@ -0,0 +1,412 @@
+"""
+Async counterparts of the ibstrat request helpers used by the entry pipeline.
+
+Each helper awaits the ib_async *Async request methods directly and reserves its
+messages with the pacer of the connection it uses (pool.pacer_for), so several symbols
+can be worked on at once on the single ib_async event loop.
+"""
+import asyncio
+import logging
+from math import isnan
+
+from ib_async import Contract, Future
+
+from ibstrat.ticksize import get_tick_size, adjust_to_tick_size
+from chain_snapshot import ChainSnapshot
+from ibpool import pool
+from instrument import latency
+from tradecal import expiry_target_date, next_closest_expiry
+from qualcache import qualification_cache
+from reqcache import request_cache
+from strategies import StrategyParams
+import cfg
+
+logger = logging.getLogger('DC')
+
+
+def valid_price(price) -> bool:
+    return price is not None and not isnan(price) and price > 0
+
+
+def option_sec_type(und_contract) -> str:
+    return 'FOP' if und_contract.secType == 'FUT' else 'OPT'
+
+
+async def qualify_contract_async(**kwargs):
+    """Qualify a contract built from keyword fields, returning None if IB cannot resolve it."""
+    try:
+        [contract] = await qualify_contracts_async(kwargs)
+    except ValueError as e:
+        logger.error(f"Unable to qualify contract: {e}")
+        return None
+    return contract
+
+
+async def qualify_contracts_async(*specs: dict) -> list:
+    """
+    Qualify several contracts, each given as a dict of contract fields, in one round-trip.
+
+    Contracts already in the persistent qualification cache are served locally; the
+    rest go to the gateway together in a single qualifyContractsAsync call, shared
+    with any identical request in flight. Results are returned in the order of the
+    specs. Raises ValueError if any contract is unknown or ambiguous.
+    """
+    contracts = [qualification_cache.get(Contract(**spec)) for spec in specs]
+    missing = [i for i, contract in enumerate(contracts) if contract is None]
+    if missing:
+        requested = [Contract(**specs[i]) for i in missing]
+
+        async def qualify():
+            md = pool.market_data()
+            async with pool.pacer_for(md).slot(cost=len(requested)):
+                return await md.qualifyContractsAsync(*requested, returnAll=True)
+
+        key = ('qualify',) + tuple(qualification_cache.key(contract) for contract in requested)
+        results = await request_cache.get(key, qualify)
+        failed = []
+        for i, result in zip(missing, results):
+            if isinstance(result, list):
+                failed.append(f"ambiguous {specs[i]} ({len(result)} matches)")
+            elif result is None or not result.conId:
+                failed.append(f"unknown {specs[i]}")
+            else:
+                qualification_cache.put(Contract(**specs[i]), result)
+                contracts[i] = result
+        if failed:
+            raise ValueError("; ".join(failed))
+    return contracts
+
+
+async def get_front_month_contract_date_async(symbol: str, exchange: str, mult: str, target_expiry: str):
+    """Return the expiry of the first future expiring on or after target_expiry."""
+    async def contract_details():
+        md = pool.market_data()
+        async with pool.pacer_for(md).slot():
+            return await md.reqContractDetailsAsync(
+                Future(symbol=symbol, exchange=exchange, multiplier=mult, currency='USD'))
+
+    details = await request_cache.get(('futures', symbol, exchange, mult), contract_details)
+    expiries = sorted(d.contract.lastTradeDateOrContractMonth for d in details)
+    for expiry in expiries:
+        if expiry[:8] >= target_expiry:
+            return expiry
+    logger.error(f"No {symbol} future expiring on or after {target_expiry}")
+    return None
+
+
+async def get_current_mid_price_async(contract):
+    """Return the mid (or market price) of the contract, shared for cfg.shared_quote_max_age seconds."""
+    async def snapshot():
+        md = pool.market_data()
+        async with pool.pacer_for(md).slot():
+            return await md.reqTickersAsync(contract)
+
+    [ticker] = await request_cache.get(('ticker', contract.conId), snapshot, cfg.shared_quote_max_age)
+    mid = ticker.midpoint()
+    if not valid_price(mid):
+        mid = ticker.marketPrice()
+    return mid
+
+
+async def get_option_expirations_async(und_contract, trading_class: str = ''):
+    """Return the sorted option expirations for the underlying, filtered by trading class."""
+    fut_fop_exchange = und_contract.exchange if und_contract.secType == 'FUT' else ''
+
+    async def secdef():
+        md = pool.market_data()
+        async with pool.pacer_for(md).slot():
+            return await md.reqSecDefOptParamsAsync(und_contract.symbol, fut_fop_exchange,
+                                                                     und_contract.secType, und_contract.conId)
+
+    chains = await request_cache.get(('secdef', und_contract.conId), secdef)
+    expirations = set()
+    for chain in chains:
+        if not trading_class or chain.tradingClass == trading_class:
+            expirations.update(chain.expirations)
+    return sorted(expirations)
+
+
+async def find_next_closest_expiry_async(und_contract, target_expiry: str, trading_class: str = ''):
+    """Return the first listed expiry on or after target_expiry."""
+    [expiry] = await find_next_closest_expiries_async(und_contract, [target_expiry], trading_class)
+    return expiry
+
+
+async def find_next_closest_expiries_async(und_contract, target_expiries: list, trading_class: str = ''):
+    """
+    Resolve several target dates against a single reqSecDefOptParams request.
+
+    Returns the next closest expiry for each target, in the order given.
+    """
+    expirations = await get_option_expirations_async(und_contract, trading_class)
+    resolved = {target: next_closest_expiry(expirations, target) for target in set(target_expiries)}
+    for target, expiry in resolved.items():
+        if expiry is None:
+            logger.error(f"No expiry found on or after {target} for {und_contract.symbol}")
+    return [resolved[target] for target in target_expiries]
+
+
+async def resolve_underlying_async(symbol: str, params: StrategyParams, trading_class: str):
+    """
+    Qualify the underlying for a strategy and, concurrently, fetch its mid price and
+    resolve the short/long put/call expiries from one secdef request.
+
+    Returns (und_contract, current_mid, [short_put, short_call, long_put, long_call]),
+    or None if the underlying or any expiry cannot be resolved.
+    """
+    if params.sec_type == 'FUT':
+        with latency.span('front_month', symbol):
+            fut_date = await get_front_month_contract_date_async(symbol, params.exchange, params.mult,
+                                                                 expiry_target_date(params.long_call_expiry_days,
+                                                                                    params.sec_type))
+        logger.debug(f"Front month contract date for {symbol}: {fut_date}")
+    else:
+        fut_date = ''
+        logger.debug(f"No front month date required for {symbol}, secType: {params.sec_type}")
+
+    with latency.span('qualify_underlying', symbol):
+        und_contract = await qualify_contract_async(
+            symbol=symbol,
+            lastTradeDateOrContractMonth=fut_date,
+            secType=params.sec_type,
+            exchange=params.exchange,
+            currency='USD'
+        )
+    if und_contract is None:
+        logger.error(f"Unable to qualify underlying for {symbol}, aborting trade")
+        return None
+    logger.debug(f"Qualified underlying contract: {und_contract}")
+
+    logger.debug(f"short expiry days are set to: {params.short_put_expiry_days} {params.short_call_expiry_days} ")
+    logger.debug(f"long expiry days are set to: {params.long_put_expiry_days} {params.long_call_expiry_days} ")
+    target_expiries = [expiry_target_date(params.expiry_days(leg), params.sec_type)
+                       for leg in ("short_put", "short_call", "long_put", "long_call")]
+
+    current_mid, expiries = await asyncio.gather(
+        latency.timed('mid_price', symbol, get_current_mid_price_async(und_contract)),
+        latency.timed('expiries', symbol,
+                      find_next_closest_expiries_async(und_contract, target_expiries, trading_class=trading_class))
+    )
+    logger.info(f"Current market price for {symbol}: {current_mid}")
+    if not all(expiries):
+        logger.error(f"Unable to resolve all expiries for {symbol}, aborting trade")
+        return None
+    return und_contract, current_mid, expiries
+
+
+async def get_option_contracts_async(und_contract, exchange: str, expiry: str, trading_class: str = '', right: str = ''):
+    """Return every option contract listed for one expiry, sorted by strike."""
+    template = Contract(secType=option_sec_type(und_contract), symbol=und_contract.symbol,
+                        lastTradeDateOrContractMonth=expiry, right=right, exchange=exchange,
+                        tradingClass=trading_class, currency='USD')
+    async def contract_details():
+        md = pool.market_data()
+        async with pool.pacer_for(md).slot():
+            return await md.reqContractDetailsAsync(template)
+
+    details = await request_cache.get(('listing', und_contract.conId, exchange, expiry, trading_class, right),
+                                      contract_details)
+    contracts = {}
+    for d in details:
+        contracts.setdefault((d.contract.strike, d.contract.right), d.contract)
+    return sorted(contracts.values(), key=lambda c: (c.strike, c.right))
+
+
+def apply_greeks_source(snapshot, expiry: str, current_mid: float):
+    """Fill or replace the greeks of a quoted expiry locally according to cfg.greeks_source."""
+    if cfg.greeks_source != 'ib':
+        snapshot.fill_local_greeks(expiry, current_mid, cfg.risk_free_rate, overwrite=cfg.greeks_source == 'local')
+
+
+async def fetch_chain_snapshot_async(und_contract, exchange: str, quoted_expiries: list, listed_expiries: list,
+                                     current_mid: float, trading_class: str = ''):
+    """
+    Build a ChainSnapshot for the underlying in one concurrent pass.
+
+    The listed contracts of every expiry are requested together; snapshot tickers are
+    then requested for the quoted_expiries, limited to strikes within
+    cfg.chain_strike_range_pct of current_mid. listed_expiries only get their
+    contracts, which is all that nearest-strike matching needs. Greeks come from IB
+    or the local pricing engine according to cfg.greeks_source. Listings are shared
+    for the run and quotes for cfg.shared_quote_max_age seconds with other entries
+    on the same underlying.
+    """
+    snapshot = ChainSnapshot(und_contract)
+    expiries = list(dict.fromkeys(list(quoted_expiries) + list(listed_expiries)))
+    listings = await asyncio.gather(*(get_option_contracts_async(und_contract, exchange, expiry, trading_class)
+                                      for expiry in expiries))
+    for expiry, contracts in zip(expiries, listings):
+        snapshot.add_contracts(expiry, contracts)
+
+    low = current_mid * (1 - cfg.chain_strike_range_pct)
+    high = current_mid * (1 + cfg.chain_strike_range_pct)
+
+    async def quote(expiry):
+        contracts = [c for c in listings[expiries.index(expiry)] if low <= c.strike <= high]
+
+        async def tickers():
+            logger.debug(f"Requesting {len(contracts)} option tickers for {und_contract.symbol} {expiry}")
+            if cfg.greeks_source == 'local':
+                return await stream_quotes_async(contracts, cfg.chain_quote_timeout)
+            md = pool.market_data()
+            async with pool.pacer_for(md).slot(cost=len(contracts)):
+                return await md.reqTickersAsync(*contracts)
+
+        key = ('quotes', und_contract.conId, exchange, expiry, trading_class, low, high)
+        snapshot.add_tickers(expiry, await request_cache.get(key, tickers, cfg.shared_quote_max_age))
+        apply_greeks_source(snapshot, expiry, current_mid)
+
+    await asyncio.gather(*(quote(expiry) for expiry in dict.fromkeys(quoted_expiries)))
+    return snapshot
+
+
+async def _next_emit(event):
+    return await event
+
+
+async def stream_quotes_async(contracts: list, timeout: float) -> list:
+    """
+    Stream quotes for the contracts and return their tickers as soon as each has a
+    two-sided quote, or when timeout passes. Subscriptions are taken in chunks of
+    cfg.max_market_data_lines and cancelled before returning.
+    """
+    tickers = []
+    loop = asyncio.get_running_loop()
+    for i in range(0, len(contracts), cfg.max_market_data_lines):
+        chunk = contracts[i:i + cfg.max_market_data_lines]
+        md = pool.market_data()
+        async with pool.pacer_for(md).slot(cost=len(chunk)):
+            chunk_tickers = [md.reqMktData(c, '', False, False) for c in chunk]
+        deadline = loop.time() + timeout
+        try:
+            while not all(valid_price(t.bid) and valid_price(t.ask) for t in chunk_tickers):
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    logger.warning(f"Timed out waiting for quotes on {len(chunk)} contracts")
+                    break
+                try:
+                    await asyncio.wait_for(_next_emit(md.pendingTickersEvent), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # Cancel before anything can be awaited, so a cancelled or timed-out task still frees the lines
+            for c in chunk:
+                md.cancelMktData(c)
+            pool.pacer_for(md).charge(len(chunk))
+        tickers.extend(chunk_tickers)
+    return tickers
+
+
+async def get_bag_prices_async(bag_contract):
+    """Return (bid, mid, ask) for a combo contract."""
+    md = pool.market_data()
+    async with pool.pacer_for(md).slot():
+        [ticker] = await md.reqTickersAsync(bag_contract)
+    bid, ask = ticker.bid, ticker.ask
+    return bid, (bid + ask) / 2, ask
+
+
+async def adj_price_for_order_async(trade, max_adjustments: int, interval: float):
+    """
+    Walk a working BUY limit order one tick at a time towards the combo ask until it fills,
+    the ask is reached or max_adjustments is used up.
+    """
+    symbol = trade.contract.symbol
+    for _ in range(max_adjustments):
+        if await wait_for_fill_async(trade, interval) or trade.isDone():
+            break
+        if not pool.orders.isConnected():
+            logger.warning(f"Order connection down, holding order {trade.order.orderId} for {symbol}")
+            continue
+        try:
+            bid, mid, ask = await get_bag_prices_async(trade.contract)
+        except ConnectionError as e:
+            logger.warning(f"No combo quote for {symbol} while reconnecting: {e}")
+            continue
+        if not valid_price(ask):
+            continue
+        tick = get_tick_size(symbol, trade.order.lmtPrice)
+        new_price = adjust_to_tick_size(min(trade.order.lmtPrice + tick, ask), tick)
+        if new_price <= trade.order.lmtPrice:
+            logger.info(f"Order {trade.order.orderId} for {symbol} is at the ask, no further adjustment")
+            break
+        logger.info(f"Adjusting order {trade.order.orderId} for {symbol} from {trade.order.lmtPrice} to {new_price}")
+        trade.order.lmtPrice = new_price
+        pool.orders.placeOrder(trade.contract, trade.order)
+    return trade
+
+
+async def adj_price_on_quotes_async(trade, stream, max_steps: int, step_interval: float):
+    """
+    Keep a working BUY limit order priced off a streaming combo quote.
+
+    The order is repriced whenever the combo quote changes, to the mid plus one tick for
+    every step_interval spent unfilled, capped at the ask. The limit only ever moves up,
+    so a falling mid does not pull it back. Modifications are spaced at least
+    cfg.order_modify_min_interval apart. Gives up after max_steps * step_interval seconds,
+    however many modifications that took.
+    """
+    loop = asyncio.get_running_loop()
+    symbol = trade.contract.symbol
+    deadline = loop.time() + max_steps * step_interval
+    last_step = loop.time()
+    steps = 0
+    done = trade_done_future(trade)
+    try:
+        while not done.done() and loop.time() < deadline:
+            change = asyncio.ensure_future(stream.wait_for_change(step_interval - (loop.time() - last_step)))
+            await asyncio.wait({change, done}, return_when=asyncio.FIRST_COMPLETED)
+            if done.done():
+                change.cancel()
+                break
+            if loop.time() - last_step >= step_interval:
+                steps += 1
+                last_step = loop.time()
+            bid, mid, ask = stream.quote
+            if not stream.ready or not valid_price(mid):
+                continue
+            tick = get_tick_size(symbol, mid)
+            new_price = adjust_to_tick_size(min(mid + steps * tick, ask), tick)
+            if new_price <= trade.order.lmtPrice:
+                continue
+            if not pool.orders.isConnected():
+                logger.warning(f"Order connection down, holding order {trade.order.orderId} for {symbol}")
+                continue
+            logger.info(f"Repricing order {trade.order.orderId} for {symbol} from {trade.order.lmtPrice} to {new_price} "
+                        f"(combo {bid}/{mid}/{ask})")
+            trade.order.lmtPrice = new_price
+            pool.orders.placeOrder(trade.contract, trade.order)
+            await asyncio.wait({done}, timeout=cfg.order_modify_min_interval)
+    finally:
+        if not done.done():
+            done.cancel()
+    return trade
+
+
+def trade_done_future(trade) -> asyncio.Future:
+    """
+    Return a future that resolves from the trade's statusEvent as soon as the order
+    reaches a final state, with True if it was filled. Cancelling the future
+    disconnects it from the trade.
+    """
+    future = asyncio.get_running_loop().create_future()
+
+    def on_status(t):
+        if t.isDone() and not future.done():
+            future.set_result(t.orderStatus.status == 'Filled')
+
+    if trade.isDone():
+        on_status(trade)
+    else:
+        trade.statusEvent += on_status
+        future.add_done_callback(lambda _: trade.statusEvent.disconnect(on_status))
+    return future
+
+
+async def wait_for_fill_async(trade, timeout: float) -> bool:
+    """Wait up to timeout seconds for the trade to finish; return True if it was filled."""
+    done = trade_done_future(trade)
+    try:
+        return await asyncio.wait_for(done, timeout)
+    except asyncio.TimeoutError:
+        return False
@@ -0,0 +1,453 @@
+"""
+Historical backtest of the double calendar schedules.
+
+    python backtest.py --start 2022-01-01                     # every schedule, up to today
+    python backtest.py --start 2023-01-01 --end 2023-12-31 -s Friday57 -s Monday24 -w 8
+
+Historical option chain snapshots are read from cfg.backtest_data_dir, one file per
+symbol and trading day, <dir>/<SYMBOL>/<YYYYMMDD>.parquet or .csv, with one row per
+option quote:
+
+    time        HH:MM:SS snapshot time, in the local time of the schedule entry times
+    expiry      YYYYMMDD
+    right       C or P
+    strike, bid, ask
+    underlying  underlying price at the snapshot
+    delta       optional; computed from the quotes with greeks.py where missing
+
+Every schedule is entered on its weekday at its entry time on NYSE trading days,
+skipping Fridays before a Monday holiday, with the live selection logic: expiries
+from the expiry-days targets (tradecal), short strikes by target delta and long
+strikes nearest to them (chain_snapshot). The combo is bought at the first snapshot
+at or after the entry time, paying cfg.backtest_slippage of the half-spread beyond
+the mid, and sold at close_time on the short put expiry day (the last snapshot of
+that day without submit_auto_close), or earlier at the profit target when one is
+set. Entries run in a process pool, in chunks of one symbol and month, so each
+worker reads a day's snapshots once for every schedule and holding period that
+needs it. Trades are written to cfg.backtest_output_path and summarized per schedule.
+"""
+import argparse
+import csv
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from functools import lru_cache, reduce
+from itertools import groupby
+
+import numpy as np
+import pandas as pd
+
+import cfg
+from chain_snapshot import ChainSnapshot, nearest_strike, strike_by_target_delta
+from greeks import EXPIRY_TZ, greeks_from_quotes
+from strategies import ConfigError, load_schedules, require_entry_times
+from tradecal import (calendar, calendar_for_sec_type, expiry_target_date, is_friday_before_monday_holiday,
+                      next_closest_expiry)
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                    handlers=[logging.StreamHandler()])
+logger = logging.getLogger('DC')
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+COLUMNS = ('time', 'expiry', 'right', 'strike', 'bid', 'ask', 'underlying')
+
+# Expiries are held as YYYYMMDD integers, which compare far faster than strings
+DAY_DTYPE = np.dtype([('time', 'i4'), ('expiry', 'i4'), ('right', 'U1'), ('strike', 'f8'),
+                      ('bid', 'f8'), ('ask', 'f8'), ('underlying', 'f8'), ('delta', 'f8')])
+
+LEGS = ('short_put', 'short_call', 'long_put', 'long_call')
+
+TRADE_FIELDS = ('schedule', 'symbol', 'entry_date', 'entry_time', 'status', 'underlying',
+                'short_put_expiry', 'short_call_expiry', 'long_put_expiry', 'long_call_expiry',
+                'short_put_strike', 'short_call_strike', 'long_put_strike', 'long_call_strike',
+                'entry_price', 'exit_date', 'exit_time', 'exit_price', 'pnl')
+
+# Statuses of an entry that traded, and of one that did not with the reason why
+TRADED = ('closed', 'profit_target')
+UNTRADED = ('no_data', 'no_snapshot', 'no_expiry', 'no_delta', 'no_long_strike', 'no_quote', 'no_exit')
+
+
+def data_dir() -> str:
+    path = cfg.backtest_data_dir
+    return path if os.path.isabs(path) else os.path.join(HERE, path)
+
+
+def _seconds(hms: str) -> int:
+    h, m, s = map(int, hms.split(':'))
+    return h * 3600 + m * 60 + s
+
+
+def _hms(seconds: int) -> str:
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def _seconds_of_day(column: pd.Series) -> np.ndarray:
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return (column.dt.hour * 3600 + column.dt.minute * 60 + column.dt.second).to_numpy('i4')
+    # A day holds few distinct snapshot times: parse each once
+    codes, times = pd.factorize(column.astype(str))
+    return np.array([_seconds(t) for t in times], dtype='i4')[codes]
+
+
+def day_files(symbol: str, first: date, last: date) -> list:
+    """Return the (YYYYMMDD, path) snapshot files of a symbol between first and last."""
+    directory = os.path.join(data_dir(), symbol)
+    first, last = first.strftime("%Y%m%d"), last.strftime("%Y%m%d")
+    files = {}
+    # Parquet first, as load_day prefers it
+    names = sorted(os.listdir(directory), key=lambda name: name.endswith('.csv')) if os.path.isdir(directory) else []
+    for name in names:
+        day, ext = os.path.splitext(name)
+        if ext in ('.parquet', '.csv') and first <= day <= last:
+            files.setdefault(day, os.path.join(directory, name))
+    return sorted(files.items())
+
+
+class SnapshotStore:
+    """
+    The snapshots of many days in one memory-mapped file, so worker processes share
+    them read-only through the page cache instead of each parsing (or being sent) the
+    day files. Built once with `build`; opening it only maps the file.
+    """
+
+    index_dtype = np.dtype([('symbol', 'U16'), ('day', 'U8'), ('start', 'i8'), ('stop', 'i8')])
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows = np.memmap(path + '.bin', dtype=DAY_DTYPE, mode='r')
+        self._index = {(str(entry['symbol']), str(entry['day'])): (int(entry['start']), int(entry['stop']))
+                       for entry in np.load(path + '.index.npy')}
+
+    @classmethod
+    def build(cls, path: str, files: list):
+        """Write the (symbol, day, file) snapshots to path.bin, one day after another, and open the store."""
+        index = np.empty(len(files), dtype=cls.index_dtype)
+        count = 0
+        with open(path + '.bin.tmp', 'wb') as f:
+            for i, (symbol, day, file) in enumerate(files):
+                rows = read_day(file)
+                rows.tofile(f)
+                index[i] = (symbol, day, count, count + len(rows))
+                count += len(rows)
+        np.save(path + '.index.npy', index)
+        os.replace(path + '.bin.tmp', path + '.bin')
+        logger.info(f"Snapshot store {path}: {len(files)} days, {count} rows")
+        return cls(path)
+
+    def day(self, symbol: str, day: str):
+        span = self._index.get((symbol, day))
+        return None if span is None else self.rows[span[0]:span[1]]
+
+
+_store = None
+
+
+def use_store(store: SnapshotStore):
+    """Serve load_day from a snapshot store instead of the day files."""
+    global _store
+    _store = store
+    load_day.cache_clear()
+
+
+@lru_cache(maxsize=cfg.backtest_day_cache)
+def load_day(symbol: str, day: str):
+    """Return one symbol's snapshots of a day (YYYYMMDD) as a DAY_DTYPE array sorted by time, or None."""
+    if _store is not None:
+        return _store.day(symbol, day)
+    base = os.path.join(data_dir(), symbol, day)
+    for ext in ('.parquet', '.csv'):
+        if os.path.exists(base + ext):
+            break
+    else:
+        return None
+    return read_day(base + ext)
+
+
+def read_day(path: str) -> np.ndarray:
+    """Parse one snapshot file into a DAY_DTYPE array sorted by time."""
+    if path.endswith('.parquet'):
+        frame = pd.read_parquet(path)
+    else:
+        frame = pd.read_csv(path, dtype={'time': str, 'expiry': str, 'right': str})
+    missing = [column for column in COLUMNS if column not in frame.columns]
+    if missing:
+        raise ValueError(f"{path} has no {', '.join(missing)} column")
+    rows = np.empty(len(frame), dtype=DAY_DTYPE)
+    rows['time'] = _seconds_of_day(frame['time'])
+    rows['expiry'] = frame['expiry'].astype(str).str.replace('-', '').str[:8].astype(int).to_numpy()
+    rows['right'] = frame['right'].astype(str).str[0].str.upper().to_numpy()
+    for column in ('strike', 'bid', 'ask', 'underlying'):
+        rows[column] = frame[column].to_numpy(dtype=float)
+    rows['delta'] = frame['delta'].to_numpy(dtype=float) if 'delta' in frame.columns else np.nan
+    return rows[np.argsort(rows['time'], kind='stable')]
+
+
+def chain_array(snapshot: np.ndarray, expiry: str, when: datetime, sec_type: str) -> np.ndarray:
+    """
+    Return the quotes of one expiry as a ChainSnapshot array, with the missing deltas
+    computed locally as of `when`, as greeks_source 'auto' does live.
+    """
+    rows = snapshot[snapshot['expiry'] == int(expiry)]
+    chain = np.empty(len(rows), dtype=ChainSnapshot.dtype)
+    for column in ('strike', 'right', 'delta', 'bid', 'ask'):
+        chain[column] = rows[column]
+    chain['iv'] = np.nan
+    fill = np.isnan(chain['delta'])
+    if fill.any():
+        iv, delta = greeks_from_quotes(chain['bid'][fill], chain['ask'][fill], rows['underlying'][fill],
+                                       chain['strike'][fill], chain['right'][fill] == 'C', expiry, sec_type,
+                                       cfg.risk_free_rate, now=when)
+        chain['iv'][fill] = iv
+        chain['delta'][fill] = delta
+    return chain
+
+
+def select_strikes(snapshot: np.ndarray, params, day: date, when: datetime):
+    """
+    Select the expiries and strikes of a double calendar from one snapshot as
+    open_double_calendar does. Returns ({leg: expiry}, {leg: strike}) or a failure status.
+    """
+    listed = [str(expiry) for expiry in np.unique(snapshot['expiry'])]
+    expiries = {leg: next_closest_expiry(listed, expiry_target_date(params.expiry_days(leg), params.sec_type,
+                                                                      today=day))
+                for leg in LEGS}
+    if not all(expiries.values()):
+        return 'no_expiry'
+    strikes = {}
+    for right, target in (('C', params.target_call_delta), ('P', params.target_put_delta)):
+        leg = 'short_call' if right == 'C' else 'short_put'
+        strikes[leg] = strike_by_target_delta(chain_array(snapshot, expiries[leg], when, params.sec_type),
+                                              right, target)
+        if strikes[leg] is None:
+            return 'no_delta'
+        long_leg = 'long_call' if right == 'C' else 'long_put'
+        rows = snapshot[(snapshot['expiry'] == int(expiries[long_leg])) & (snapshot['right'] == right)]
+        if not len(rows):
+            return 'no_long_strike'
+        strikes[long_leg] = nearest_strike(list(np.unique(rows['strike'])), strikes[leg])
+    return expiries, strikes
+
+
+def combo_marks(rows: np.ndarray, legs: list) -> tuple:
+    """
+    Return (times, bid, ask) of the combo at every snapshot time of the day that quotes
+    all of its (expiry, right, strike, sign) legs with a valid market.
+    """
+    quotes = [(rows[(rows['expiry'] == int(expiry)) & (rows['right'] == right) & (rows['strike'] == strike)], sign)
+              for expiry, right, strike, sign in legs]
+    times = reduce(np.intersect1d, [quote['time'] for quote, _ in quotes])
+    bid, ask = np.zeros(len(times)), np.zeros(len(times))
+    valid = np.ones(len(times), dtype=bool)
+    for quote, sign in quotes:
+        i = np.searchsorted(quote['time'], times)
+        leg_bid, leg_ask = quote['bid'][i], quote['ask'][i]
+        valid &= (leg_bid >= 0) & (leg_ask > 0) & (leg_ask >= leg_bid)
+        if sign > 0:
+            bid, ask = bid + leg_bid, ask + leg_ask
+        else:
+            bid, ask = bid - leg_ask, ask - leg_bid
+    return times[valid], bid[valid], ask[valid]
+
+
+def simulate_entry(name: str, symbol: str, params, day: date, entry_seconds: int) -> dict:
+    """Enter one schedule's double calendar for a symbol on a day and follow it to its exit."""
+    record = {'schedule': name, 'symbol': symbol, 'entry_date': day.isoformat()}
+    rows = load_day(symbol, day.strftime("%Y%m%d"))
+    if rows is None:
+        return {**record, 'status': 'no_data'}
+    times = np.unique(rows['time'])
+    i = np.searchsorted(times, entry_seconds)
+    if i == len(times):
+        return {**record, 'status': 'no_snapshot'}
+    entry_time = int(times[i])
+    snapshot = rows[rows['time'] == entry_time]
+    when = datetime.combine(day, datetime.min.time(), EXPIRY_TZ) + timedelta(seconds=entry_time)
+    selected = select_strikes(snapshot, params, day, when)
+    if isinstance(selected, str):
+        return {**record, 'status': selected}
+    expiries, strikes = selected
+    record.update({f"{leg}_expiry": expiries[leg] for leg in LEGS})
+    record.update({f"{leg}_strike": float(strikes[leg]) for leg in LEGS})
+    record.update(entry_time=_hms(entry_time), underlying=float(snapshot['underlying'][0]))
+
+    # Leg actions as submitted: BUY the long legs, SELL the short legs
+    legs = [(expiries['long_call'], 'C', strikes['long_call'], 1), (expiries['short_call'], 'C', strikes['short_call'], -1),
+            (expiries['long_put'], 'P', strikes['long_put'], 1), (expiries['short_put'], 'P', strikes['short_put'], -1)]
+    marks, bid, ask = combo_marks(rows, legs)
+    j = np.searchsorted(marks, entry_time)
+    if j == len(marks) or marks[j] != entry_time:
+        return {**record, 'status': 'no_quote'}
+    mid = (bid[j] + ask[j]) / 2
+    entry_price = mid + cfg.backtest_slippage * (ask[j] - mid)
+    target = entry_price * (1 + params.profit_target_pct / 100) if params.profit_target_pct > 0 else None
+    record['entry_price'] = round(float(entry_price), 4)
+
+    # Held until close_time on the short put expiry day, as the auto-close order is placed
+    exit_day = datetime.strptime(expiries['short_put'], "%Y%m%d").date()
+    exit_seconds = _seconds(params.close_time) if params.submit_auto_close else 24 * 3600
+    trading_calendar = calendar_for_sec_type(params.sec_type)
+    d = day
+    while d <= exit_day:
+        rows = load_day(symbol, d.strftime("%Y%m%d"))
+        if rows is not None:
+            marks, bid, ask = combo_marks(rows, legs)
+            mid = (bid + ask) / 2
+            held = marks > entry_time if d == day else np.ones(len(marks), dtype=bool)
+            if d == exit_day and len(marks):
+                # Closed at the first snapshot from close_time on, or the day's last one
+                k = min(np.searchsorted(marks, exit_seconds), len(marks) - 1)
+                held &= np.arange(len(marks)) <= k
+            if target is not None:
+                hits = np.flatnonzero(held & (mid >= target))
+                if len(hits):
+                    return {**record, 'status': 'profit_target', 'exit_date': d.isoformat(),
+                            'exit_time': _hms(int(marks[hits[0]])), 'exit_price': round(float(target), 4),
+                            'pnl': pnl(params, entry_price, target)}
+            if d == exit_day and held.any():
+                exit_price = mid[k] - cfg.backtest_slippage * (mid[k] - bid[k])
+                return {**record, 'status': 'closed', 'exit_date': d.isoformat(), 'exit_time': _hms(int(marks[k])),
+                        'exit_price': round(float(exit_price), 4), 'pnl': pnl(params, entry_price, exit_price)}
+        d = trading_calendar.next_trading_day(d)
+    return {**record, 'status': 'no_exit'}
+
+
+def pnl(params, entry_price: float, exit_price: float) -> float:
+    commission = cfg.backtest_commission * 4 * 2 * params.quantity
+    return round(float((exit_price - entry_price) * float(params.mult) * params.quantity - commission), 2)
+
+
+def entries_for(schedules, start: date, end: date, symbols: list = None) -> list:
+    """
+    Return (name, symbol, params, day, entry seconds) for every entry the schedules
+    would have made between start and end.
+    """
+
+    nyse = calendar('NYSE')
+    entries = []
+    for schedule in schedules:
+        entry_seconds = _seconds(schedule.entry_time)
+        d = start + timedelta(days=(schedule.weekday - start.weekday()) % 7)
+        while d <= end:
+            if nyse.is_trading_day(d) and not is_friday_before_monday_holiday(d):
+                entries.extend((schedule.name, symbol, schedule.params[symbol], d, entry_seconds)
+                               for symbol in schedule.symbols if symbols is None or symbol in symbols)
+            d += timedelta(days=7)
+    return entries
+
+
+def cover_calendar(start: date) -> int:
+    """Widen the trading calendar window back to the start year; returns the years back."""
+    cfg.trading_calendar_years_back = max(cfg.trading_calendar_years_back, date.today().year - start.year + 1)
+    return cfg.trading_calendar_years_back
+
+
+def _init_worker(years_back: int, backtest_data_dir: str):
+    cfg.trading_calendar_years_back = years_back
+    cfg.backtest_data_dir = backtest_data_dir
+
+
+def run_chunk(entries: list) -> list:
+    return [simulate_entry(*entry) for entry in entries]
+
+
+def run_backtest(entries: list, workers: int = None) -> list:
+    """Simulate the entries in a process pool, chunked per symbol and month; returns trade records."""
+    workers = workers or cfg.backtest_workers or os.cpu_count()
+    entries = sorted(entries, key=lambda entry: (entry[1], entry[3]))
+    chunks = [list(chunk) for _, chunk in groupby(entries, key=lambda entry: (entry[1], entry[3].year, entry[3].month))]
+    if workers == 1:
+        results = map(run_chunk, chunks)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                       initargs=(cfg.trading_calendar_years_back, cfg.backtest_data_dir))
+        with executor:
+            results = list(executor.map(run_chunk, chunks))
+    records = [record for chunk in results for record in chunk]
+    return sorted(records, key=lambda record: (record['entry_date'], record['schedule'], record['symbol']))
+
+
+def summarize(records: list) -> list:
+    """
+    Per schedule: entries, trades, profit targets hit, win rate, total and mean P&L, max drawdown,
+    and the count of entries ending in each UNTRADED status.
+    """
+    summary = []
+    for name in dict.fromkeys(record['schedule'] for record in records):
+        own = [record for record in records if record['schedule'] == name]
+        pnls = np.array([record['pnl'] for record in own if record['status'] in TRADED], dtype=float)
+        equity = np.cumsum(pnls)
+        summary.append({'schedule': name, 'entries': len(own), 'trades': len(pnls),
+                         'profit_targets': sum(1 for record in own if record['status'] == 'profit_target'),
+                         'win_rate': float((pnls > 0).mean()) if len(pnls) else 0.0,
+                         'total_pnl': float(pnls.sum()), 'mean_pnl': float(pnls.mean()) if len(pnls) else 0.0,
+                         'max_drawdown': float((np.maximum.accumulate(np.maximum(equity, 0)) - equity).max())
+                         if len(pnls) else 0.0,
+                         **{status: sum(1 for record in own if record['status'] == status) for status in UNTRADED}})
+    return summary
+
+
+def print_summary(summary: list):
+    print(f"\n{'schedule':12} {'entries':>7} {'trades':>6} {'pt hit':>6} {'win %':>6} {'total P&L':>11} "
+          f"{'mean P&L':>9} {'max DD':>10}")
+    for row in summary:
+        print(f"{row['schedule']:12} {row['entries']:7d} {row['trades']:6d} {row['profit_targets']:6d} "
+              f"{row['win_rate']:6.1%} {row['total_pnl']:11.2f} {row['mean_pnl']:9.2f} {row['max_drawdown']:10.2f}")
+    skipped = {status: sum(row[status] for row in summary) for status in UNTRADED}
+    if any(skipped.values()):
+        print("Not traded: " + ", ".join(f"{status} {count}" for status, count in skipped.items() if count))
+
+
+def write_trades(records: list, path: str):
+    path = path if os.path.isabs(path) else os.path.join(HERE, path)
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=TRADE_FIELDS)
+        writer.writeheader()
+        writer.writerows(records)
+    logger.info(f"{len(records)} entries written to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest the double calendar schedules on historical chain snapshots.")
+    parser.add_argument('--start', type=date.fromisoformat, required=True, help="First entry date, YYYY-MM-DD.")
+    parser.add_argument('--end', type=date.fromisoformat, default=date.today(), help="Last entry date, YYYY-MM-DD.")
+    parser.add_argument('-s', '--schedule', action='append', help="Schedule to test (repeatable); default all.")
+    parser.add_argument('--symbol', type=str, help="Test this symbol only.")
+    parser.add_argument('-w', '--workers', type=int, default=cfg.backtest_workers,
+                        help="Worker processes; 0 uses every CPU, 1 runs in-process.")
+    parser.add_argument('--data', type=str, default=cfg.backtest_data_dir, help="Snapshot directory.")
+    parser.add_argument('--config', type=str, help="Strategy configuration file (TOML/YAML) instead of cfg.")
+    parser.add_argument('-o', '--output', type=str, default=cfg.backtest_output_path, help="Trades CSV.")
+    args = parser.parse_args()
+
+    cfg.backtest_data_dir = args.data
+    schedules = load_schedules(args.config)
+    names = args.schedule or list(schedules)
+    unknown = [name for name in names if name not in schedules]
+    if unknown:
+        parser.error(f"unknown schedule {', '.join(unknown)}; one of {', '.join(schedules)}")
+    try:
+        require_entry_times(schedules, names)
+    except ConfigError as e:
+        parser.error(str(e))
+
+    cover_calendar(args.start)
+    # Build the calendars once here rather than in every worker
+    calendar('NYSE')
+    calendar('CME')
+    symbols = [args.symbol.strip().upper()] if args.symbol else None
+    entries = entries_for([schedules[name] for name in names], args.start, args.end, symbols)
+    logger.info(f"Backtesting {len(entries)} entries of {', '.join(names)} from {args.start} to {args.end}")
+
+    started = time.perf_counter()
+    records = run_backtest(entries, args.workers)
+    logger.info(f"Backtest finished in {time.perf_counter() - started:.1f}s")
+    write_trades(records, args.output)
+    print_summary(summarize(records))
+
+
+if __name__ == "__main__":
+    main()
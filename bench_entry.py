@@ -0,0 +1,154 @@
+"""
+Entry throughput benchmark against the simulated gateway (simgw.py).
+
+    python bench_entry.py                              # every schedule at 1, 5 and 50 symbols
+    python bench_entry.py -s Friday57 -n 5 -n 50 -c 10
+    python bench_entry.py --latency 0.05 --compare-only
+
+Each case runs main.run_symbols_async for one strategy schedule with N symbols (the
+schedule's symbols, then clones of them as ES1, SPX1, ... to reach N) and measures
+total wall time, per-stage latency, gateway requests by type and peak traced
+memory above what was already allocated (the order summaries printed to stdout
+are discarded). Results are appended to bench_entry.jsonl together with the git
+revision and compared against the last recorded run of the same case from
+another revision.
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime
+
+import cfg
+from strategies import load_schedules
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SCHEDULES = load_schedules()
+
+logging.basicConfig(level=logging.WARNING,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                    handlers=[logging.StreamHandler()])
+
+
+def git_revision() -> str:
+    result = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=HERE, capture_output=True, text=True)
+    return result.stdout.strip() or 'unknown'
+
+
+def bench_symbols(params: dict, n: int) -> tuple:
+    """Return ({symbol: params}, {symbol: spot}) for n symbols, cloning the schedule's symbols as needed."""
+    base = list(params)
+    symbols, spots = {}, {}
+    for i in range(n):
+        symbol = base[i % len(base)]
+        name = symbol if i < len(base) else f"{symbol}{i // len(base)}"
+        symbols[name] = params[symbol]
+        spots[name] = cfg.sim_spot_prices.get(symbol, 100.0)
+    return symbols, spots
+
+
+def run_case(sim, schedule: str, n: int, concurrency: int) -> dict:
+    from main import run_symbols_async
+    from instrument import latency
+    from simgw import instruments_for
+
+    params, spots = bench_symbols(SCHEDULES[schedule].params, n)
+    sim.reset(instruments_for(params, spots))
+    latency.spans = []
+
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        results = sim.run(run_symbols_async(list(params), params, True, concurrency))
+    wall = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+
+    stages = {}
+    for stage, ordered in latency._by_stage().items():
+        stages[stage] = {'p50_ms': round(ordered[len(ordered) // 2] * 1000, 2),
+                         'max_ms': round(ordered[-1] * 1000, 2),
+                         'total_ms': round(sum(ordered) * 1000, 2)}
+    latency.spans = []
+    return {'schedule': schedule, 'symbols': n, 'concurrency': concurrency, 'sim_latency': cfg.sim_latency,
+            'wall_s': round(wall, 3), 'submitted': sum(1 for trade in results.values() if trade),
+            'requests': sum(sim.requests.values()), 'requests_by_type': dict(sim.requests),
+            'peak_mem_mb': round(peak / 2 ** 20, 2), 'stages': stages}
+
+
+def case_key(record: dict) -> tuple:
+    return record['schedule'], record['symbols'], record['concurrency'], record['sim_latency']
+
+
+def load_results(path: str) -> list:
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def print_results(records: list, history: list):
+    """Print the cases with the change in wall time against the last run from another revision."""
+    print(f"{'schedule':12} {'n':>3} {'conc':>4} {'wall s':>8} {'vs prev':>8} {'submitted':>9} "
+          f"{'requests':>8} {'peak MB':>8}  slowest stage")
+    for record in records:
+        previous = [r for r in history if case_key(r) == case_key(record) and r['rev'] != record['rev']]
+        change = ''
+        if previous and previous[-1]['wall_s']:
+            change = f"{(record['wall_s'] / previous[-1]['wall_s'] - 1) * 100:+.0f}%"
+        stages = {k: v for k, v in record['stages'].items() if k not in ('time_to_submit', 'fill')}
+        slowest = max(stages.items(), key=lambda kv: kv[1]['total_ms'], default=('', {'total_ms': 0}))
+        print(f"{record['schedule']:12} {record['symbols']:3d} {record['concurrency']:4d} {record['wall_s']:8.2f} "
+              f"{change:>8} {record['submitted']:9d} {record['requests']:8d} {record['peak_mem_mb']:8.1f}  "
+              f"{slowest[0]} {slowest[1]['total_ms']:.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark entry throughput against the simulated gateway.")
+    parser.add_argument('-s', '--schedule', action='append', choices=list(SCHEDULES),
+                        help="Schedule to run (repeatable, default all).")
+    parser.add_argument('-n', '--symbols', action='append', type=int, help="Symbol count (repeatable, default 1 5 50).")
+    parser.add_argument('-c', '--concurrency', type=int, default=cfg.max_concurrent_symbols)
+    parser.add_argument('--latency', type=float, default=cfg.sim_latency, help="Injected latency per request, seconds.")
+    parser.add_argument('-o', '--output', default=os.path.join(HERE, 'bench_entry.jsonl'))
+    parser.add_argument('--compare-only', action='store_true', help="Print the last recorded run without running.")
+    args = parser.parse_args()
+
+    history = load_results(args.output)
+    if args.compare_only:
+        latest_rev = history[-1]['rev'] if history else None
+        print_results([r for r in history if r['rev'] == latest_rev], history)
+        return
+
+    cfg.sim_latency = args.latency
+    cfg.sim_fill_edge = 0  # fill at the mid so the fill wait does not dominate the entry timings
+    cfg.log_trade_fills = False
+    from simgw import install
+    sim = install()
+    from ibstrat.ib_instance import connect_to_ib
+    from ib_async import util
+    connect_to_ib(cfg.ib_host, cfg.ib_port, cfg.ib_clientid, 2)
+    util.patchAsyncio()
+
+    rev, ts = git_revision(), datetime.now().isoformat(timespec='seconds')
+    records = []
+    tracemalloc.start()
+    for schedule in args.schedule or list(SCHEDULES):
+        for n in args.symbols or [1, 5, 50]:
+            record = {'ts': ts, 'rev': rev, **run_case(sim, schedule, n, args.concurrency)}
+            records.append(record)
+            with open(args.output, 'a') as f:
+                f.write(json.dumps(record) + "\n")
+            print(f"{schedule} x {n}: {record['wall_s']:.2f}s, {record['requests']} requests")
+    tracemalloc.stop()
+    print()
+    print_results(records, history)
+
+
+if __name__ == "__main__":
+    main()
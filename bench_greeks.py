@@ -0,0 +1,126 @@
+"""
+Accuracy and speed benchmark for the local greeks engine (greeks.py).
+
+    python bench_greeks.py                       # offline, synthetic chains
+    python bench_greeks.py -s ES -t              # against IB model greeks on the test TWS
+    python bench_greeks.py -s SPX -p Monday24
+
+The live mode fetches the short-expiry chain snapshot with IB model greeks, recomputes
+implied vol and delta locally from the same quotes and reports the differences,
+including whether both sources select the same short strikes.
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+
+import cfg
+import greeks
+from strategies import StrategyParams, load_schedules
+from chain_snapshot import strike_by_target_delta
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                    handlers=[logging.StreamHandler()])
+logger = logging.getLogger('DC')
+
+
+def bench_synthetic(rounds: int = 20):
+    """Price synthetic chains with a vol smile, then time and check the implied vol round-trip."""
+    rng = np.random.default_rng(7)
+    for sec_type, und in (('FUT', 6000.0), ('IND', 6000.0), ('STK', 500.0)):
+        model = greeks.model_for_sec_type(sec_type)
+        for n_strikes in (50, 500, 5000):
+            strikes = np.linspace(und * 0.8, und * 1.2, n_strikes)
+            is_call = strikes >= und
+            t = rng.uniform(1, 30, n_strikes) / 365
+            sigma = 0.15 + 0.5 * np.square(np.log(strikes / und))
+            prices = greeks.price(und, strikes, t, cfg.risk_free_rate, sigma, is_call, model)
+
+            started = time.perf_counter()
+            for _ in range(rounds):
+                iv = greeks.implied_vol(prices, und, strikes, t, cfg.risk_free_rate, is_call, model)
+                delta = greeks.delta(und, strikes, t, cfg.risk_free_rate, iv, is_call, model)
+            elapsed = (time.perf_counter() - started) / rounds
+
+            # Options worth less than a cent carry no vol information, leave them out of the error stats
+            true_delta = greeks.delta(und, strikes, t, cfg.risk_free_rate, sigma, is_call, model)
+            priced = prices >= 0.01
+            print(f"{sec_type:4} {model:8} strikes={n_strikes:5d}  {elapsed * 1000:8.2f} ms/chain  "
+                  f"solved={(~np.isnan(iv[priced])).mean():6.1%}  "
+                  f"max|iv err|={np.nanmax(np.abs(iv - sigma)[priced]):.2e}  "
+                  f"max|delta err|={np.nanmax(np.abs(delta - true_delta)[priced]):.2e}")
+
+
+def bench_live(symbol: str, params: StrategyParams, use_test_tws: bool):
+    from ibstrat.ib_instance import connect_to_ib, ib
+    from ibstrat.trclass import get_trading_class_for_symbol
+    from tradecal import expiry_target_date
+    from aio import (qualify_contract_async, get_front_month_contract_date_async, get_current_mid_price_async,
+                     find_next_closest_expiries_async, fetch_chain_snapshot_async)
+
+    async def run():
+        fut_date = ''
+        if params.sec_type == 'FUT':
+            fut_date = await get_front_month_contract_date_async(symbol, params.exchange, params.mult,
+                                                                 expiry_target_date(params.long_call_expiry_days, 'FUT'))
+        und_contract = await qualify_contract_async(symbol=symbol, lastTradeDateOrContractMonth=fut_date,
+                                                    secType=params.sec_type, exchange=params.exchange,
+                                                    currency='USD')
+        current_mid = await get_current_mid_price_async(und_contract)
+        [expiry] = await find_next_closest_expiries_async(und_contract,
+                                                          [expiry_target_date(params.short_put_expiry_days,
+                                                                             params.sec_type)],
+                                                          trading_class=get_trading_class_for_symbol(symbol))
+        started = time.perf_counter()
+        chain = await fetch_chain_snapshot_async(und_contract, params.opt_exchange, [expiry], [], current_mid,
+                                                 trading_class=params.trading_class)
+        snapshot_secs = time.perf_counter() - started
+        return chain, expiry, current_mid, snapshot_secs
+
+    cfg.greeks_source = 'ib'
+    if use_test_tws:
+        connect_to_ib(cfg.test_ib_host, cfg.test_ib_port, cfg.test_ib_clientid, 2)
+    else:
+        connect_to_ib(cfg.ib_host, cfg.ib_port, cfg.ib_clientid, 2)
+    chain, expiry, current_mid, snapshot_secs = ib.run(run())
+
+    ib_chain = chain.array(expiry).copy()
+    started = time.perf_counter()
+    local_chain = chain.fill_local_greeks(expiry, current_mid, cfg.risk_free_rate, overwrite=True)
+    local_secs = time.perf_counter() - started
+
+    both = ~np.isnan(ib_chain['delta']) & ~np.isnan(local_chain['delta'])
+    delta_err = np.abs(ib_chain['delta'][both] - local_chain['delta'][both])
+    iv_err = np.abs(ib_chain['iv'][both] - local_chain['iv'][both])
+    print(f"{symbol} {expiry}: {len(ib_chain)} options, {both.sum()} with both IB and local greeks")
+    print(f"  chain snapshot with IB greeks: {snapshot_secs:.2f}s, local greeks: {local_secs * 1000:.2f} ms")
+    if both.any():
+        print(f"  |delta err| mean={delta_err.mean():.4f} p95={np.percentile(delta_err, 95):.4f} max={delta_err.max():.4f}")
+        print(f"  |iv err|    mean={iv_err.mean():.4f} p95={np.percentile(iv_err, 95):.4f} max={iv_err.max():.4f}")
+
+    for right, key in (('C', 'target_call_delta'), ('P', 'target_put_delta')):
+        ib_strike = strike_by_target_delta(ib_chain, right, getattr(params, key))
+        local_strike = strike_by_target_delta(local_chain, right, getattr(params, key))
+        print(f"  {right} target {getattr(params, key)}: IB strike {ib_strike}, local strike {local_strike}"
+              f"{'' if ib_strike == local_strike else '  <-- differs'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the local greeks engine.")
+    parser.add_argument('-s', '--symbol', type=str, help="Compare against IB greeks for this symbol (needs TWS).")
+    parser.add_argument('-p', '--params', type=str, default='Friday57',
+                        help="Schedule to take the symbol's settings from.")
+    parser.add_argument('-t', '--test', action='store_true', help="Use test TWS configuration.")
+    args = parser.parse_args()
+
+    if args.symbol:
+        symbol = args.symbol.strip().upper()
+        bench_live(symbol, load_schedules()[args.params].params[symbol], args.test)
+    else:
+        bench_synthetic()
+
+
+if __name__ == "__main__":
+    main()
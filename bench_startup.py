@@ -0,0 +1,75 @@
+"""
+Cold-start benchmark for main.py.
+
+    python bench_startup.py
+    python bench_startup.py -n 10 --top 25
+
+Reports the wall time of `main.py --help`, the wall time until every module needed
+before connecting to TWS is imported (connect-ready), and the per-module import
+times from `python -X importtime` for that connect-ready import set.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Everything main() imports before connect_to_ib() is called
+CONNECT_READY_IMPORTS = "import main, ib_async, ibstrat.ib_instance, ibpool, posindex, aio, dcal, warmup"
+
+
+def wall_times(args: list, runs: int) -> list:
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable] + args, cwd=HERE, capture_output=True, text=True)
+        times.append(time.perf_counter() - started)
+        if result.returncode != 0:
+            print(f"  {' '.join(args)} failed: {result.stderr.strip().splitlines()[-1]}")
+            break
+    return times
+
+
+def import_times(code: str) -> list:
+    """Return (cumulative_us, self_us, module) for top-level imports reported by -X importtime."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=HERE,
+                            capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):  # top-level import, not a nested one
+            rows.append((int(cumulative_us), int(self_us), name.strip()))
+    if result.returncode != 0:
+        print(f"  import failed: {result.stderr.strip().splitlines()[-1]}")
+    return sorted(rows, reverse=True)
+
+
+def report(label: str, times: list):
+    if times:
+        print(f"{label:32} min {min(times) * 1000:8.1f} ms   median {statistics.median(times) * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark main.py cold start.")
+    parser.add_argument('-n', '--runs', type=int, default=5, help="Runs per wall-time measurement.")
+    parser.add_argument('--top', type=int, default=15, help="Number of modules to list.")
+    args = parser.parse_args()
+
+    report("python -c pass", wall_times(['-c', 'pass'], args.runs))
+    report("main.py --help", wall_times(['main.py', '--help'], args.runs))
+    report("connect-ready imports", wall_times(['-c', CONNECT_READY_IMPORTS], args.runs))
+
+    rows = import_times(CONNECT_READY_IMPORTS)
+    print(f"\nTop-level imports for connect-ready ({sum(r[0] for r in rows) / 1000:.1f} ms total):")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative_us, self_us, name in rows[:args.top]:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
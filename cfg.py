@@ -10,20 +10,127 @@ adaptive_priority = 'Normal'
 adjust_sleep_interval = 3
 pushover_alerts = True
 
-#tradelog
+# Pushover alerts (notify.py): sent by a background worker, the alerts of one run as one summary
+pushover_token = ''  # Application token and user key; empty sends through ibstrat.pushover instead
+pushover_user = ''
+pushover_min_interval = 2  # Seconds between messages; alerts arriving meanwhile join the next one
+pushover_coalesce_window = 1  # Seconds an alert outside a run waits for others before sending
+pushover_timeout = 10
+
+# Async entry pipeline
+max_concurrent_symbols = 5  # Symbols worked on at the same time
+ib_max_msg_rate = 40  # IB allows 50 messages/sec per client, keep some headroom
+chain_strike_range_pct = 0.05  # Strikes fetched around the underlying mid, +/- pct
+order_fill_timeout = 500  # Seconds to wait for an entry fill before giving up on the auto close
+
+# Greeks used for delta strike selection: 'ib' uses IB model greeks from chain snapshots,
+# 'local' streams quotes and computes greeks with greeks.py as soon as they arrive,
+# 'auto' uses IB model greeks where present and fills the gaps locally
+greeks_source = 'auto'
+risk_free_rate = 0.04
+chain_quote_timeout = 5  # Seconds to wait for two-sided chain quotes in 'local' mode
+max_market_data_lines = 90  # Streaming subscriptions held at once
+
+# Combo pricing: stream the legs and reprice the working order on every quote change
+# instead of a single bag snapshot and fixed adjust_sleep_interval steps
+stream_combo_quotes = True
+combo_quote_timeout = 5  # Seconds to wait for all legs to have two-sided quotes
+order_modify_min_interval = 0.5  # Minimum seconds between modifications of one order
+
+# Several schedule configurations in one run share their gateway requests: listings for
+# the whole run, quotes while they are younger than this
+shared_quote_max_age = 2  # Seconds
+
+# Daemon mode (main.py --daemon): one IB session kept open all week, entries fired in-process
+# at the times in `schedules` below
+daemon_warmup_lead = 120  # Seconds before an entry that its warmup starts; 0 runs entries cold
+daemon_control_host = '127.0.0.1'
+daemon_control_port = 7090  # Local control socket: status, trigger NAME, skip NAME, unskip NAME, reload, stop
+
+# Strategy configuration (strategies.py): validated and compiled at load, check with main.py --check-config.
+# A TOML or YAML file with the layout of `schedules` below replaces it and can be reloaded by the daemon.
+strategy_config_path = ''  # e.g. 'strategies.toml'; '' uses `schedules`
+
+# Warmup (--warmup-until): streaming subscriptions held until the entry time
+warmup_candidate_strikes = 4  # Strikes held on each side of the warmup target-delta strikes
+
+# Entry latency metrics: per-stage histograms written after each run
+latency_metrics_path = 'latency.jsonl'  # Relative paths are resolved against this directory; '' disables
+latency_metrics_format = 'jsonl'  # 'jsonl' appends JSON lines, 'prometheus' writes a text-format file
+
+# Offline gateway simulator (main.py --sim, simgw.py)
+sim_latency = 0.02  # Mean injected latency per request, seconds
+sim_latency_jitter = 0.5  # Latency varies by up to +/- this fraction of sim_latency
+sim_tick_interval = 0.25  # Seconds between simulated quote updates
+sim_implied_vol = 0.15
+sim_spread_pct = 0.04  # Option bid/ask spread as a fraction of the model price
+sim_fill_edge = 0.25  # A limit order fills once it gives up this fraction of the half-spread
+sim_strike_range_pct = 0.2  # Strikes listed around the starting spot, +/- pct
+sim_expiry_horizon_days = 60
+sim_seed = 7
+sim_spot_prices = {'ES': 6000.0, 'SPX': 6000.0, 'NQ': 21000.0, 'NDX': 21000.0, 'RTY': 2200.0, 'RUT': 2200.0,
+                   'QQQ': 520.0, 'SPY': 600.0}
+
+# Historical backtest (backtest.py): option chain snapshots in <dir>/<SYMBOL>/<YYYYMMDD>.parquet or .csv
+backtest_data_dir = 'data'  # Relative paths are resolved against this directory
+backtest_output_path = 'backtest_trades.csv'
+backtest_slippage = 0.25  # Fraction of the combo half-spread paid beyond the mid on entry and on exit
+backtest_commission = 1.0  # Per contract and leg, on entry and on exit
+backtest_workers = 0  # Worker processes; 0 uses every CPU
+backtest_day_cache = 32  # Days of snapshots each worker keeps loaded
+
+# Parameter sweeps over the backtest (sweep.py)
+sweep_output_path = 'sweep_results.parquet'
+sweep_store_dir = 'cache'  # Memory-mapped snapshot stores shared by the sweep workers
+sweep_exit_margin_days = 7  # Days of snapshots kept beyond the last entry's longest short put expiry
+sweep_seed = 7  # Random sweeps draw their variants with this seed
+
+# Contract qualification cache
+qualification_cache_path = 'qualcache.sqlite3'  # Relative paths are resolved against this directory
+qualification_cache_max_age_days = 30  # Undated contracts (STK/IND) are re-qualified after this
+
+# Trading calendar: NYSE/CME trading days built from the holidays package and cached on disk
+trading_calendar_cache_dir = 'cache'  # Relative paths are resolved against this directory
+trading_calendar_years_back = 2
+trading_calendar_years_forward = 3
+trading_calendar_max_age_days = 30  # Rebuild to pick up newly announced closures
+
+#tradelog: entries are written to a local write-ahead log at once and a background worker
+# (tradewriter.py) hands them to the backend once filled. 'ibstrat' logs them to the sheet with
+# ibstrat log_trade_details, in its layout; 'sheets' appends tradewriter.SHEET_COLUMNS rows to
+# trade_log_sheet_range with the Sheets API, a different layout, so point it at a tab of its own.
 trade_fill_timeout = 120
 log_trade_fills = True
 trade_log_sheet_id = "1y9hYBzSA4g8n92VkEgQp_JKu_F-XyI02RmbGjXin0hU"
+trade_log_backend = 'ibstrat'  # 'ibstrat', 'sheets', or 'local' to append to trade_log_local_path
+trade_log_sheet_range = 'Trades!A1'  # 'sheets' only
+trade_log_credentials_path = 'service_account.json'  # 'sheets' only: service account with access to the sheet
+trade_log_local_path = 'trade_log.jsonl'
+trade_log_wal_path = 'tradelog.sqlite3'  # Relative paths are resolved against this directory
+trade_log_keep_days = 30  # Sent records are kept in the write-ahead log this long
+trade_log_queue_size = 100
+trade_log_batch_size = 20
+trade_log_flush_interval = 5  # Seconds to collect records into one batch
+trade_log_max_attempts = 5  # Backend attempts per flush before leaving records for the next one
 
 # IBKR Connection Parameters
 ib_host = '127.0.0.1'
 ib_port = 7496  # Default live trading port
 ib_clientid = 3  # Client ID for live trading
+ib_market_data_clientids = [13]  # Extra read-only connections for market data; [] shares the order connection
+
+# Connection watchdog: heartbeat, then reconnect with full-jitter exponential backoff
+ib_watchdog_interval = 10  # Seconds between heartbeats
+ib_watchdog_timeout = 5  # Seconds without a heartbeat reply before the connection is dropped and re-made
+ib_reconnect_base_delay = 1
+ib_reconnect_max_delay = 60
+ib_reconnect_max_attempts = 0  # 0 keeps retrying
 
 # Testing configuration
 test_ib_host = '127.0.0.1'
 test_ib_port = 7500  # Port for test TWS
 test_ib_clientid = 3  # Client ID for test TWS
+test_ib_market_data_clientids = [13]
 
 # Friday Double Calendar Parameters (primary)
 fri_57dc_params = {
@@ -565,3 +672,17 @@ wed_dc15_params = {
         "close_time": '17:00:00',  # 1PM Atlantic
     },
 }
+
+# Strategy schedules, compiled by strategies.py for every mode: the configuration flags select them by
+# name, daemon mode fires them on their weekday (0 = Monday) at their local entry time and the backtest
+# enters at it. entry_time is None until it is set to the time the live entry runs at (the crontab that
+# launches main.py); --daemon, backtest.py and sweep.py refuse a schedule without one. Expiry days and
+# close times come from the params.
+schedules = {
+    'Monday24': {'weekday': 0, 'entry_time': None, 'symbols': mon_dc24_symbols, 'params': mon_dc24_params},
+    'Monday37': {'weekday': 0, 'entry_time': None, 'symbols': mon_dc37_symbols, 'params': mon_dc37_params},
+    'Wednesday78': {'weekday': 2, 'entry_time': None, 'symbols': wed_dc78_symbols, 'params': wed_dc78_params},
+    'Wednesday15': {'weekday': 2, 'entry_time': None, 'symbols': wed_dc15_symbols, 'params': wed_dc15_params},
+    'Friday57': {'weekday': 4, 'entry_time': None, 'symbols': fri_57dc_symbols, 'params': fri_57dc_params},
+    'Friday67': {'weekday': 4, 'entry_time': None, 'symbols': fri_67dc_symbols, 'params': fri_67dc_params},
+}
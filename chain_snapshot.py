@@ -0,0 +1,142 @@
+import logging
+from bisect import bisect_left
+from math import nan
+
+import numpy as np
+
+from greeks import greeks_from_quotes
+
+logger = logging.getLogger('DC')
+
+
+class ChainSnapshot:
+    """
+    In-memory option chain for one underlying, kept per expiry.
+
+    Holds the listed contracts of every expiry added and, where they were requested,
+    their snapshot tickers (quotes and model greeks). Strikes are kept sorted per
+    expiry and right so nearest-strike lookups are a local bisect, and quoted tickers
+    are exposed as a NumPy structured array so delta selection is a vectorized argmin.
+    """
+
+    dtype = np.dtype([('strike', 'f8'), ('right', 'U1'), ('delta', 'f8'),
+                      ('bid', 'f8'), ('ask', 'f8'), ('iv', 'f8')])
+
+    def __init__(self, und_contract):
+        self.und_contract = und_contract
+        self._contracts = {}  # (expiry, right) -> {strike: contract}
+        self._strikes = {}  # (expiry, right) -> sorted strikes
+        self._tickers = {}  # (expiry, right) -> {strike: ticker}
+        self._arrays = {}  # expiry -> structured array of the quoted tickers
+        self._local_greeks = {}  # expiry -> (und_price, rate, overwrite) of the last local fill
+
+    def add_contracts(self, expiry: str, contracts):
+        for contract in contracts:
+            self._contracts.setdefault((expiry, contract.right), {})[contract.strike] = contract
+        for key, by_strike in self._contracts.items():
+            if key[0] == expiry:
+                self._strikes[key] = sorted(by_strike)
+
+    def add_tickers(self, expiry: str, tickers):
+        for ticker in tickers:
+            self._tickers.setdefault((expiry, ticker.contract.right), {})[ticker.contract.strike] = ticker
+        # The array is rebuilt with the new tickers on next use, and locally filled greeks are recomputed
+        self._arrays.pop(expiry, None)
+
+    def listings_copy(self):
+        """Return a snapshot sharing this one's listed contracts but holding no tickers."""
+        snapshot = ChainSnapshot(self.und_contract)
+        snapshot._contracts = self._contracts
+        snapshot._strikes = self._strikes
+        return snapshot
+
+    @property
+    def expiries(self) -> list:
+        return sorted({expiry for expiry, _ in self._contracts})
+
+    def strikes(self, expiry: str, right: str) -> list:
+        return self._strikes.get((expiry, right), [])
+
+    def contract(self, expiry: str, right: str, strike: float):
+        return self._contracts.get((expiry, right), {}).get(strike)
+
+    def ticker(self, expiry: str, right: str, strike: float):
+        return self._tickers.get((expiry, right), {}).get(strike)
+
+    def tickers(self, expiry: str, right: str = None) -> list:
+        """Return the tickers held for an expiry, ordered by right then strike."""
+        rights = [right] if right else ['C', 'P']
+        return [self._tickers[(expiry, r)][strike]
+                for r in rights if (expiry, r) in self._tickers
+                for strike in sorted(self._tickers[(expiry, r)])]
+
+    def nearest_strike(self, expiry: str, right: str, target_strike: float):
+        """Return the listed strike nearest to target_strike, preferring the lower on a tie."""
+        strikes = self.strikes(expiry, right)
+        if not strikes:
+            logger.error(f"No {right} strikes held for {self.und_contract.symbol} {expiry}")
+            return None
+        return nearest_strike(strikes, target_strike)
+
+    def array(self, expiry: str) -> np.ndarray:
+        """Return the quoted tickers of an expiry as a structured array (strike, right, delta, bid, ask, iv)."""
+        if expiry not in self._arrays:
+            rows = []
+            for ticker in self.tickers(expiry):
+                greeks = ticker.modelGreeks
+                rows.append((ticker.contract.strike, ticker.contract.right,
+                             greeks.delta if greeks and greeks.delta is not None else nan,
+                             ticker.bid, ticker.ask,
+                             greeks.impliedVol if greeks and greeks.impliedVol is not None else nan))
+            self._arrays[expiry] = np.array(rows, dtype=self.dtype)
+            if expiry in self._local_greeks:
+                self._fill_local_greeks(expiry, *self._local_greeks[expiry])
+        return self._arrays[expiry]
+
+    def fill_local_greeks(self, expiry: str, und_price: float, rate: float, overwrite: bool = False):
+        """
+        Compute implied vol and delta from the quotes of an expiry with the local pricing
+        engine. Only rows without IB model greeks are filled unless overwrite is set.
+        The fill is repeated when tickers added later rebuild the expiry's array.
+        """
+        self.array(expiry)
+        self._local_greeks[expiry] = (und_price, rate, overwrite)
+        return self._fill_local_greeks(expiry, und_price, rate, overwrite)
+
+    def _fill_local_greeks(self, expiry: str, und_price: float, rate: float, overwrite: bool):
+        chain = self._arrays[expiry]
+        if not len(chain):
+            return chain
+        iv, delta = greeks_from_quotes(chain['bid'], chain['ask'], und_price, chain['strike'],
+                                       chain['right'] == 'C', expiry, self.und_contract.secType, rate)
+        fill = np.ones(len(chain), dtype=bool) if overwrite else np.isnan(chain['delta'])
+        chain['iv'][fill] = iv[fill]
+        chain['delta'][fill] = delta[fill]
+        logger.debug(f"Local greeks filled for {fill.sum()} of {len(chain)} {self.und_contract.symbol} {expiry} options")
+        return chain
+
+    def strike_by_target_delta(self, expiry: str, right: str, target_delta: float):
+        """
+        Return the quoted strike whose absolute delta is closest to target_delta.
+        target_delta is given in delta points as in cfg (22 means 0.22).
+        """
+        strike = strike_by_target_delta(self.array(expiry), right, target_delta)
+        if strike is None:
+            logger.error(f"No {right} deltas available for {self.und_contract.symbol} {expiry}")
+        return strike
+
+
+def nearest_strike(strikes: list, target_strike: float) -> float:
+    """Return the strike of a sorted, non-empty list nearest to target_strike, preferring the lower on a tie."""
+    i = bisect_left(strikes, target_strike)
+    candidates = strikes[max(0, i - 1):i + 1]
+    return min(candidates, key=lambda strike: abs(strike - target_strike))
+
+
+def strike_by_target_delta(chain: np.ndarray, right: str, target_delta: float):
+    """Vectorized delta search over a ChainSnapshot structured array; None if no deltas are known."""
+    deltas = np.where(chain['right'] == right, np.abs(chain['delta']), np.nan)
+    if np.isnan(deltas).all():
+        return None
+    target = abs(target_delta) / 100 if abs(target_delta) > 1 else abs(target_delta)
+    return float(chain['strike'][np.nanargmin(np.abs(deltas - target))])
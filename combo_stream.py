@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from math import isnan, nan
+
+from ibpool import pool
+
+logger = logging.getLogger('DC')
+
+
+class ComboQuoteStream:
+    """
+    Streaming bid/mid/ask for a combo, computed from live quotes of its legs.
+
+    BUY legs add their bid/ask to the combo bid/ask, SELL legs subtract their ask/bid.
+    The quote is recomputed on every leg tick and waiters are woken when it changes.
+    """
+
+    def __init__(self, legs: list, actions: list, ratios: list):
+        self.legs = legs
+        self.actions = actions
+        self.ratios = ratios
+        self.tickers = []
+        self._ib = None
+        self.quote = (nan, nan, nan)
+        self._changed = asyncio.Event()
+
+    async def start(self):
+        self._ib = pool.market_data()
+        async with pool.pacer_for(self._ib).slot(cost=len(self.legs)):
+            self.tickers = [self._ib.reqMktData(leg, '', False, False) for leg in self.legs]
+        for ticker in self.tickers:
+            ticker.updateEvent += self._on_update
+        return self
+
+    def stop(self):
+        for leg, ticker in zip(self.legs, self.tickers):
+            ticker.updateEvent -= self._on_update
+            self._ib.cancelMktData(leg)
+        self.tickers = []
+
+    @property
+    def ready(self) -> bool:
+        return not any(isnan(x) for x in self.quote)
+
+    def _on_update(self, _ticker):
+        bid = ask = 0.0
+        for ticker, action, ratio in zip(self.tickers, self.actions, self.ratios):
+            leg_bid, leg_ask = ticker.bid, ticker.ask
+            if isnan(leg_bid) or isnan(leg_ask) or leg_bid <= 0 or leg_ask <= 0:
+                bid = ask = nan
+                break
+            if action == 'BUY':
+                bid += ratio * leg_bid
+                ask += ratio * leg_ask
+            else:
+                bid -= ratio * leg_ask
+                ask -= ratio * leg_bid
+        quote = (bid, (bid + ask) / 2, ask)
+        if quote != self.quote and not (isnan(bid) and isnan(self.quote[0])):
+            self.quote = quote
+            self._changed.set()
+
+    async def wait_for_change(self, timeout: float) -> bool:
+        """Wait up to timeout seconds for the combo quote to change; return True if it did."""
+        self._changed.clear()
+        try:
+            await asyncio.wait_for(self._changed.wait(), max(timeout, 0))
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def wait_ready(self, timeout: float) -> bool:
+        """Wait until every leg has a two-sided quote, up to timeout seconds."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not self.ready:
+            if not await self.wait_for_change(deadline - loop.time()):
+                break
+        return self.ready
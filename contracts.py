@@ -1,5 +1,7 @@
+import copy
 from ib_insync import Stock, Future, FuturesOption, Option, Index
 from ib_instance import ib
+from qualcache import qualification_cache
 
 def get_conid(symbol: str, sec_type: str, exchange='SMART', currency='USD', dynamic_front_month=False):
     """
@@ -40,10 +42,16 @@ def get_conid(symbol: str, sec_type: str, exchange='SMART', currency='USD', dyna
         else:
             raise ValueError(f"Unsupported security type: {sec_type}")
 
+        cached = qualification_cache.get(contract)
+        if cached is not None:
+            return cached.conId
+
         # Qualify the contract to retrieve full details, including conId
+        requested = copy.copy(contract)
         qualified_contract = ib.qualifyContracts(contract)
 
         if qualified_contract:
+            qualification_cache.put(requested, qualified_contract[0])
             con_id = qualified_contract[0].conId
             #print(f"{symbol} ({sec_type}) conId: {con_id}")
             return con_id
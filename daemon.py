@@ -0,0 +1,269 @@
+"""
+Daemon mode (main.py --daemon): keep one IB session open all week and fire the
+strategy schedules (strategies.py) from an in-process scheduler.
+
+Each schedule fires on its weekday at its entry time, on NYSE trading days only and
+never on a Friday before a Monday holiday. A schedule that fires alone is warmed up
+cfg.daemon_warmup_lead seconds ahead (underlying and candidate strikes streaming), so
+at the entry time only the mid, chain quotes and order remain. Schedules due at the
+same time run together and share their requests. The qualification cache, trading
+calendar, position index and connections stay warm between runs; closes are still
+placed as good-after-time orders by close_at_time, so they survive a daemon restart.
+
+A line-based control socket on cfg.daemon_control_host:daemon_control_port accepts
+`status`, `trigger NAME`, `skip NAME`, `unskip NAME`, `reload` and `stop`; `main.py
+--control "skip Friday57"` sends one command and prints the reply. `reload` recompiles
+cfg.strategy_config_path and swaps the new parameters and entry times in for the next
+entries; an invalid file is rejected with its errors and the running configuration kept.
+"""
+import asyncio
+import logging
+import socket
+from datetime import datetime, timedelta
+
+import cfg
+from strategies import ConfigError, ScheduleConfig, load_schedules, require_entry_times
+from tradecal import calendar, is_friday_before_monday_holiday
+
+logger = logging.getLogger('DC')
+
+# How far ahead to look for a schedule's next trading-day entry
+MAX_LOOKAHEAD_DAYS = 28
+
+# Longest single sleep, so wall-clock changes (NTP steps, suspend) are picked up
+MAX_SLEEP = 60
+
+
+class Schedule:
+    """One compiled schedule and its daemon state: when it fires and what it runs."""
+
+    def __init__(self, config: ScheduleConfig):
+        self.name = config.name
+        self.update(config)
+        self.skip_next = False
+        self.last_fired = None
+        self.last_result = None
+
+    def update(self, config: ScheduleConfig):
+        """Take the parameters and entry time of a reloaded configuration, keeping the daemon state."""
+        self.weekday = config.weekday
+        self.entry_time = datetime.strptime(config.entry_time, "%H:%M:%S").time()
+        self.symbols = list(config.symbols)
+        self.params = config.params
+
+    @property
+    def config(self) -> tuple:
+        return self.name, self.symbols, self.params
+
+    def next_entry(self, now: datetime):
+        """Return the first entry datetime after the last firing and not before now, or None."""
+        nyse = calendar('NYSE')
+        d = now.date()
+        for _ in range(MAX_LOOKAHEAD_DAYS):
+            entry = datetime.combine(d, self.entry_time)
+            if (d.weekday() == self.weekday and entry >= now and (self.last_fired is None or entry > self.last_fired)
+                    and nyse.is_trading_day(d) and not is_friday_before_monday_holiday(d)):
+                return entry
+            d += timedelta(days=1)
+        return None
+
+
+class Daemon:
+    """In-process scheduler for the entry schedules, with a local control socket."""
+
+    def __init__(self, names: list, is_live: bool, concurrency: int = cfg.max_concurrent_symbols):
+        compiled = load_schedules()
+        require_entry_times(compiled, names)
+        self.schedules = {name: Schedule(compiled[name]) for name in names}
+        self.is_live = is_live
+        self.concurrency = concurrency
+        self._changed = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._running = set()
+
+    async def run(self):
+        server = await asyncio.start_server(self._handle_control, cfg.daemon_control_host, cfg.daemon_control_port)
+        logger.info(f"Daemon running {', '.join(self.schedules)}; control socket on "
+                    f"{cfg.daemon_control_host}:{cfg.daemon_control_port}")
+        try:
+            await self._schedule_loop()
+        finally:
+            server.close()
+            await server.wait_closed()
+            if self._running:
+                logger.info(f"Waiting for {len(self._running)} running entries to finish")
+                await asyncio.gather(*self._running, return_exceptions=True)
+            from notify import notifier
+            from tradewriter import trade_log
+            await trade_log.drain()
+            await notifier.drain()
+            logger.info("Daemon stopped")
+
+    def next_group(self, now: datetime) -> tuple:
+        """Return (entry time, schedules due at it) for the earliest upcoming entry."""
+        upcoming = {}
+        for schedule in self.schedules.values():
+            entry = schedule.next_entry(now)
+            if entry is not None:
+                upcoming.setdefault(entry, []).append(schedule)
+        if not upcoming:
+            return None, []
+        entry = min(upcoming)
+        return entry, upcoming[entry]
+
+    async def _schedule_loop(self):
+        while not self._stopping.is_set():
+            entry, group = self.next_group(datetime.now())
+            if entry is None:
+                logger.warning(f"No schedule fires in the next {MAX_LOOKAHEAD_DAYS} days")
+                await self._sleep_until(datetime.now() + timedelta(days=1))
+                continue
+            warm = len(group) == 1 and cfg.daemon_warmup_lead > 0
+            start = entry - timedelta(seconds=cfg.daemon_warmup_lead) if warm else entry
+            logger.info(f"Next entry: {', '.join(s.name for s in group)} at {entry}"
+                        f"{f', warmup from {start.time()}' if warm else ''}")
+            if await self._sleep_until(start):
+                continue  # skipped, triggered or stopping: plan again
+            for schedule in group:
+                schedule.last_fired = entry
+            self._start(self._run_entry(group, entry, warm))
+
+    async def _sleep_until(self, when: datetime) -> bool:
+        """Sleep until the wall-clock time `when`; return True if woken early by a control command."""
+        while True:
+            delay = (when - datetime.now()).total_seconds()
+            if delay <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self._changed.wait(), min(delay, MAX_SLEEP))
+                self._changed.clear()
+                return True
+            except asyncio.TimeoutError:
+                pass
+
+    def _start(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run_entry(self, group: list, entry: datetime = None, warm: bool = False, manual: bool = False):
+        """
+        Run one group of schedules at `entry` (now if None), warming a lone schedule up first.
+        A manual run (trigger) neither honours nor clears pending skips, which belong to
+        the scheduled entries.
+        """
+        from main import run_configs_async
+        from warmup import warm_up_symbols_async
+        from instrument import latency
+
+        warmups = {}
+        try:
+            if not manual:
+                group = self._take_skips(group)
+            if warm and group:
+                [schedule] = group
+                warmups = await warm_up_symbols_async(schedule.symbols, schedule.params)
+            if entry is not None:
+                await self._sleep_until_entry(entry)
+            configs = [schedule.config for schedule in (group if manual else self._take_skips(group))]
+            if not configs:
+                return
+            logger.info(f"Running {', '.join(name for name, _, _ in configs)}")
+            results = await run_configs_async(configs, self.is_live, self.concurrency, warmups)
+            for name, _, _ in configs:
+                trades = [trade for (config, _), trade in results.items() if config == name]
+                self.schedules[name].last_result = (f"{datetime.now():%Y-%m-%d %H:%M:%S} "
+                                                    f"{sum(1 for trade in trades if trade)}/{len(trades)} submitted")
+            await latency.report_async(cfg.trade_fill_timeout)
+        except Exception as e:
+            logger.exception(f"Daemon run of {', '.join(s.name for s in group)} failed: {e}")
+        finally:
+            for warmup in warmups.values():
+                warmup.release()
+
+    @staticmethod
+    def _take_skips(group: list) -> list:
+        """Consume pending skips in the group and return the schedules that still run."""
+        run = []
+        for schedule in group:
+            if schedule.skip_next:
+                schedule.skip_next = False
+                schedule.last_result = f"{datetime.now():%Y-%m-%d %H:%M:%S} skipped"
+                logger.warning(f"Skipping {schedule.name} as requested")
+            else:
+                run.append(schedule)
+        return run
+
+    async def _sleep_until_entry(self, entry: datetime):
+        """Sleep until the entry time, ignoring control commands, which must not move a warm entry."""
+        while (delay := (entry - datetime.now()).total_seconds()) > 0:
+            await asyncio.sleep(min(delay, MAX_SLEEP))
+
+    def command(self, line: str) -> str:
+        """Apply one control command and return the reply."""
+        verb, _, name = line.strip().partition(' ')
+        verb, name = verb.lower(), name.strip()
+        if verb == 'status':
+            now = datetime.now()
+            lines = []
+            for schedule in self.schedules.values():
+                entry = schedule.next_entry(now)
+                lines.append(f"{schedule.name}: next {entry or 'none'}{' (skip)' if schedule.skip_next else ''}, "
+                             f"last {schedule.last_result or 'never'}")
+            lines.append(f"{len(self._running)} running")
+            return "\n".join(lines)
+        if verb == 'stop':
+            self._stopping.set()
+            self._changed.set()
+            return "ok stopping"
+        if verb == 'reload':
+            return self.reload()
+        if verb not in ('trigger', 'skip', 'unskip'):
+            return f"error unknown command '{verb}'"
+        if name not in self.schedules:
+            return f"error unknown schedule '{name}', one of {', '.join(self.schedules)}"
+        schedule = self.schedules[name]
+        if verb == 'trigger':
+            self._start(self._run_entry([schedule], manual=True))
+            return f"ok triggered {name}"
+        schedule.skip_next = verb == 'skip'
+        self._changed.set()
+        return f"ok {verb} {name}"
+
+    def reload(self) -> str:
+        """Recompile the strategy configuration and apply it to the schedules this daemon runs."""
+        try:
+            compiled = load_schedules()
+            require_entry_times(compiled, [name for name in self.schedules if name in compiled])
+        except ConfigError as e:
+            logger.error(f"Reload rejected, {e}")
+            return f"error {e}"
+        missing = [name for name in self.schedules if name not in compiled]
+        if missing:
+            return f"error reloaded configuration has no schedule {', '.join(missing)}"
+        for name, schedule in self.schedules.items():
+            schedule.update(compiled[name])
+        self._changed.set()
+        logger.info(f"Reloaded strategy configuration for {', '.join(self.schedules)}")
+        return f"ok reloaded {len(self.schedules)} schedules"
+
+    async def _handle_control(self, reader, writer):
+        try:
+            line = (await reader.readline()).decode()
+            logger.info(f"Control command: {line.strip()}")
+            writer.write((self.command(line) + "\n").encode())
+            await writer.drain()
+        except Exception as e:
+            logger.error(f"Control connection failed: {e}")
+        finally:
+            writer.close()
+
+
+def send_command(command: str, timeout: float = 5) -> str:
+    """Send one command to a running daemon's control socket and return the reply."""
+    with socket.create_connection((cfg.daemon_control_host, cfg.daemon_control_port), timeout=timeout) as conn:
+        conn.sendall((command.strip() + "\n").encode())
+        reply = b''
+        while chunk := conn.recv(4096):
+            reply += chunk
+    return reply.decode().rstrip("\n")
@@ -1,45 +1,77 @@
 import logging
+import time
 from math import isnan
 
-from ibstrat.qualify import qualify_contract
-from ibstrat.orders import create_bag, submit_limit_order, adj_price_for_order, submit_limit_order_with_pt, wait_for_order_fill
-from ibstrat.adaptive import submit_adaptive_order, submit_adaptive_order_with_pt,close_at_time
-from ibstrat.positions import check_positions
+from ibstrat.orders import create_bag, submit_limit_order
+from ibstrat.adaptive import submit_adaptive_order, close_at_time
 from ibstrat.ib_instance import ib
-from ibstrat.market_data import get_bag_prices
-from ibstrat.tradelog import log_trade_details
+from aio import (qualify_contracts_async, get_bag_prices_async, adj_price_for_order_async,
+                 adj_price_on_quotes_async, wait_for_fill_async, option_sec_type)
+from combo_stream import ComboQuoteStream
+from instrument import latency
+from posindex import position_index
+from tradewriter import trade_log
 from ibstrat.trclass import get_trading_class_for_symbol
 from ibstrat.ticksize import get_tick_size, adjust_to_tick_size
 import cfg
-from ibstrat.pushover import send_notification
+from notify import notifier
+from strategies import StrategyParams
 
 logger = logging.getLogger('DC')
 
+
+def record_submitted(trade, symbol: str, started_at: float):
+    """Log and record the time from entry start to order submission, and time the fill."""
+    time_to_submit = time.monotonic() - started_at
+    logger.info(f"Time-to-submit for {symbol}: {time_to_submit:.2f}s")
+    latency.record('time_to_submit', symbol, time_to_submit)
+    if trade:
+        latency.record_fill(trade, symbol, time.perf_counter())
+
+
 def submit_double_calendar(und_contract,
                            short_put_strike: float, short_call_strike: float,
                            long_put_strike: float, long_call_strike: float,
                            short_put_expiry_date: str, long_put_expiry_date: str,
                            short_call_expiry_date: str, long_call_expiry_date: str,
                            is_live: bool,
-                           strategy_params: dict):
-    print(f"submit_double_calendar, params are: {strategy_params}")
+                           strategy_params: StrategyParams):
+    return ib.run(submit_double_calendar_async(und_contract,
+                                               short_put_strike, short_call_strike,
+                                               long_put_strike, long_call_strike,
+                                               short_put_expiry_date, long_put_expiry_date,
+                                               short_call_expiry_date, long_call_expiry_date,
+                                               is_live, strategy_params))
+
+
+async def submit_double_calendar_async(und_contract,
+                                       short_put_strike: float, short_call_strike: float,
+                                       long_put_strike: float, long_call_strike: float,
+                                       short_put_expiry_date: str, long_put_expiry_date: str,
+                                       short_call_expiry_date: str, long_call_expiry_date: str,
+                                       is_live: bool,
+                                       strategy_params: StrategyParams,
+                                       started_at: float = None):
+    started_at = started_at or time.monotonic()
+    logger.info(f"submit_double_calendar, params are: {strategy_params}")
+    stream = None
     try:
         # Extract parameters from the strategy configuration
-        opt_exchange = strategy_params["opt_exchange"]
-        quantity = strategy_params["quantity"]
-        strategy_tag = strategy_params["strategy_tag"]
+        opt_exchange = strategy_params.opt_exchange
+        quantity = strategy_params.quantity
+        strategy_tag = strategy_params.strategy_tag
         trading_class = get_trading_class_for_symbol(und_contract.symbol)
-        submit_auto_close = strategy_params.get("submit_auto_close")
-        use_adaptive_on_combo = strategy_params.get("use_adaptive_on_combo")
-        use_adaptive_on_exit = strategy_params.get("use_adaptive_on_exit")
-        auto_close_date_time = short_put_expiry_date + "-" + strategy_params.get("close_time") if submit_auto_close else None
-
-        print(f"Preparing Double Calendar Spread for {und_contract.symbol} with strategy {strategy_tag}")
-        print(f"  Short Call Strike: {short_call_strike}, Short Put Strike: {short_put_strike}")
-        print(f"  Long Call Strike: {long_call_strike}, Long Put Strike: {long_put_strike}")
-        print(f"  Short Put Expiry: {short_put_expiry_date}, Long Put Expiry: {long_put_expiry_date}")
-        print(f"  Short Call Expiry: {short_call_expiry_date}, Long Call Expiry: {long_call_expiry_date}")
-        print(f"  Exchange: {opt_exchange}, Quantity: {quantity}")
+        submit_auto_close = strategy_params.submit_auto_close
+        use_adaptive_on_combo = strategy_params.use_adaptive_on_combo
+        use_adaptive_on_exit = strategy_params.use_adaptive_on_exit
+        auto_close_date_time = short_put_expiry_date + "-" + strategy_params.close_time if submit_auto_close else None
+
+        logger.info(f"Preparing Double Calendar Spread for {und_contract.symbol} with strategy {strategy_tag}")
+        logger.info(f"  Short Call Strike: {short_call_strike}, Short Put Strike: {short_put_strike}")
+        logger.info(f"  Long Call Strike: {long_call_strike}, Long Put Strike: {long_put_strike}")
+        logger.info(f"  Short Put Expiry: {short_put_expiry_date}, Long Put Expiry: {long_put_expiry_date}")
+        logger.info(f"  Short Call Expiry: {short_call_expiry_date}, Long Call Expiry: {long_call_expiry_date}")
+        logger.info(f"  Exchange: {opt_exchange}, Quantity: {quantity}")
 
         # Check existing positions
         pos_check_list = [
@@ -48,30 +80,30 @@ def submit_double_calendar(und_contract,
             {'strike': long_put_strike, 'right': 'P', 'expiry': long_put_expiry_date, 'position_type': 'short'},
             {'strike': long_call_strike, 'right': 'C', 'expiry': long_call_expiry_date, 'position_type': 'short'},
         ]
-        if check_positions(und_contract.symbol, pos_check_list):
+        with latency.span('position_check', und_contract.symbol):
+            collision = position_index.check(und_contract.symbol, pos_check_list)
+        if collision:
             logger.warning(f"Collisions detected on strikes, aborting trade.")
-            send_notification("DC aborted due to strike collision")
+            notifier.notify(f"DC {strategy_tag} for {und_contract.symbol} aborted due to strike collision")
             return None
 
         # Qualify contracts for each leg
-        legs = [
-            qualify_contract(symbol=und_contract.symbol, secType='FOP' if und_contract.secType == 'FUT' else 'OPT',
-                             exchange=opt_exchange, right='C', strike=long_call_strike,
-                             lastTradeDateOrContractMonth=long_call_expiry_date, multiplier=und_contract.multiplier,
-                             tradingClass=trading_class),
-            qualify_contract(symbol=und_contract.symbol, secType='FOP' if und_contract.secType == 'FUT' else 'OPT',
-                             exchange=opt_exchange, right='C', strike=short_call_strike,
-                             lastTradeDateOrContractMonth=short_call_expiry_date, multiplier=und_contract.multiplier,
-                             tradingClass=trading_class),
-            qualify_contract(symbol=und_contract.symbol, secType='FOP' if und_contract.secType == 'FUT' else 'OPT',
-                             exchange=opt_exchange, right='P', strike=long_put_strike,
-                             lastTradeDateOrContractMonth=long_put_expiry_date, multiplier=und_contract.multiplier,
-                             tradingClass=trading_class),
-            qualify_contract(symbol=und_contract.symbol, secType='FOP' if und_contract.secType == 'FUT' else 'OPT',
-                             exchange=opt_exchange, right='P', strike=short_put_strike,
-                             lastTradeDateOrContractMonth=short_put_expiry_date, multiplier=und_contract.multiplier,
-                             tradingClass=trading_class),
+        sec_type = option_sec_type(und_contract)
+        leg_specs = [
+            {'right': 'C', 'strike': long_call_strike, 'lastTradeDateOrContractMonth': long_call_expiry_date},
+            {'right': 'C', 'strike': short_call_strike, 'lastTradeDateOrContractMonth': short_call_expiry_date},
+            {'right': 'P', 'strike': long_put_strike, 'lastTradeDateOrContractMonth': long_put_expiry_date},
+            {'right': 'P', 'strike': short_put_strike, 'lastTradeDateOrContractMonth': short_put_expiry_date},
         ]
+        for spec in leg_specs:
+            spec.update(symbol=und_contract.symbol, secType=sec_type, exchange=opt_exchange,
+                        multiplier=und_contract.multiplier, tradingClass=trading_class)
+        try:
+            with latency.span('leg_qualification', und_contract.symbol):
+                legs = await qualify_contracts_async(*leg_specs)
+        except ValueError as e:
+            logger.error(f"Unable to qualify all legs for {und_contract.symbol}, aborting trade: {e}")
+            return None
 
         # Define actions and ratios for the legs
         leg_actions = ['BUY', 'SELL', 'BUY', 'SELL']
@@ -83,7 +115,14 @@ def submit_double_calendar(und_contract,
 
         logger.info(f"Combo contract created for {und_contract.symbol} with {len(legs)} legs.")
 
-        bid, mid, ask = get_bag_prices(bag_contract)
+        with latency.span('bag_pricing', und_contract.symbol):
+            if cfg.stream_combo_quotes:
+                stream = await ComboQuoteStream(legs, leg_actions, ratios).start()
+                if not await stream.wait_ready(cfg.combo_quote_timeout):
+                    logger.warning(f"Not all legs of {und_contract.symbol} quoted within {cfg.combo_quote_timeout}s")
+                bid, mid, ask = stream.quote
+            else:
+                bid, mid, ask = await get_bag_prices_async(bag_contract)
         logger.info(f"Combo prices: Bid: {bid}, Mid: {mid}, Ask: {ask}")
 
         # Handle futures and options differently
@@ -94,39 +133,47 @@ def submit_double_calendar(und_contract,
         if use_adaptive_on_combo:
             # Submit an adaptive market order
             logger.info(f"Submitting adaptive order for {und_contract.symbol}")
-            trade = submit_adaptive_order(
-                order_contract=bag_contract,
-                order_type='MKT',
-                action='BUY',
-                is_live=is_live,
-                quantity=quantity,
-                order_ref=strategy_tag,
-                adaptive_priority=cfg.adaptive_priority
-            )
-            ib.sleep(cfg.adjust_sleep_interval)
+            with latency.span('order_submit', und_contract.symbol):
+                trade = submit_adaptive_order(
+                    order_contract=bag_contract,
+                    order_type='MKT',
+                    action='BUY',
+                    is_live=is_live,
+                    quantity=quantity,
+                    order_ref=strategy_tag,
+                    adaptive_priority=cfg.adaptive_priority
+                )
+            record_submitted(trade, und_contract.symbol, started_at)
         else:
             # Submit a limit order using the mid price
             contract_tick = get_tick_size(und_contract.symbol, mid)
             order_limit_price = adjust_to_tick_size(mid, contract_tick)
             logger.debug(f"Limit order price adjusted from {mid} to {order_limit_price} for {und_contract.symbol}")
-            trade = submit_limit_order(
-                order_contract=bag_contract,
-                limit_price=order_limit_price,
-                action='BUY',
-                is_live=is_live,
-                quantity=quantity,
-                strategy_tag=strategy_tag
-            )
-            ib.sleep(cfg.adjust_sleep_interval)
+            with latency.span('order_submit', und_contract.symbol):
+                trade = submit_limit_order(
+                    order_contract=bag_contract,
+                    limit_price=order_limit_price,
+                    action='BUY',
+                    is_live=is_live,
+                    quantity=quantity,
+                    strategy_tag=strategy_tag
+                )
+            record_submitted(trade, und_contract.symbol, started_at)
             logger.debug(f"Trade submitted: {trade}")
             # Adjust orders if necessary
-            if trade and is_live:
+            if trade and is_live and stream:
+                logger.info(f"Calling adj_price_on_quotes_async()")
+                await adj_price_on_quotes_async(trade, stream, 100, cfg.adjust_sleep_interval)
+            elif trade and is_live:
                 logger.info(f"Calling adj_price_for_order()")
-                adj_price_for_order(trade.order.orderId,100,cfg.adjust_sleep_interval)
+                await adj_price_for_order_async(trade, 100, cfg.adjust_sleep_interval)
+        if stream:
+            stream.stop()
 
         if trade and submit_auto_close:
-            logger.info(f"Calling wait_for_order_fill()")
-            if wait_for_order_fill(trade.order.orderId, 500):
+            logger.info(f"Waiting for fill on order {trade.order.orderId}")
+            if await wait_for_fill_async(trade, cfg.order_fill_timeout):
+                filled_at = time.monotonic()
                 close_result = close_at_time(
                     order_contract=bag_contract,
                     closing_action='SELL',
@@ -137,28 +184,23 @@ def submit_double_calendar(und_contract,
                     use_adaptive=use_adaptive_on_exit,
                     tif='GTC'
                 )
+                logger.info(f"Fill-to-close for {und_contract.symbol}: {(time.monotonic() - filled_at) * 1000:.1f}ms")
                 logger.info(f"Adaptive close result: {close_result}")
         # Handle trade submission results
         if not trade:
             logger.error(f"Failed to submit Double Calendar order for {und_contract.symbol}.")
             return None
-        if cfg.pushover_alerts:
-            send_notification(f"Opened dcal {strategy_tag} for {und_contract.symbol}")
+        notifier.notify(f"Opened dcal {strategy_tag} for {und_contract.symbol}")
 
         if trade and is_live and cfg.log_trade_fills:
-            logger.info("Calling log_trade_details()")
-            log_trade_details(ib=ib,
-                              und_contract=und_contract,
-                              trade_contract=bag_contract,
-                              mid_price=mid,
-                              trade=trade,
-                              timeout=cfg.trade_fill_timeout,
-                              sheet_id=cfg.trade_log_sheet_id,
-                              strategy_tag=strategy_tag)
+            trade_log.submit(trade, und_contract, legs, leg_actions, mid, strategy_tag)
 
         return trade
 
     except Exception as e:
         logger.exception(f"Error submitting Double Calendar Spread order for {und_contract.symbol}: {e}")
         return None
+    finally:
+        if stream:
+            stream.stop()
 
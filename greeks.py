@@ -0,0 +1,106 @@
+"""
+Vectorized option pricing used to compute implied vol and delta locally from quotes.
+
+Black-76 is used for options on futures (FUT/FOP underlyings) and Black-Scholes for
+options on stocks and indexes (STK/IND), so strikes can be selected as soon as
+quotes arrive instead of waiting for IB's model greeks. All functions take scalars
+or NumPy arrays and broadcast.
+"""
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+BLACK_76 = 'black76'
+BLACK_SCHOLES = 'bs'
+
+# Options are treated as expiring at the US equity close
+EXPIRY_TZ = ZoneInfo('America/New_York')
+EXPIRY_HOUR = 16
+MIN_YEAR_FRACTION = 60 / (365 * 86400)
+
+
+def model_for_sec_type(sec_type: str) -> str:
+    """Return the pricing model for an underlying secType."""
+    return BLACK_76 if sec_type in ('FUT', 'FOP') else BLACK_SCHOLES
+
+
+def year_fraction(expiry: str, now: datetime = None) -> float:
+    """Return the time in years from now to the close on expiry (YYYYMMDD)."""
+    now = now or datetime.now(EXPIRY_TZ)
+    expires = datetime.strptime(expiry[:8], "%Y%m%d").replace(hour=EXPIRY_HOUR, tzinfo=EXPIRY_TZ)
+    return max((expires - now).total_seconds() / (365 * 86400), MIN_YEAR_FRACTION)
+
+
+def norm_pdf(x):
+    return np.exp(-0.5 * np.square(x)) / np.sqrt(2 * np.pi)
+
+
+def norm_cdf(x):
+    """Standard normal CDF (Abramowitz and Stegun 7.1.26, absolute error below 1.5e-7)."""
+    x = np.asarray(x, dtype=float)
+    z = np.abs(x) / np.sqrt(2)
+    t = 1 / (1 + 0.3275911 * z)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1 - poly * np.exp(-z * z)
+    return 0.5 * (1 + np.sign(x) * erf)
+
+
+def _d1_d2(und, strike, t, rate, sigma, model, dividend_yield=0.0):
+    vol_t = sigma * np.sqrt(t)
+    if model == BLACK_76:
+        d1 = (np.log(und / strike) + 0.5 * sigma ** 2 * t) / vol_t
+    else:
+        d1 = (np.log(und / strike) + (rate - dividend_yield + 0.5 * sigma ** 2) * t) / vol_t
+    return d1, d1 - vol_t
+
+
+def price(und, strike, t, rate, sigma, is_call, model, dividend_yield=0.0):
+    """Return option prices; und is the futures price for Black-76 and the spot for Black-Scholes."""
+    d1, d2 = _d1_d2(und, strike, t, rate, sigma, model, dividend_yield)
+    disc = np.exp(-rate * t)
+    und_disc = disc if model == BLACK_76 else np.exp(-dividend_yield * t)
+    call = und * und_disc * norm_cdf(d1) - strike * disc * norm_cdf(d2)
+    put = strike * disc * norm_cdf(-d2) - und * und_disc * norm_cdf(-d1)
+    return np.where(is_call, call, put)
+
+
+def delta(und, strike, t, rate, sigma, is_call, model, dividend_yield=0.0):
+    d1, _ = _d1_d2(und, strike, t, rate, sigma, model, dividend_yield)
+    und_disc = np.exp(-rate * t) if model == BLACK_76 else np.exp(-dividend_yield * t)
+    return np.where(is_call, und_disc * norm_cdf(d1), und_disc * (norm_cdf(d1) - 1))
+
+
+def implied_vol(option_price, und, strike, t, rate, is_call, model, dividend_yield=0.0,
+                low: float = 1e-4, high: float = 5.0, iterations: int = 60):
+    """
+    Solve for implied volatility by vectorized bisection.
+
+    Returns NaN where the price is outside the no-arbitrage bounds or not a valid price.
+    """
+    option_price, und, strike, t, is_call = np.broadcast_arrays(
+        np.asarray(option_price, dtype=float), np.asarray(und, dtype=float),
+        np.asarray(strike, dtype=float), np.asarray(t, dtype=float), np.asarray(is_call, dtype=bool))
+    lo = np.full(option_price.shape, low)
+    hi = np.full(option_price.shape, high)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        valid = (price(und, strike, t, rate, lo, is_call, model, dividend_yield) <= option_price) & \
+                (option_price <= price(und, strike, t, rate, hi, is_call, model, dividend_yield))
+        for _ in range(iterations):
+            mid = 0.5 * (lo + hi)
+            above = price(und, strike, t, rate, mid, is_call, model, dividend_yield) > option_price
+            hi = np.where(above, mid, hi)
+            lo = np.where(above, lo, mid)
+    return np.where(valid, 0.5 * (lo + hi), np.nan)
+
+
+def greeks_from_quotes(bid, ask, und_price, strike, is_call, expiry: str, sec_type: str, rate: float,
+                       now: datetime = None):
+    """Return (implied_vol, delta) arrays computed from the bid/ask mid of each option, as of now."""
+    model = model_for_sec_type(sec_type)
+    t = year_fraction(expiry, now)
+    bid, ask = np.asarray(bid, dtype=float), np.asarray(ask, dtype=float)
+    mid = np.where((bid > 0) & (ask >= bid), 0.5 * (bid + ask), np.nan)
+    iv = implied_vol(mid, und_price, strike, t, rate, is_call, model)
+    with np.errstate(invalid='ignore'):
+        return iv, delta(und_price, strike, t, rate, iv, is_call, model)
@@ -2,6 +2,7 @@ from ib_insync import IB
 import time
 import cfg
 import logging
+from reconnect import backoff_delay
 
 # Configure logging
 logging.basicConfig(level=logging.INFO,
@@ -14,7 +15,6 @@ ib = IB()
 
 # Variables for retry mechanism
 MAX_RETRIES = 5  # Maximum number of retries if the connection fails
-RETRY_INTERVAL = 2  # Time (in seconds) to wait between retries
 
 
 def connect_to_ib(is_test=False):
@@ -45,7 +45,7 @@ def connect_to_ib(is_test=False):
         except Exception as e:
             logger.warning(f"Connection attempt {attempt + 1} failed: {e}")
             if attempt < MAX_RETRIES - 1:  # No need to sleep on the last attempt
-                time.sleep(RETRY_INTERVAL)
+                time.sleep(backoff_delay(attempt))
 
     # Raise an error if unable to connect after retries
     raise RuntimeError(f"Unable to connect to {'Test' if is_test else 'Live'} Interactive Brokers after {MAX_RETRIES} attempts.")
\ No newline at end of file
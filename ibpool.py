@@ -0,0 +1,85 @@
+import asyncio
+import logging
+
+from ib_async import IB
+from ibstrat.ib_instance import ib
+from pacing import Pacer
+from reconnect import ConnectionWatchdog
+import cfg
+
+logger = logging.getLogger('DC')
+
+
+class IBPool:
+    """
+    IB connections split into an order lane and market-data lanes.
+
+    The order lane is the ibstrat connection: orders, trades, positions and executions
+    all live there, as the ibstrat helpers expect. Market-data lanes are extra
+    read-only connections with their own client IDs that carry snapshots, streaming
+    subscriptions, contract details and qualification, so a large chain request cannot
+    queue in front of an order acknowledgement. With no market-data lane connected,
+    everything falls back to the order lane. Every connection is supervised by a
+    ConnectionWatchdog that reconnects it and resumes its session after a drop, and
+    paced by its own Pacer, as IB limits the message rate per client.
+    """
+
+    def __init__(self):
+        self.market_data_lanes = []
+        self.watchdogs = []
+        self._next = 0
+        self._pacers = {}  # connection -> Pacer
+
+    def pacer_for(self, connection: IB) -> Pacer:
+        """Return the pacer of a connection, for every request sent on it."""
+        pacer = self._pacers.get(connection)
+        if pacer is None:
+            pacer = self._pacers[connection] = Pacer(cfg.ib_max_msg_rate)
+        return pacer
+
+    @property
+    def orders(self) -> IB:
+        return ib
+
+    async def connect_async(self, host: str, port: int, clientids: list, orders_clientid: int, timeout: float = 4):
+        """
+        Connect a market-data lane for every client ID, skipping lanes that fail to
+        connect, and start watchdogs on the order connection and the connected lanes.
+        """
+        async def connect(clientid):
+            lane = IB()
+            try:
+                await lane.connectAsync(host, port, clientid, timeout=timeout, readonly=True)
+                logger.info(f"Market data lane connected with client ID {clientid}")
+                return lane
+            except Exception as e:
+                logger.warning(f"Market data lane with client ID {clientid} failed to connect, "
+                               f"market data will share the order connection: {e}")
+                lane.disconnect()
+                return None
+
+        lanes = await asyncio.gather(*(connect(clientid) for clientid in clientids))
+        self.watchdogs.append(ConnectionWatchdog(ib, host, port, orders_clientid).start())
+        for clientid, lane in zip(clientids, lanes):
+            if lane is not None:
+                self.market_data_lanes.append(lane)
+                self.watchdogs.append(ConnectionWatchdog(lane, host, port, clientid, readonly=True).start())
+
+    def market_data(self) -> IB:
+        """Return the next connected market-data lane (round robin), or the order lane if there is none."""
+        lanes = [lane for lane in self.market_data_lanes if lane.isConnected()]
+        if not lanes:
+            return ib
+        self._next = (self._next + 1) % len(lanes)
+        return lanes[self._next]
+
+    def disconnect(self):
+        for watchdog in self.watchdogs:
+            watchdog.stop()
+        self.watchdogs = []
+        for lane in self.market_data_lanes:
+            lane.disconnect()
+        self.market_data_lanes = []
+
+
+pool = IBPool()
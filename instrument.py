@@ -0,0 +1,166 @@
+"""
+Latency instrumentation for the entry pipeline.
+
+Stages are timed per symbol with `latency.span(stage, symbol)` (or `latency.timed` for
+a single awaitable). At the end of a run, once its orders have filled or
+cfg.trade_fill_timeout has passed, the spans are summarised as a table in the
+log and written as per-stage histograms to cfg.latency_metrics_path, either appended
+as JSON lines or as a Prometheus text-format file for a textfile collector.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from bisect import bisect_right
+from contextlib import contextmanager
+from datetime import datetime
+
+import cfg
+
+logger = logging.getLogger('DC')
+
+# Pipeline stages in the order they run, used to order the summary
+STAGES = ('front_month', 'qualify_underlying', 'mid_price', 'expiries', 'chain_fetch', 'delta_search',
+          'long_strikes', 'position_check', 'leg_qualification', 'bag_pricing', 'order_submit',
+          'time_to_submit', 'fill')
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+def _percentile(ordered: list, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LatencyRecorder:
+    """Collects (symbol, stage, seconds) spans for one run."""
+
+    def __init__(self):
+        self.spans = []
+        self._pending_fills = []  # futures resolved when a recorded trade fills or is cancelled
+
+    def record(self, stage: str, symbol: str, seconds: float):
+        self.spans.append((symbol, stage, seconds))
+        logger.debug(f"{symbol} {stage}: {seconds * 1000:.1f}ms")
+
+    @contextmanager
+    def span(self, stage: str, symbol: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, symbol, time.perf_counter() - started)
+
+    async def timed(self, stage: str, symbol: str, awaitable):
+        with self.span(stage, symbol):
+            return await awaitable
+
+    def record_fill(self, trade, symbol: str, submitted_at: float):
+        """
+        Record the submit-to-fill time of a trade when its filledEvent fires, in the
+        run it was submitted in even if that run is already waiting to report.
+        """
+        spans = self.spans
+        done = asyncio.get_running_loop().create_future()
+
+        def on_done(_trade):
+            trade.filledEvent -= on_filled
+            trade.cancelledEvent -= on_done
+            if not done.done():
+                done.set_result(None)
+
+        def on_filled(_trade):
+            spans.append((symbol, 'fill', time.perf_counter() - submitted_at))
+            on_done(_trade)
+
+        trade.filledEvent += on_filled
+        trade.cancelledEvent += on_done
+        self._pending_fills = [future for future in self._pending_fills if not future.done()] + [done]
+
+    def _by_stage(self) -> dict:
+        stages = {}
+        for _, stage, seconds in self.spans:
+            stages.setdefault(stage, []).append(seconds)
+        order = {stage: i for i, stage in enumerate(STAGES)}
+        return {stage: sorted(stages[stage]) for stage in sorted(stages, key=lambda s: order.get(s, len(order)))}
+
+    def histograms(self) -> dict:
+        """Return stage -> (cumulative bucket counts, count, sum)."""
+        result = {}
+        for stage, ordered in self._by_stage().items():
+            cumulative = [bisect_right(ordered, bound) for bound in BUCKETS]
+            result[stage] = (cumulative, len(ordered), sum(ordered))
+        return result
+
+    def summary(self) -> str:
+        lines = [f"{'stage':20} {'n':>4} {'p50 ms':>9} {'p90 ms':>9} {'max ms':>9} {'total ms':>10}"]
+        for stage, ordered in self._by_stage().items():
+            lines.append(f"{stage:20} {len(ordered):4d} {_percentile(ordered, 0.5) * 1000:9.1f} "
+                         f"{_percentile(ordered, 0.9) * 1000:9.1f} {ordered[-1] * 1000:9.1f} "
+                         f"{sum(ordered) * 1000:10.1f}")
+        per_symbol = {}
+        for symbol, stage, seconds in self.spans:
+            per_symbol.setdefault(symbol, []).append(f"{stage} {seconds * 1000:.0f}")
+        for symbol, stages in per_symbol.items():
+            lines.append(f"{symbol}: " + ", ".join(stages))
+        return "\n".join(lines)
+
+    def write(self, path: str, fmt: str = 'jsonl'):
+        if not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+        if fmt == 'prometheus':
+            self._write_prometheus(path)
+        else:
+            self._write_jsonl(path)
+
+    def _write_jsonl(self, path: str):
+        ts = datetime.now().isoformat(timespec='seconds')
+        with open(path, 'a') as f:
+            for stage, (cumulative, count, total) in self.histograms().items():
+                f.write(json.dumps({'ts': ts, 'stage': stage, 'count': count, 'sum': round(total, 6),
+                                    'buckets': dict(zip(map(str, BUCKETS), cumulative))}) + "\n")
+            for symbol, stage, seconds in self.spans:
+                f.write(json.dumps({'ts': ts, 'symbol': symbol, 'stage': stage, 'seconds': round(seconds, 6)}) + "\n")
+
+    def _write_prometheus(self, path: str):
+        lines = ["# HELP dcal_stage_seconds Entry pipeline stage latency.",
+                 "# TYPE dcal_stage_seconds histogram"]
+        for stage, (cumulative, count, total) in self.histograms().items():
+            for bound, n in zip(BUCKETS, cumulative):
+                lines.append(f'dcal_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {n}')
+            lines.append(f'dcal_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'dcal_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'dcal_stage_seconds_count{{stage="{stage}"}} {count}')
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, path)
+
+    async def report_async(self, timeout: float):
+        """
+        Wait up to timeout for the fills of this run's orders, then report the run.
+        Spans recorded meanwhile belong to the next run.
+        """
+        run = LatencyRecorder()
+        run.spans, self.spans = self.spans, []
+        pending, self._pending_fills = self._pending_fills, []
+        if pending:
+            logger.info(f"Waiting for {len(pending)} fills before the latency report")
+            await asyncio.wait(pending, timeout=timeout)
+        run.report()
+
+    def report(self):
+        """Log the summary table and write the histograms, then start a new run."""
+        if not self.spans:
+            return
+        logger.info("Entry latency summary:\n" + self.summary())
+        if cfg.latency_metrics_path:
+            try:
+                self.write(cfg.latency_metrics_path, cfg.latency_metrics_format)
+            except OSError as e:
+                logger.error(f"Unable to write latency metrics to {cfg.latency_metrics_path}: {e}")
+        self.spans = []
+
+
+latency = LatencyRecorder()
@@ -1,20 +1,15 @@
+import argparse
 import logging
 import sys
+import time
+from datetime import date
 
-from dcal import submit_double_calendar
-from ibstrat.market_data import get_current_mid_price
-from ibstrat.qualify import qualify_contract, get_front_month_contract_date
-from ibstrat.ib_instance import connect_to_ib
-from ibstrat.positions import load_positions, check_positions
 import cfg
-import pandas as pd
-from datetime import datetime, timedelta, date
-from ibstrat.chain import fetch_option_chain,find_next_closest_expiry
-from ibstrat.options import find_option_by_target_delta,find_option_by_target_strike
-import argparse
-from ibstrat.dteutil import calculate_expiry_date
-from ibstrat.trclass import get_trading_class_for_symbol
-import pandas_market_calendars as mcal
+from strategies import ConfigError, StrategyParams, load_schedules, require_entry_times
+from tradecal import is_friday_before_monday_holiday
+
+# asyncio, ib_async, ibstrat and the entry pipeline modules are imported inside the
+# functions that use them, so --help and blackout-day exits never pay for them.
 
 
 # Configure logging
@@ -33,119 +28,80 @@ logging.getLogger("ibstrat.options").setLevel(logging.ERROR)
 logging.getLogger("ibstrat.chain").setLevel(logging.ERROR)
 logging.getLogger("ibstrat.orders").setLevel(logging.ERROR)
 
-# NYSE calendar (covers US stock market holidays)
-nyse = mcal.get_calendar("NYSE")
+def open_double_calendar(symbol: str, params: StrategyParams, is_live: bool):
+    from ibstrat.ib_instance import ib
+    return ib.run(open_double_calendar_async(symbol, params, is_live))
 
-def is_friday_before_monday_holiday(date_str: str) -> bool:
+
+async def open_double_calendar_async(symbol: str, params: StrategyParams, is_live: bool, warmup=None):
     """
-    Return True if the given date string is a Friday immediately
-    before a Monday holiday on the US stock market calendar.
+    Select strikes and submit a double calendar for one symbol. With a prepared Warmup
+    the underlying, expiries and chain quotes come from its held subscriptions.
     """
-    # Support both YYYY-MM-DD and YYYYMMDD formats
-    if "-" in date_str:
-        d = datetime.strptime(date_str, "%Y-%m-%d").date()
-    else:
-        d = datetime.strptime(date_str, "%Y%m%d").date()
-
-    if d.weekday() != 4:  # must be Friday
-        return False
-
-    monday = d + timedelta(days=3)
-
-    # If Monday is not a valid trading day on the NYSE calendar, it's a holiday/closure.
-    # Use valid_days which returns a DatetimeIndex of open days.
-    monday_ts = pd.Timestamp(monday)
-    valid = nyse.valid_days(start_date=monday_ts, end_date=monday_ts)
-    return len(valid) == 0
-
-
-def open_double_calendar(symbol: str, params: dict, is_live: bool):
+    from ibstrat.trclass import get_trading_class_for_symbol
+    from aio import resolve_underlying_async, fetch_chain_snapshot_async
+    from dcal import submit_double_calendar_async
+    from tradecal import calendar_for_sec_type
+    from instrument import latency
+    from posindex import position_index
+
+    started_at = time.monotonic()
     logger.info(f"Starting Double Calendar Trade Submission for {symbol}")
     logger.debug(f"Strategy parameters: {params}")
 
     tr_class = get_trading_class_for_symbol(symbol)
 
     try:
-        # Qualify the underlying contract
-        if params["sec_type"] == 'FUT':
-            fut_date = get_front_month_contract_date(symbol, params["exchange"], params["mult"],
-                                                     calculate_expiry_date(params["long_call_expiry_days"]))
-            logger.debug(f"Front month contract date for {symbol}: {fut_date}")
+        if warmup is not None:
+            und_contract, expiries = warmup.und_contract, warmup.expiries
+            current_mid = warmup.mid()
+            logger.info(f"Current market price for {symbol}: {current_mid} (warm)")
         else:
-            fut_date = ''
-            logger.debug(f"No front month date required for {symbol}, secType: {params['sec_type']}")
-
-        und_contract = qualify_contract(
-            symbol=symbol,
-            lastTradeDateOrContractMonth=fut_date,
-            secType=params["sec_type"],
-            exchange=params["exchange"],
-            currency='USD'
-        )
-        logger.debug(f"Qualified underlying contract: {und_contract}")
-
-        # Fetch the current market mid-price
-        current_mid = get_current_mid_price(und_contract)
-        logger.info(f"Current market price for {symbol}: {current_mid}")
-
-        # Calculate expiry dates
-        logger.debug(f"short expiry days are set to: {params['short_put_expiry_days']} {params['short_call_expiry_days']} ")
-        logger.debug(f"long expiry days are set to: {params['long_put_expiry_days']} {params['long_call_expiry_days']} ")
-
-        short_put_expiry_date = find_next_closest_expiry(und_contract=und_contract,
-                                                         target_expiry=calculate_expiry_date(params["short_put_expiry_days"]),
-                                                         trading_class=tr_class)
-        short_call_expiry_date = find_next_closest_expiry(und_contract=und_contract,
-                                                         target_expiry=calculate_expiry_date(params["short_call_expiry_days"]),
-                                                         trading_class=tr_class)
-        long_put_expiry_date = find_next_closest_expiry(und_contract=und_contract,
-                                                         target_expiry=calculate_expiry_date(params["long_put_expiry_days"]),
-                                                         trading_class=tr_class)
-        long_call_expiry_date = find_next_closest_expiry(und_contract=und_contract,
-                                                         target_expiry=calculate_expiry_date(params["long_call_expiry_days"]),
-                                                         trading_class=tr_class)
+            resolved = await resolve_underlying_async(symbol, params, tr_class)
+            if resolved is None:
+                return None
+            und_contract, current_mid, expiries = resolved
+        short_put_expiry_date, short_call_expiry_date, long_put_expiry_date, long_call_expiry_date = expiries
 
         logger.debug(f"Expiry dates - Short Put: {short_put_expiry_date}, Long Put: {long_put_expiry_date}, "
                      f"Short Call: {short_call_expiry_date}, Long Call: {long_call_expiry_date}")
+        trading_calendar = calendar_for_sec_type(params.sec_type)
+        logger.debug(f"Trading-day DTE - Short Put: {trading_calendar.dte(short_put_expiry_date)}, "
+                     f"Long Put: {trading_calendar.dte(long_put_expiry_date)}, "
+                     f"Short Call: {trading_calendar.dte(short_call_expiry_date)}, "
+                     f"Long Call: {trading_calendar.dte(long_call_expiry_date)}")
 
         # Fetch option chain and find strikes
         logger.debug(f"Fetching option chains for {symbol}")
-        opt_exchange = params["opt_exchange"]
-        short_put_tickers = fetch_option_chain(und_contract, opt_exchange, short_put_expiry_date, current_mid,
-                                               trading_class=params['trading_class'])
-        if short_put_expiry_date == short_call_expiry_date:
-            short_call_tickers = short_put_tickers
-        else:
-            short_call_tickers = fetch_option_chain(und_contract, opt_exchange, short_call_expiry_date, current_mid,
-                                                    trading_class=params['trading_class'])
-
-        logger.debug(f"Option chains fetched. Calculating strikes across {len(short_call_tickers)} tickers")
-        print(short_call_tickers)
-        short_call_strike = find_option_by_target_delta(short_call_tickers, 'C', params["target_call_delta"],
-                                                        trading_class=params['trading_class']).contract.strike
+        opt_exchange = params.opt_exchange
+        with latency.span('chain_fetch', symbol):
+            chain = warmup.chain_snapshot(current_mid) if warmup is not None else None
+            if chain is None or not warmup.covers(chain):
+                chain = await fetch_chain_snapshot_async(und_contract, opt_exchange,
+                                                         quoted_expiries=[short_put_expiry_date, short_call_expiry_date],
+                                                         listed_expiries=[long_put_expiry_date, long_call_expiry_date],
+                                                         current_mid=current_mid, trading_class=params.trading_class)
+        logger.debug(f"Option chains fetched. Calculating strikes across {len(chain.array(short_call_expiry_date))} tickers")
+        with latency.span('delta_search', symbol):
+            short_call_strike = chain.strike_by_target_delta(short_call_expiry_date, 'C', params.target_call_delta)
+            short_put_strike = chain.strike_by_target_delta(short_put_expiry_date, 'P', params.target_put_delta)
         logger.debug(f"short call found: {short_call_strike}")
-
-        short_put_strike = find_option_by_target_delta(short_put_tickers, 'P', params["target_put_delta"],
-                                                       trading_class=params['trading_class']).contract.strike
         logger.debug(f"short put found: {short_put_strike}")
 
-        long_call = find_option_by_target_strike(contract=und_contract,
-                                                        right='C',
-                                                        exchange=params["opt_exchange"],
-                                                        expiry=long_call_expiry_date,
-                                                        target_strike=short_call_strike,
-                                                        trading_class=params['trading_class'])
-        logger.debug(f"long call found: {long_call.strike}")
-        long_call_strike = long_call.strike
-
-        long_put = find_option_by_target_strike(contract=und_contract,
-                                                        right='P',
-                                                        exchange=params["opt_exchange"],
-                                                        expiry=long_put_expiry_date,
-                                                        target_strike=short_put_strike,
-                                                        trading_class=params['trading_class'])
-        logger.debug(f"long put found: {long_put.strike}")
-        long_put_strike = long_put.strike
+        if short_call_strike is None or short_put_strike is None:
+            logger.error(f"Unable to select short strikes by delta for {symbol}, aborting trade")
+            return None
+
+        # Long strikes are matched locally against the listed strikes of the long expiries
+        with latency.span('long_strikes', symbol):
+            long_call_strike = chain.nearest_strike(long_call_expiry_date, 'C', short_call_strike)
+            long_put_strike = chain.nearest_strike(long_put_expiry_date, 'P', short_put_strike)
+        logger.debug(f"long call found: {long_call_strike}")
+        logger.debug(f"long put found: {long_put_strike}")
+
+        if long_call_strike is None or long_put_strike is None:
+            logger.error(f"Unable to match long strikes for {symbol}, aborting trade")
+            return None
 
         logger.debug(f"Calculated strikes - Short Call: {short_call_strike}, Short Put: {short_put_strike}, "
                      f"Long Call: {long_call_strike}, Long Put: {long_put_strike}")
@@ -160,14 +116,15 @@ def open_double_calendar(symbol: str, params: dict, is_live: bool):
         logger.debug(f"Position check list: {pos_check_list}")
 
         # Check existing positions
-        existing_pos_open = check_positions(symbol, pos_check_list)
+        with latency.span('position_check', symbol):
+            existing_pos_open = position_index.check(symbol, pos_check_list)
         if existing_pos_open:
             logger.warning(f"We have potential collisions on strikes, aborting trade")
             return None
 
         # Submit the trade
         logger.info(f"Submitting Double Calendar trade for {symbol}")
-        trade = submit_double_calendar(
+        trade = await submit_double_calendar_async(
             und_contract=und_contract,
             short_put_strike=short_put_strike,
             short_call_strike=short_call_strike,
@@ -178,15 +135,81 @@ def open_double_calendar(symbol: str, params: dict, is_live: bool):
             short_call_expiry_date=short_call_expiry_date,
             long_call_expiry_date=long_call_expiry_date,
             is_live=is_live,
-            strategy_params=params
+            strategy_params=params,
+            started_at=started_at
         )
         logger.info(f"Trade submission result: {trade}")
+        return trade
     except Exception as e:
         logger.exception(f"Error during trade submission for {symbol}: {e}")
 
 
+async def run_configs_async(configs: list, is_live: bool, concurrency: int = cfg.max_concurrent_symbols,
+                            warmups: dict = None) -> dict:
+    """
+    Open double calendars for every symbol of several (name, symbols, params) schedule
+    configurations concurrently on the ib_async event loop.
+
+    A pool of `concurrency` workers pulls entries from a queue, with the entries of a
+    symbol queued next to each other across configurations so their identical
+    requests are shared through the request cache. Gateway pacing is enforced per
+    request by the pacer of its connection, and the run's alerts go out as one summary.
+    Returns a dict of (name, symbol) -> trade.
+    """
+    import asyncio
+    from notify import notifier
+    from reqcache import request_cache
+
+    warmups = warmups or {}
+    entries = [(name, symbol, params[symbol]) for name, symbols, params in configs for symbol in symbols]
+    first_seen = {}
+    for _, symbol, _ in entries:
+        first_seen.setdefault(symbol, len(first_seen))
+    queue = asyncio.Queue()
+    for entry in sorted(entries, key=lambda entry: first_seen[entry[1]]):
+        queue.put_nowait(entry)
+    results = {}
+
+    async def worker():
+        while not queue.empty():
+            name, symbol, symbol_params = queue.get_nowait()
+            started_at = time.monotonic()
+            results[(name, symbol)] = await open_double_calendar_async(symbol, symbol_params, is_live,
+                                                                       warmups.get(symbol))
+            logger.info(f"Finished {f'{name} ' if name else ''}{symbol} in {time.monotonic() - started_at:.2f}s")
+
+    try:
+        async with notifier.batch():
+            await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(entries))))))
+    finally:
+        request_cache.clear()
+    return results
+
+
+async def run_symbols_async(symbols: list, params: dict, is_live: bool,
+                            concurrency: int = cfg.max_concurrent_symbols, warmups: dict = None) -> dict:
+    """Open double calendars for the symbols of one configuration. Returns a dict of symbol -> trade."""
+    results = await run_configs_async([(None, symbols, params)], is_live, concurrency, warmups)
+    return {symbol: trade for (_, symbol), trade in results.items()}
+
+
+async def run_symbols_with_warmup_async(symbols: list, params: dict, is_live: bool, concurrency: int,
+                                        entry_time: str) -> dict:
+    """Do the time-independent work for all symbols now, then run the entries at entry_time."""
+    from warmup import warm_up_symbols_async, sleep_until_async
+
+    warmups = await warm_up_symbols_async(symbols, params)
+    try:
+        await sleep_until_async(entry_time)
+        return await run_symbols_async(symbols, params, is_live, concurrency, warmups)
+    finally:
+        for warmup in warmups.values():
+            warmup.release()
+
+
 def main():
-    parser = argparse.ArgumentParser(description="Process double calendar options strategies.")
+    parser = argparse.ArgumentParser(description="Process double calendar options strategies. Several configuration "
+                                                 "flags can be given together to run them in one process.")
     parser.add_argument('-l', '--live', action='store_true', help="Use live orders?")
     parser.add_argument('-t', '--test', action='store_true', help="Use test TWS configuration.")
     parser.add_argument('-m24', '--monday24', action='store_true', help="Submit Monday Double Calendar using Monday 24 config.")
@@ -196,50 +219,94 @@ def main():
     parser.add_argument('-f57', '--friday57', action='store_true', help="Submit Friday Double Calendar using 57 config.")
     parser.add_argument('-f67', '--friday67', action='store_true', help="Submit Friday Double Calendar using 67 config.")
     parser.add_argument('-s', '--symbol', type=str, help="Trade a specific symbol only (overrides config list).")
+    parser.add_argument('--warmup-until', type=str, metavar='HH:MM:SS',
+                        help="Prepare everything now and fire the entries at this local time.")
+    parser.add_argument('-c', '--concurrency', type=int, default=cfg.max_concurrent_symbols,
+                        help="Number of symbols worked on at the same time.")
+    parser.add_argument('--sim', action='store_true',
+                        help="Run against the offline gateway simulator (simgw.py) instead of TWS.")
+    parser.add_argument('--daemon', action='store_true',
+                        help="Stay connected and fire the scheduled entries at their times (all, or the selected configs).")
+    parser.add_argument('--control', type=str, metavar='COMMAND',
+                        help="Send a command to a running daemon: status, trigger NAME, skip NAME, unskip NAME, "
+                             "reload or stop.")
+    parser.add_argument('--check-config', nargs='?', const='', metavar='PATH',
+                        help="Validate the strategy configuration (cfg.strategy_config_path, cfg.schedules, "
+                             "or the given TOML/YAML file) and exit.")
 
     args = parser.parse_args()
 
-    # Collect selected config flags
-    selected_configs = []
-    if args.friday57:
-        selected_configs.append(("Friday57", cfg.fri_57dc_symbols, cfg.fri_57dc_params))
-        if is_friday_before_monday_holiday(date.today().strftime("%Y%m%d")):
-            logger.warning(f"Blackout date: Friday DC disabled for {date.today()}")
-            sys.exit(0)
-    if args.friday67:
-        selected_configs.append(("Friday67", cfg.fri_67dc_symbols, cfg.fri_67dc_params))
-        if is_friday_before_monday_holiday(date.today().strftime("%Y%m%d")):
-            logger.warning(f"Blackout date: Friday DC disabled for {date.today()}")
-            sys.exit(0)
-    if args.monday24:
-        selected_configs.append(("Monday24", cfg.mon_dc24_symbols, cfg.mon_dc24_params))
-    if args.monday37:
-        selected_configs.append(("Monday37", cfg.mon_dc37_symbols, cfg.mon_dc37_params))
-    if args.wednesday78:
-        selected_configs.append(("Wednesday78", cfg.wed_dc78_symbols, cfg.wed_dc78_params))
-    if args.wednesday15:
-        selected_configs.append(("Wednesday15", cfg.wed_dc15_symbols, cfg.wed_dc15_params))
-
-    # Enforce exactly one config flag always
-    if len(selected_configs) != 1:
-        logger.error("You must specify exactly one configuration: -f57, -f67, -m24, -m37, -w15 or -w78.")
+    if args.control:
+        from daemon import send_command
+        try:
+            print(send_command(args.control))
+        except OSError as e:
+            logger.error(f"Unable to reach the daemon control socket: {e}")
+            sys.exit(1)
         return
 
-    cfg_name, cfg_symbols, cfg_params = selected_configs[0]
+    started = time.perf_counter()
+    try:
+        schedules = load_schedules(args.check_config)
+    except ConfigError as e:
+        logger.error(f"Invalid strategy configuration, {e}")
+        sys.exit(1)
+    if args.check_config is not None:
+        print(f"Strategy configuration OK: {len(schedules)} schedules, "
+              f"{sum(len(s.params) for s in schedules.values())} symbol configs, "
+              f"checked in {(time.perf_counter() - started) * 1000:.1f}ms")
+        return
+
+    # Collect selected config flags; several may be given to run them in one process
+    friday_blackout = not args.daemon and (args.friday57 or args.friday67) and \
+        is_friday_before_monday_holiday(date.today().strftime("%Y%m%d"))
+    if friday_blackout:
+        logger.warning(f"Blackout date: Friday DC disabled for {date.today()}")
+    selected_names = [name for name, chosen in (("Friday57", args.friday57 and not friday_blackout),
+                                                ("Friday67", args.friday67 and not friday_blackout),
+                                                ("Monday24", args.monday24), ("Monday37", args.monday37),
+                                                ("Wednesday78", args.wednesday78),
+                                                ("Wednesday15", args.wednesday15)) if chosen]
+    undefined = [name for name in selected_names if name not in schedules]
+    if undefined:
+        logger.error(f"No schedule named {', '.join(undefined)} in the strategy configuration.")
+        sys.exit(1)
+    selected_configs = [schedules[name].config for name in selected_names]
+
+    if args.daemon:
+        if args.symbol or args.warmup_until:
+            logger.error("--daemon takes its symbols and entry times from the schedules, not -s or --warmup-until.")
+            return
+        daemon_schedules = [name for name, _, _ in selected_configs] or list(schedules)
+        try:
+            require_entry_times(schedules, daemon_schedules)
+        except ConfigError as e:
+            logger.error(f"Daemon mode needs an entry time for every schedule, {e}")
+            sys.exit(1)
+    elif not selected_configs:
+        if friday_blackout:
+            sys.exit(0)
+        logger.error("You must specify at least one configuration: -f57, -f67, -m24, -m37, -w15 or -w78.")
+        return
+    if args.warmup_until and len(selected_configs) > 1:
+        logger.error("--warmup-until supports a single configuration.")
+        return
 
-    # If -s is provided, restrict to that symbol within the chosen config
-    if args.symbol:
+    if args.daemon:
+        logger.info(f"Running daemon for {', '.join(daemon_schedules)}")
+    # If -s is provided, restrict every chosen config to that symbol
+    elif args.symbol:
         symbol = args.symbol.strip().upper()
-        if symbol not in cfg_params:
-            logger.error(f"Symbol '{symbol}' not found in {cfg_name} parameters.")
+        missing = [name for name, _, cfg_params in selected_configs if symbol not in cfg_params]
+        for name in missing:
+            logger.error(f"Symbol '{symbol}' not found in {name} parameters.")
+        if missing:
             return
-        symbols = [symbol]
-        params = {symbol: cfg_params[symbol]}
-        logger.info(f"Running single symbol DC for {symbol} using {cfg_name}")
+        selected_configs = [(name, [symbol], {symbol: cfg_params[symbol]})
+                            for name, _, cfg_params in selected_configs]
+        logger.info(f"Running single symbol DC for {symbol} using {', '.join(name for name, _, _ in selected_configs)}")
     else:
-        symbols = cfg_symbols
-        params = cfg_params
-        logger.info(f"Running {cfg_name}")
+        logger.info(f"Running {', '.join(name for name, _, _ in selected_configs)}")
 
     live_orders = args.live
     use_test_tws = args.test
@@ -247,19 +314,48 @@ def main():
     logger.info(f"Live trading mode: {'Enabled' if live_orders else 'Disabled'}")
     logger.info(f"Test TWS mode: {'Enabled' if use_test_tws else 'Disabled'}")
 
-    # Connect to the appropriate IBKR instance
+    if args.sim:
+        from simgw import install
+        install()
+
+    from ib_async import util
+    from ibstrat.ib_instance import connect_to_ib, ib
+    from ibpool import pool
+    from posindex import position_index
+
+    # Connect to the appropriate IBKR instance: the order connection, then the market data lanes
     if use_test_tws:
         connect_to_ib(cfg.test_ib_host, cfg.test_ib_port, cfg.test_ib_clientid, 2)
+        ib.run(pool.connect_async(cfg.test_ib_host, cfg.test_ib_port, cfg.test_ib_market_data_clientids,
+                                  cfg.test_ib_clientid))
         logger.info("Connected to test TWS configuration.")
     else:
         connect_to_ib(cfg.ib_host, cfg.ib_port, cfg.ib_clientid, 2)
+        ib.run(pool.connect_async(cfg.ib_host, cfg.ib_port, cfg.ib_market_data_clientids, cfg.ib_clientid))
         logger.info("Connected to live TWS configuration.")
 
-    load_positions()
+    position_index.start(pool.orders)
 
-    # Execute the selected action
-    for symbol in symbols:
-        open_double_calendar(symbol, params[symbol], live_orders)
+    # Execute the selected action; legacy ibstrat helpers still make blocking calls inside the loop
+    util.patchAsyncio()
+    if args.daemon:
+        from daemon import Daemon
+        ib.run(Daemon(daemon_schedules, live_orders, args.concurrency).run())
+        return
+    run_started = time.monotonic()
+    if args.warmup_until:
+        _, symbols, params = selected_configs[0]
+        results = ib.run(run_symbols_with_warmup_async(symbols, params, live_orders, args.concurrency,
+                                                       args.warmup_until))
+    else:
+        results = ib.run(run_configs_async(selected_configs, live_orders, args.concurrency))
+    logger.info(f"All {len(results)} entries processed in {time.monotonic() - run_started:.2f}s")
+    from instrument import latency
+    from notify import notifier
+    from tradewriter import trade_log
+    ib.run(latency.report_async(cfg.trade_fill_timeout))
+    ib.run(trade_log.drain())
+    ib.run(notifier.drain())
 
 
 if __name__ == "__main__":
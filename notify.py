@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+import cfg
+
+logger = logging.getLogger('DC')
+
+PUSHOVER_URL = 'https://api.pushover.net/1/messages.json'
+
+# Pushover rejects messages longer than this
+MAX_MESSAGE_LENGTH = 1024
+
+
+def summary(messages: list) -> str:
+    text = messages[0] if len(messages) == 1 else f"{len(messages)} alerts:\n" + "\n".join(messages)
+    return text if len(text) <= MAX_MESSAGE_LENGTH else text[:MAX_MESSAGE_LENGTH - 3] + '...'
+
+
+class Notifier:
+    """
+    Pushover alerts sent by a background worker, so `notify` costs nothing on the order path.
+
+    Alerts raised inside a `batch()` (one entry run) are held and sent as one summary
+    when the run ends; alerts outside a batch wait cfg.pushover_coalesce_window for
+    company. Messages are at least cfg.pushover_min_interval apart, and whatever arrives
+    in the meantime joins the next one, so a multi-symbol run never trips the provider's
+    rate limit. Messages go out over one reused HTTP session when cfg.pushover_token and
+    cfg.pushover_user are set, otherwise through ibstrat.pushover.
+    """
+
+    def __init__(self):
+        self._pending = []
+        self._batches = 0
+        self._wake = None
+        self._worker = None
+        self._session = None
+        self._last_sent = 0.0
+
+    def _start(self):
+        if self._worker is None or self._worker.done():
+            self._wake = asyncio.Event()
+            self._worker = asyncio.ensure_future(self._run())
+
+    def notify(self, message: str):
+        """Queue an alert; returns at once."""
+        if not cfg.pushover_alerts:
+            return
+        self._pending.append(message)
+        try:
+            self._start()
+        except RuntimeError:  # no running event loop: send inline
+            self._send_now(self._take())
+            return
+        if not self._batches:
+            self._wake.set()
+
+    @asynccontextmanager
+    async def batch(self):
+        """Hold alerts raised in the block and send them as one summary when it ends."""
+        self._batches += 1
+        try:
+            yield
+        finally:
+            self._batches -= 1
+            if not self._batches and self._pending:
+                self._wake.set()
+
+    def _take(self) -> list:
+        messages, self._pending = self._pending, []
+        return messages
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            await asyncio.sleep(max(cfg.pushover_coalesce_window,
+                                    self._last_sent + cfg.pushover_min_interval - time.monotonic()))
+            if self._batches or not self._pending:
+                continue
+            messages = self._take()
+            await asyncio.to_thread(self._send_now, messages)
+
+    def _send_now(self, messages: list):
+        text = summary(messages)
+        self._last_sent = time.monotonic()
+        try:
+            if cfg.pushover_token and cfg.pushover_user:
+                if self._session is None:
+                    import requests
+                    self._session = requests.Session()
+                response = self._session.post(PUSHOVER_URL, timeout=cfg.pushover_timeout,
+                                              data={'token': cfg.pushover_token, 'user': cfg.pushover_user,
+                                                    'message': text})
+                response.raise_for_status()
+            else:
+                from ibstrat.pushover import send_notification
+                send_notification(text)
+            logger.debug(f"Sent Pushover alert with {len(messages)} messages")
+        except Exception as e:
+            logger.error(f"Pushover alert failed, dropped {len(messages)} messages: {e}")
+
+    async def drain(self):
+        """Send anything still held, then stop the worker. Called before the process exits."""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        self._worker = None
+        if self._pending:
+            await asyncio.to_thread(self._send_now, self._take())
+
+
+notifier = Notifier()
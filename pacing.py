@@ -0,0 +1,53 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger('DC')
+
+
+class Pacer:
+    """
+    Client-side pacing for the requests sent on one IB connection.
+
+    IB disconnects clients that exceed its message rate (50 msgs/sec per client), so
+    every request issued by the async pipeline reserves its messages here first. A
+    token bucket charges each request its real message count: one larger than the
+    bucket goes out once the bucket is full and leaves the rest as a debt that later
+    requests wait to be refilled, so the average rate holds for bursts of any size.
+    Nothing is held while a request waits for its answer.
+    """
+
+    def __init__(self, max_msg_rate: float):
+        self.max_msg_rate = max_msg_rate
+        self._tokens = float(max_msg_rate)
+        self._last_refill = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.max_msg_rate, self._tokens + (now - self._last_refill) * self.max_msg_rate)
+        self._last_refill = now
+
+    async def acquire(self, cost: int = 1):
+        """Wait until `cost` messages can be sent without exceeding the message rate, and charge them."""
+        need = min(cost, self.max_msg_rate)
+        async with self._lock:
+            self._refill()
+            while self._tokens < need:
+                wait = (need - self._tokens) / self.max_msg_rate
+                logger.debug(f"Pacing: waiting {wait:.3f}s for {cost} message slots")
+                await asyncio.sleep(wait)
+                self._refill()
+            self._tokens -= cost
+
+    def charge(self, cost: int = 1):
+        """Charge `cost` messages already sent (cancellations, say) without waiting."""
+        self._refill()
+        self._tokens -= cost
+
+    @asynccontextmanager
+    async def slot(self, cost: int = 1):
+        """Reserve `cost` messages before the block sends them."""
+        await self.acquire(cost)
+        yield
@@ -0,0 +1,96 @@
+import logging
+
+from ib_async import IB
+
+logger = logging.getLogger('DC')
+
+# Position types of a check-list leg and the sign of a held position that collides with it,
+# as in ibstrat check_positions (tests/test_posindex.py holds the two to the same answers)
+COLLIDING_SIGN = {'long': 1, 'short': -1}
+
+
+def leg_key(symbol: str, right: str, expiry: str, strike: float) -> tuple:
+    return symbol, right, expiry[:8], float(strike)
+
+
+class PositionIndex:
+    """
+    Option positions of the order connection, indexed by (symbol, right, expiry, strike).
+
+    Built from the positions IB sends at connect and kept current from IB position
+    and execution events, so a strike-collision check is a few dict lookups and sees
+    positions opened earlier in the same run. Positions are held per (account, conId):
+    a position update sets the absolute size, an execution adjusts it at once, ahead
+    of the position update that follows it. The index is rebuilt after a reconnect.
+    The collision rule is that of ibstrat check_positions, which this replaces on the
+    entry path: it reloaded the whole position snapshot to see new fills.
+    """
+
+    def __init__(self):
+        self._ib = None
+        self._held = {}  # (account, conId) -> (key, position)
+        self._index = {}  # key -> net position over accounts
+
+    def start(self, ib: IB):
+        self._ib = ib
+        ib.positionEvent += self._on_position
+        ib.execDetailsEvent += self._on_execution
+        ib.connectedEvent += self.rebuild
+        self.rebuild()
+        return self
+
+    def stop(self):
+        if self._ib is not None:
+            self._ib.positionEvent -= self._on_position
+            self._ib.execDetailsEvent -= self._on_execution
+            self._ib.connectedEvent -= self.rebuild
+            self._ib = None
+
+    def rebuild(self):
+        self._held = {}
+        self._index = {}
+        for position in self._ib.positions():
+            self._set(position.account, position.contract, position.position)
+        logger.info(f"Position index holds {len(self._index)} option strikes")
+
+    def _set(self, account: str, contract, size: float):
+        if contract.secType not in ('OPT', 'FOP'):
+            return
+        key = leg_key(contract.symbol, contract.right, contract.lastTradeDateOrContractMonth, contract.strike)
+        _, previous = self._held.pop((account, contract.conId), (key, 0))
+        if size:
+            self._held[(account, contract.conId)] = (key, size)
+        net = self._index.get(key, 0) - previous + size
+        if net:
+            self._index[key] = net
+        else:
+            self._index.pop(key, None)
+
+    def _on_position(self, position):
+        self._set(position.account, position.contract, position.position)
+
+    def _on_execution(self, trade, fill):
+        execution = fill.execution
+        held = self._held.get((execution.acctNumber, fill.contract.conId), (None, 0))[1]
+        change = execution.shares if execution.side == 'BOT' else -execution.shares
+        self._set(execution.acctNumber, fill.contract, held + change)
+
+    def position(self, symbol: str, right: str, expiry: str, strike: float) -> float:
+        return self._index.get(leg_key(symbol, right, expiry, strike), 0)
+
+    def check(self, symbol: str, pos_check_list: list) -> bool:
+        """
+        Return True if any leg of the check list collides with a held position: a 'long'
+        leg with a long position on its strike, a 'short' leg with a short one.
+        """
+        collision = False
+        for leg in pos_check_list:
+            held = self.position(symbol, leg['right'], leg['expiry'], leg['strike'])
+            if held * COLLIDING_SIGN[leg['position_type']] > 0:
+                logger.warning(f"Strike collision for {symbol}: {leg['position_type']} check on {leg['right']} "
+                               f"{leg['strike']} {leg['expiry']}, holding {held}")
+                collision = True
+        return collision
+
+
+position_index = PositionIndex()
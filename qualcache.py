@@ -0,0 +1,90 @@
+import dataclasses
+import json
+import logging
+import os
+import sqlite3
+import time
+from datetime import date
+
+from ib_async import Contract
+
+import cfg
+
+logger = logging.getLogger('DC')
+
+# Contract fields that identify a qualification request
+KEY_FIELDS = ('symbol', 'secType', 'lastTradeDateOrContractMonth', 'strike', 'right',
+              'tradingClass', 'multiplier', 'exchange', 'currency')
+
+# Contract fields that are not plain values and are never needed for single-leg contracts
+SKIP_FIELDS = ('comboLegs', 'deltaNeutralContract')
+
+
+class QualificationCache:
+    """
+    Persistent cache of qualified contracts, stored in a local SQLite file.
+
+    Entries are keyed by the fields of the contract as it was requested, so a warm run
+    resolves previously seen underlyings and strikes without a gateway round-trip.
+    Entries for dated contracts expire after the contract's expiry; undated ones
+    (stocks, indexes) after cfg.qualification_cache_max_age_days.
+    """
+
+    def __init__(self, path: str):
+        if path != ':memory:' and not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+        self.path = path
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS contracts ("
+                " symbol TEXT, secType TEXT, lastTradeDateOrContractMonth TEXT, strike REAL, right TEXT,"
+                " tradingClass TEXT, multiplier TEXT, exchange TEXT, currency TEXT,"
+                " expires TEXT, created REAL, contract TEXT,"
+                " PRIMARY KEY (symbol, secType, lastTradeDateOrContractMonth, strike, right,"
+                " tradingClass, multiplier, exchange, currency))")
+            self.purge_expired()
+        return self._conn
+
+    @staticmethod
+    def key(contract) -> tuple:
+        return tuple(getattr(contract, field) or ('' if field != 'strike' else 0.0) for field in KEY_FIELDS)
+
+    def get(self, contract):
+        """Return a cached qualified copy of the requested contract, or None."""
+        key = self.key(contract)
+        where = " AND ".join(f"{field} = ?" for field in KEY_FIELDS)
+        row = self.conn.execute(f"SELECT contract FROM contracts WHERE {where}", key).fetchone()
+        if row is None:
+            return None
+        logger.debug(f"Qualification cache hit for {key}")
+        return Contract.create(**json.loads(row[0]))
+
+    def put(self, requested, qualified):
+        """Store the qualified contract under the fields of the requested one."""
+        fields = {f.name: getattr(qualified, f.name) for f in dataclasses.fields(qualified)
+                  if f.name not in SKIP_FIELDS}
+        expires = (qualified.lastTradeDateOrContractMonth or '')[:8] or None
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO contracts ({', '.join(KEY_FIELDS)}, expires, created, contract)"
+            f" VALUES ({', '.join('?' * (len(KEY_FIELDS) + 3))})",
+            self.key(requested) + (expires, time.time(), json.dumps(fields)))
+        self.conn.commit()
+
+    def purge_expired(self):
+        """Drop entries for expired contracts and undated entries older than the max age."""
+        today = date.today().strftime("%Y%m%d")
+        oldest = time.time() - cfg.qualification_cache_max_age_days * 86400
+        deleted = self.conn.execute(
+            "DELETE FROM contracts WHERE (expires IS NOT NULL AND expires < ?)"
+            " OR (expires IS NULL AND created < ?)", (today, oldest)).rowcount
+        self.conn.commit()
+        if deleted:
+            logger.debug(f"Purged {deleted} expired qualification cache entries")
+
+
+qualification_cache = QualificationCache(cfg.qualification_cache_path)
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import random
+
+from ib_async import OrderStatus
+from ib_async.util import UNSET_DOUBLE
+
+import cfg
+
+logger = logging.getLogger('DC')
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Full-jitter exponential backoff: a random delay between 0 and
+    cfg.ib_reconnect_base_delay * 2**attempt, capped at cfg.ib_reconnect_max_delay.
+    """
+    return random.uniform(0, min(cfg.ib_reconnect_max_delay, cfg.ib_reconnect_base_delay * 2 ** attempt))
+
+
+class ConnectionWatchdog:
+    """
+    Keeps one IB connection alive and resumes its session after a drop.
+
+    A heartbeat (reqCurrentTime) every cfg.ib_watchdog_interval seconds detects a
+    connection that is up but no longer answering; it is then dropped deliberately.
+    On any disconnect the open trades and streaming market data subscriptions are
+    captured before ib_async clears its state, the connection is re-established with
+    jittered exponential backoff, and the session is resumed onto the same Trade and
+    Ticker objects, so code waiting on their events carries on unaware of the blip.
+    """
+
+    def __init__(self, ib, host: str, port: int, clientid: int, readonly: bool = False):
+        self.ib = ib
+        self.host = host
+        self.port = port
+        self.clientid = clientid
+        self.readonly = readonly
+        self._trades = []
+        self._tickers = []
+        self._reconnect_task = None
+        self._heartbeat_task = None
+        self._stopped = False
+        self._connection_closed = None
+
+    def start(self):
+        # ib_async resets its trades and tickers in connectionClosed, capture them first
+        self._connection_closed = self.ib.wrapper.connectionClosed
+
+        def connection_closed():
+            self._capture_session()
+            self._connection_closed()
+
+        self.ib.wrapper.connectionClosed = connection_closed
+        self.ib.disconnectedEvent += self._on_disconnected
+        self._heartbeat_task = asyncio.ensure_future(self._heartbeat())
+        return self
+
+    def stop(self):
+        self._stopped = True
+        self.ib.disconnectedEvent -= self._on_disconnected
+        if self._connection_closed is not None:
+            self.ib.wrapper.connectionClosed = self._connection_closed
+        for task in (self._heartbeat_task, self._reconnect_task):
+            if task is not None:
+                task.cancel()
+
+    def _capture_session(self):
+        if self._trades or self._tickers:
+            return  # already captured for this outage
+        self._trades = [trade for trade in self.ib.openTrades() if trade.order.orderId > 0]
+        self._tickers = list(self.ib.wrapper.ticker2ReqId['mktData'])
+        logger.warning(f"Connection {self.clientid} lost with {len(self._trades)} open trades and "
+                       f"{len(self._tickers)} market data subscriptions")
+
+    def _on_disconnected(self):
+        if self._stopped or (self._reconnect_task is not None and not self._reconnect_task.done()):
+            return
+        self._reconnect_task = asyncio.ensure_future(self._reconnect())
+
+    async def _heartbeat(self):
+        while not self._stopped:
+            await asyncio.sleep(cfg.ib_watchdog_interval)
+            if not self.ib.isConnected() or (self._reconnect_task is not None and not self._reconnect_task.done()):
+                continue
+            try:
+                await asyncio.wait_for(self.ib.reqCurrentTimeAsync(), cfg.ib_watchdog_timeout)
+            except (asyncio.TimeoutError, ConnectionError):
+                logger.warning(f"Connection {self.clientid} not answering heartbeat, reconnecting")
+                self._capture_session()
+                self.ib.disconnect()
+
+    async def _reconnect(self):
+        attempt = 0
+        while not self._stopped:
+            delay = backoff_delay(attempt)
+            logger.info(f"Reconnecting client {self.clientid} in {delay:.1f}s (attempt {attempt + 1})")
+            await asyncio.sleep(delay)
+            self._seed_trades()
+            try:
+                await self.ib.connectAsync(self.host, self.port, self.clientid, readonly=self.readonly)
+            except Exception as e:
+                logger.warning(f"Reconnect attempt {attempt + 1} for client {self.clientid} failed: {e}")
+                attempt += 1
+                if cfg.ib_reconnect_max_attempts and attempt >= cfg.ib_reconnect_max_attempts:
+                    logger.error(f"Giving up reconnecting client {self.clientid} after {attempt} attempts")
+                    return
+                continue
+            await self._resume()
+            return
+
+    def _seed_trades(self):
+        """Put the captured trades back so the open-order sync on connect updates them in place."""
+        wrapper = self.ib.wrapper
+        for trade in self._trades:
+            wrapper.trades[(trade.order.clientId, trade.order.orderId)] = trade
+            if trade.order.permId:
+                wrapper.permId2Trade[trade.order.permId] = trade
+
+    async def _resume(self):
+        trades, self._trades = self._trades, []
+        tickers, self._tickers = self._tickers, []
+
+        # Orders that finished during the outage are not in the open-order sync; take their
+        # final state from the completed orders and replay it on the captured trades
+        if trades and not self.readonly:
+            completed = {t.order.permId: t for t in await self.ib.reqCompletedOrdersAsync(False)}
+            for trade in trades:
+                final = completed.get(trade.order.permId)
+                if final is None or trade.isDone():
+                    continue
+                logger.info(f"Order {trade.order.orderId} finished during the outage: {final.orderStatus.status}")
+                trade.orderStatus.status = final.orderStatus.status
+                if final.order.filledQuantity != UNSET_DOUBLE:
+                    trade.orderStatus.filled = final.order.filledQuantity
+                trade.statusEvent.emit(trade)
+                if trade.orderStatus.status == OrderStatus.Filled:
+                    trade.filledEvent.emit(trade)
+                elif trade.orderStatus.status == OrderStatus.Cancelled:
+                    trade.cancelledEvent.emit(trade)
+
+        # Re-subscribe onto the same Ticker objects so existing updateEvent handlers keep firing
+        for ticker in tickers:
+            self.ib.wrapper.tickers[hash(ticker.contract)] = ticker
+            self.ib.reqMktData(ticker.contract, '', False, False)
+        logger.info(f"Client {self.clientid} reconnected: {len(trades)} trades re-synced, "
+                    f"{len(tickers)} market data subscriptions restored")
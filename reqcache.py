@@ -0,0 +1,52 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger('DC')
+
+
+class RequestCache:
+    """
+    Gateway requests shared between the entries of one run.
+
+    When several schedule configurations run together they resolve the same
+    underlyings, expiries and chains. Each request goes through `get` under a key
+    describing it: the first caller starts the request, callers that arrive while it
+    is in flight await the same task, and later callers reuse the result while it is
+    younger than their max_age (None reuses it for the rest of the run). Failed
+    requests are dropped so the next caller retries. The cache is cleared at the end
+    of every run.
+    """
+
+    def __init__(self):
+        self._entries = {}  # key -> (started monotonic, task)
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key, factory, max_age: float = None):
+        """Return the result of factory() for key, starting the request only if no usable one exists."""
+        entry = self._entries.get(key)
+        if entry is not None and (max_age is None or time.monotonic() - entry[0] <= max_age):
+            self.hits += 1
+            logger.debug(f"Shared request for {key}")
+            task = entry[1]
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(factory())
+            self._entries[key] = (time.monotonic(), task)
+            task.add_done_callback(lambda t: self._drop_failed(key, t))
+        # A caller that is cancelled must not cancel the request for the others
+        return await asyncio.shield(task)
+
+    def _drop_failed(self, key, task):
+        if (task.cancelled() or task.exception() is not None) and self._entries.get(key, (None, None))[1] is task:
+            del self._entries[key]
+
+    def clear(self):
+        if self.hits:
+            logger.info(f"Shared requests: {self.hits} answered from {self.misses} sent to the gateway")
+        self._entries = {}
+        self.hits = self.misses = 0
+
+
+request_cache = RequestCache()
@@ -0,0 +1,537 @@
+"""
+Offline stand-in for the IB gateway.
+
+SimIB is an ib_async IB whose requests are answered from a simulated market instead
+of a TWS socket: qualification, contract details, secdef option chains, snapshot and
+streaming tickers (with model greeks), combo quotes, order placement, modification
+and fills, all with injected latency. Underlyings follow a random walk and options
+are priced with greeks.py, so strike selection, combo pricing and the order
+adjusters see a moving market.
+
+    python main.py --sim -f57 -l          # full entry flow against the simulator
+
+install() must run before any module that binds `ibstrat.ib_instance.ib` is
+imported; main.py does this for --sim since its trading imports are lazy.
+Instruments are taken from the compiled strategy schedules, spot prices from
+cfg.sim_spot_prices.
+"""
+import asyncio
+import itertools
+import logging
+import random
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from math import exp, isnan, nan, sqrt
+
+from ib_async import (IB, ComboLeg, CommissionReport, Contract, ContractDetails, Execution, Fill, OptionChain,
+                      OptionComputation, OrderStatus, Ticker, Trade, TradeLogEntry)
+from ib_async.objects import Position
+
+import cfg
+import greeks
+from tradecal import calendar_for_sec_type
+
+logger = logging.getLogger('DC')
+
+ACCOUNT = 'SIM'
+TRADING_SECONDS_PER_YEAR = 252 * 6.5 * 3600
+
+
+@dataclass
+class SimInstrument:
+    """One simulated underlying and its option chain."""
+    symbol: str
+    sec_type: str
+    exchange: str
+    opt_exchange: str
+    multiplier: str
+    trading_class: str
+    spot: float
+    iv: float
+    strike_step: float
+    expiries: list = field(default_factory=list)
+    futures: list = field(default_factory=list)
+    listed_strikes: list = field(init=False, default_factory=list)
+
+    def __post_init__(self):
+        # Strikes are listed once around the starting spot, as an exchange lists them for the day
+        low = self.spot * (1 - cfg.sim_strike_range_pct)
+        high = self.spot * (1 + cfg.sim_strike_range_pct)
+        self.listed_strikes = [round(k * self.strike_step, 2)
+                               for k in range(int(low / self.strike_step) + 1, int(high / self.strike_step) + 1)]
+        self._strike_set = set(self.listed_strikes)
+
+    def is_listed(self, strike: float) -> bool:
+        return round(strike, 2) in self._strike_set
+
+    @property
+    def option_sec_type(self) -> str:
+        return 'FOP' if self.sec_type == 'FUT' else 'OPT'
+
+    def option_tick(self, price: float) -> float:
+        if self.sec_type == 'FUT':
+            return 0.25 if price >= 5 else 0.05
+        return 0.05 if price >= 3 else 0.01
+
+
+def _strike_step(spot: float) -> float:
+    if spot >= 10000:
+        return 10
+    if spot >= 1000:
+        return 5
+    return 1 if spot >= 100 else 0.5
+
+
+def _quarterly_expiries(start: date, count: int) -> list:
+    """Third Fridays of the next `count` quarterly months on or after start."""
+    expiries = []
+    year, month = start.year, start.month
+    while len(expiries) < count:
+        if month % 3 == 0:
+            first = date(year, month, 1)
+            third_friday = first + timedelta(days=(4 - first.weekday()) % 7 + 14)
+            if third_friday >= start:
+                expiries.append(third_friday.strftime("%Y%m%d"))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return expiries
+
+
+def instruments_for(params_by_symbol: dict, spots: dict = None) -> dict:
+    """Build a SimInstrument for every symbol of a {symbol: strategy params} mapping."""
+    spots = spots or cfg.sim_spot_prices
+    instruments = {}
+    today = date.today()
+    horizon = today + timedelta(days=cfg.sim_expiry_horizon_days)
+    for symbol, params in params_by_symbol.items():
+        spot = spots.get(symbol, 100.0)
+        calendar = calendar_for_sec_type(params.sec_type)
+        expiries = []
+        day = calendar.next_trading_day(today, inclusive=True)
+        while day <= horizon:
+            expiries.append(day.strftime("%Y%m%d"))
+            day = calendar.next_trading_day(day)
+        instruments[symbol] = SimInstrument(
+            symbol=symbol, sec_type=params.sec_type, exchange=params.exchange,
+            opt_exchange=params.opt_exchange, multiplier=params.mult,
+            trading_class=params.trading_class, spot=spot, iv=cfg.sim_implied_vol,
+            strike_step=_strike_step(spot), expiries=expiries,
+            futures=_quarterly_expiries(today, 4) if params.sec_type == 'FUT' else [])
+    return instruments
+
+
+def instruments_from_cfg() -> dict:
+    """Build a SimInstrument for every symbol of the strategy schedules."""
+    from strategies import load_schedules
+
+    params_by_symbol = {}
+    for schedule in load_schedules().values():
+        for symbol, params in schedule.params.items():
+            params_by_symbol.setdefault(symbol, params)
+    return instruments_for(params_by_symbol)
+
+
+class SimIB(IB):
+    """
+    An IB that answers from a simulated market. Only the requests the entry flow makes
+    are simulated; everything else falls through to ib_async and needs a real socket.
+    """
+
+    def __init__(self, instruments: dict = None, trading_class_for=None):
+        super().__init__()
+        self.instruments = instruments if instruments is not None else instruments_from_cfg()
+        self._trading_class_for = trading_class_for or (lambda symbol: self.instruments[symbol].trading_class)
+        self._rng = random.Random(cfg.sim_seed)
+        self._conids = itertools.count(100000)
+        self._order_ids = itertools.count(1)
+        self._exec_ids = itertools.count(1)
+        self._contracts = {}  # key -> qualified contract
+        self._by_conid = {}
+        self._subscriptions = {}  # hash(contract) -> streaming ticker
+        self._working = []  # trades that can still fill
+        self._connected = False
+        self._clientid = 0
+        self._tick_task = None
+        self.requests = Counter()
+
+    def reset(self, instruments: dict = None):
+        """
+        Start a fresh session on new instruments: no orders, positions or subscriptions and
+        zeroed request counters. Contracts keep their conIds so cached qualifications stay valid.
+        """
+        self.instruments = instruments if instruments is not None else instruments_from_cfg()
+        self._rng = random.Random(cfg.sim_seed)
+        self._subscriptions.clear()
+        self._working.clear()
+        self.wrapper.trades.clear()
+        self.wrapper.permId2Trade.clear()
+        self.wrapper.positions.clear()
+        self.wrapper.ticker2ReqId['mktData'].clear()
+        self.requests.clear()
+
+    # -- connection --------------------------------------------------------------
+
+    def connect(self, host: str = '127.0.0.1', port: int = 7497, clientId: int = 1, timeout: float = 4,
+                readonly: bool = False, account: str = '', raiseSyncErrors: bool = False, fetchFields=None):
+        return self._run(self.connectAsync(host, port, clientId, timeout, readonly, account))
+
+    async def connectAsync(self, host: str = '127.0.0.1', port: int = 7497, clientId: int = 1,
+                           timeout: float = 4, readonly: bool = False, account: str = '',
+                           raiseSyncErrors: bool = False, fetchFields=None):
+        await self._request('connect')
+        self._connected = True
+        self._clientid = self.wrapper.clientId = int(clientId)
+        self.wrapper.accounts = [ACCOUNT]
+        logger.info(f"Simulated gateway connected as client {clientId} with {len(self.instruments)} instruments")
+        self.connectedEvent.emit()
+        return self
+
+    def isConnected(self) -> bool:
+        return self._connected
+
+    def disconnect(self):
+        if self._tick_task is not None:
+            self._tick_task.cancel()
+            self._tick_task = None
+        was_connected, self._connected = self._connected, False
+        if was_connected:
+            self.disconnectedEvent.emit()
+
+    async def reqCurrentTimeAsync(self):
+        await self._request('reqCurrentTime')
+        return datetime.now()
+
+    # -- contracts ---------------------------------------------------------------
+
+    async def _request(self, name: str):
+        """Count a gateway request and wait out its injected latency."""
+        self.requests[name] += 1
+        jitter = cfg.sim_latency * cfg.sim_latency_jitter
+        await asyncio.sleep(max(0.0, cfg.sim_latency + self._rng.uniform(-jitter, jitter)))
+
+    def _register(self, key, **fields) -> Contract:
+        contract = self._contracts.get(key)
+        if contract is None:
+            contract = Contract(conId=next(self._conids), currency='USD', **fields)
+            self._contracts[key] = contract
+            self._by_conid[contract.conId] = contract
+        return contract
+
+    def _underlying(self, inst: SimInstrument, expiry: str = '') -> Contract:
+        if inst.sec_type == 'FUT':
+            expiry = next((f for f in inst.futures if f >= expiry[:8]), inst.futures[-1]) if expiry else inst.futures[0]
+            return self._register((inst.symbol, 'FUT', expiry), symbol=inst.symbol, secType='FUT',
+                                  lastTradeDateOrContractMonth=expiry, exchange=inst.exchange,
+                                  multiplier=inst.multiplier, localSymbol=f"{inst.symbol}{expiry[:6]}")
+        return self._register((inst.symbol, inst.sec_type, ''), symbol=inst.symbol, secType=inst.sec_type,
+                              exchange=inst.exchange)
+
+    def _option(self, inst: SimInstrument, expiry: str, strike: float, right: str) -> Contract:
+        return self._register((inst.symbol, inst.option_sec_type, expiry, strike, right),
+                              symbol=inst.symbol, secType=inst.option_sec_type,
+                              lastTradeDateOrContractMonth=expiry, strike=strike, right=right,
+                              exchange=inst.opt_exchange, multiplier=inst.multiplier,
+                              tradingClass=self._trading_class_for(inst.symbol))
+
+    def _match(self, contract: Contract):
+        """Return the simulated contract matching a (partial) contract, or None."""
+        if contract.conId in self._by_conid:
+            return self._by_conid[contract.conId]
+        inst = self.instruments.get(contract.symbol)
+        if inst is None:
+            return None
+        expiry = contract.lastTradeDateOrContractMonth
+        if contract.secType == inst.option_sec_type:
+            if expiry not in inst.expiries or contract.right not in ('C', 'P') \
+                    or not inst.is_listed(contract.strike):
+                return None
+            return self._option(inst, expiry, contract.strike, contract.right)
+        if contract.secType == inst.sec_type:
+            return self._underlying(inst, expiry)
+        return None
+
+    async def qualifyContractsAsync(self, *contracts, returnAll: bool = False):
+        await self._request('qualifyContracts')
+        results = []
+        for contract in contracts:
+            match = self._match(contract)
+            if match is None:
+                logger.warning(f"Simulated gateway: unknown contract {contract}")
+                results.append(None)
+                continue
+            for name in ('conId', 'secType', 'lastTradeDateOrContractMonth', 'strike', 'right', 'exchange',
+                         'multiplier', 'tradingClass', 'localSymbol', 'currency'):
+                setattr(contract, name, getattr(match, name))
+            results.append(contract)
+        return results
+
+    async def reqContractDetailsAsync(self, contract: Contract):
+        await self._request('reqContractDetails')
+        inst = self.instruments.get(contract.symbol)
+        if inst is None:
+            return []
+        if contract.secType == 'FUT':
+            return [ContractDetails(contract=self._underlying(inst, expiry), minTick=0.25)
+                    for expiry in inst.futures if expiry.startswith(contract.lastTradeDateOrContractMonth)]
+        if contract.secType == inst.option_sec_type:
+            expiry = contract.lastTradeDateOrContractMonth
+            if expiry not in inst.expiries:
+                return []
+            rights = [contract.right] if contract.right in ('C', 'P') else ['C', 'P']
+            strikes = [contract.strike] if contract.strike else inst.listed_strikes
+            return [ContractDetails(contract=self._option(inst, expiry, strike, right), minTick=0.05)
+                    for strike in strikes for right in rights]
+        match = self._match(contract)
+        return [ContractDetails(contract=match)] if match is not None else []
+
+    async def reqSecDefOptParamsAsync(self, underlyingSymbol: str, futFopExchange: str,
+                                      underlyingSecType: str, underlyingConId: int):
+        await self._request('reqSecDefOptParams')
+        inst = self.instruments.get(underlyingSymbol)
+        if inst is None:
+            return []
+        return [OptionChain(exchange=inst.opt_exchange, underlyingConId=underlyingConId,
+                            tradingClass=self._trading_class_for(inst.symbol), multiplier=inst.multiplier,
+                            expirations=list(inst.expiries), strikes=list(inst.listed_strikes))]
+
+    # -- market data -------------------------------------------------------------
+
+    def _model(self, contract: Contract):
+        """Return (bid, ask, last, model greeks) for a contract from the simulated market."""
+        if contract.secType == 'BAG':
+            bid = ask = 0.0
+            for leg in contract.comboLegs:
+                leg_bid, leg_ask, _, _ = self._model(self._by_conid[leg.conId])
+                if isnan(leg_bid) or isnan(leg_ask):
+                    return nan, nan, nan, None
+                if leg.action == 'BUY':
+                    bid, ask = bid + leg.ratio * leg_bid, ask + leg.ratio * leg_ask
+                else:
+                    bid, ask = bid - leg.ratio * leg_ask, ask - leg.ratio * leg_bid
+            return bid, ask, (bid + ask) / 2, None
+
+        inst = self.instruments[contract.symbol]
+        if contract.secType == inst.sec_type:
+            if inst.sec_type == 'IND':
+                return nan, nan, inst.spot, None  # indexes only print a last
+            half_tick = 0.125 if inst.sec_type == 'FUT' else 0.005
+            return inst.spot - half_tick, inst.spot + half_tick, inst.spot, None
+
+        t = greeks.year_fraction(contract.lastTradeDateOrContractMonth)
+        model = greeks.model_for_sec_type(inst.sec_type)
+        is_call = contract.right == 'C'
+        # A mild smile so the delta search does not sit on a flat surface
+        sigma = inst.iv * (1 + 2.0 * (contract.strike / inst.spot - 1) ** 2)
+        value = float(greeks.price(inst.spot, contract.strike, t, cfg.risk_free_rate, sigma, is_call, model))
+        delta = float(greeks.delta(inst.spot, contract.strike, t, cfg.risk_free_rate, sigma, is_call, model))
+        tick = inst.option_tick(value)
+        half_spread = max(tick, value * cfg.sim_spread_pct / 2)
+        bid = max(0.0, round((value - half_spread) / tick) * tick)
+        ask = round((value + half_spread) / tick) * tick
+        computation = OptionComputation(0, sigma, delta, value, 0.0, None, None, None, inst.spot)
+        return bid, ask, value, computation
+
+    def _quote(self, ticker: Ticker):
+        bid, ask, last, computation = self._model(ticker.contract)
+        ticker.bid, ticker.ask, ticker.last = bid, ask, last
+        ticker.bidSize = ticker.askSize = 10.0 if not isnan(bid) else nan
+        ticker.modelGreeks = computation
+        ticker.time = datetime.now()
+
+    async def reqTickersAsync(self, *contracts, regulatorySnapshot: bool = False):
+        await self._request('reqTickers')
+        tickers = []
+        for contract in contracts:
+            ticker = Ticker(contract=contract)
+            self._quote(ticker)
+            tickers.append(ticker)
+        return tickers
+
+    def reqMktData(self, contract: Contract, genericTickList: str = '', snapshot: bool = False,
+                   regulatorySnapshot: bool = False, mktDataOptions=None) -> Ticker:
+        self.requests['reqMktData'] += 1
+        key = hash(contract)
+        ticker = self._subscriptions.get(key) or Ticker(contract=contract)
+        self._subscriptions[key] = ticker
+        self.wrapper.ticker2ReqId['mktData'][ticker] = key
+        self._ensure_ticking()
+        asyncio.get_event_loop().call_later(cfg.sim_latency, self._publish, [ticker])
+        return ticker
+
+    def cancelMktData(self, contract: Contract) -> bool:
+        self.requests['cancelMktData'] += 1
+        ticker = self._subscriptions.pop(hash(contract), None)
+        if ticker is not None:
+            self.wrapper.ticker2ReqId['mktData'].pop(ticker, None)
+        return ticker is not None
+
+    def _publish(self, tickers: list):
+        for ticker in tickers:
+            if hash(ticker.contract) in self._subscriptions:
+                self._quote(ticker)
+                ticker.updateEvent.emit(ticker)
+        self.pendingTickersEvent.emit(set(tickers))
+
+    def _ensure_ticking(self):
+        if self._tick_task is None or self._tick_task.done():
+            self._tick_task = asyncio.ensure_future(self._tick_loop())
+
+    async def _tick_loop(self):
+        """Move every underlying by a random-walk step, republish quotes and work orders."""
+        step = sqrt(cfg.sim_tick_interval / TRADING_SECONDS_PER_YEAR)
+        while self._connected:
+            await asyncio.sleep(cfg.sim_tick_interval)
+            for inst in self.instruments.values():
+                inst.spot *= exp(inst.iv * step * self._rng.gauss(0, 1))
+            self._publish(list(self._subscriptions.values()))
+            self._work_orders()
+            self.updateEvent.emit()
+
+    # -- orders ------------------------------------------------------------------
+
+    def placeOrder(self, contract: Contract, order) -> Trade:
+        self.requests['placeOrder'] += 1
+        trade = next((t for t in self._working if t.order is order or t.order.orderId == order.orderId), None)
+        if trade is not None:
+            trade.log.append(TradeLogEntry(datetime.now(), trade.orderStatus.status, 'Modify'))
+            trade.modifyEvent.emit(trade)
+            return trade
+
+        order.orderId = order.orderId or next(self._order_ids)
+        order.clientId = self._clientid
+        order.permId = order.permId or order.orderId + 1_000_000
+        trade = Trade(contract, order, OrderStatus(orderId=order.orderId, status=OrderStatus.PendingSubmit), [], [])
+        trade.log.append(TradeLogEntry(datetime.now(), OrderStatus.PendingSubmit, ''))
+        self.wrapper.trades[(order.clientId, order.orderId)] = trade
+        self.wrapper.permId2Trade[order.permId] = trade
+        self._working.append(trade)
+        self.newOrderEvent.emit(trade)
+        self._ensure_ticking()
+        asyncio.get_event_loop().call_later(cfg.sim_latency, self._set_status, trade, OrderStatus.Submitted)
+        return trade
+
+    def cancelOrder(self, order, manualCancelOrderTime: str = ''):
+        self.requests['cancelOrder'] += 1
+        trade = next((t for t in self._working if t.order.orderId == order.orderId), None)
+        if trade is not None:
+            self._working.remove(trade)
+            asyncio.get_event_loop().call_later(cfg.sim_latency, self._set_status, trade, OrderStatus.Cancelled)
+        return trade
+
+    def _set_status(self, trade: Trade, status: str):
+        if trade.isDone() or trade.orderStatus.status == status:
+            return
+        trade.orderStatus.status = status
+        trade.log.append(TradeLogEntry(datetime.now(), status, ''))
+        self.orderStatusEvent.emit(trade)
+        trade.statusEvent.emit(trade)
+        if status == OrderStatus.Cancelled:
+            trade.cancelledEvent.emit(trade)
+
+    def _work_orders(self):
+        """Fill working orders the simulated market would take."""
+        for trade in list(self._working):
+            order = trade.order
+            if trade.orderStatus.status != OrderStatus.Submitted:
+                continue
+            if order.goodAfterTime or order.conditions:
+                continue  # timed exits rest until their time, which the simulator never reaches
+            bid, ask, fair, _ = self._model(trade.contract)
+            if isnan(bid) or isnan(ask):
+                continue
+            buy = order.action == 'BUY'
+            if order.orderType == 'MKT':
+                price = ask if buy else bid
+            elif buy and order.lmtPrice >= fair + cfg.sim_fill_edge * (ask - fair):
+                price = order.lmtPrice
+            elif not buy and order.lmtPrice <= fair - cfg.sim_fill_edge * (fair - bid):
+                price = order.lmtPrice
+            else:
+                continue
+            self._fill(trade, price)
+
+    def _fill(self, trade: Trade, price: float):
+        order = trade.order
+        quantity = order.totalQuantity
+        now = datetime.now()
+        execution = Execution(execId=f"sim.{next(self._exec_ids)}", time=now, acctNumber=ACCOUNT,
+                              exchange=trade.contract.exchange, side='BOT' if order.action == 'BUY' else 'SLD',
+                              shares=quantity, price=price, permId=order.permId, clientId=order.clientId,
+                              orderId=order.orderId, cumQty=quantity, avgPrice=price, orderRef=order.orderRef)
+        fill = Fill(trade.contract, execution, CommissionReport(), now)
+        trade.fills.append(fill)
+        self._working.remove(trade)
+        self._update_positions(trade.contract, order.action, quantity, price)
+
+        trade.orderStatus.filled = quantity
+        trade.orderStatus.remaining = 0
+        trade.orderStatus.avgFillPrice = trade.orderStatus.lastFillPrice = price
+        trade.orderStatus.status = OrderStatus.Filled
+        trade.log.append(TradeLogEntry(now, OrderStatus.Filled, f"Fill {quantity}@{price}"))
+        logger.info(f"Simulated fill: {order.action} {quantity} {trade.contract.symbol} @ {price}")
+        self.execDetailsEvent.emit(trade, fill)
+        trade.fillEvent.emit(trade, fill)
+        self.orderStatusEvent.emit(trade)
+        trade.statusEvent.emit(trade)
+        trade.filledEvent.emit(trade)
+
+    def _update_positions(self, contract: Contract, action: str, quantity: float, price: float):
+        sign = 1 if action == 'BUY' else -1
+        legs = contract.comboLegs if contract.secType == 'BAG' else [ComboLeg(conId=contract.conId, ratio=1,
+                                                                               action='BUY')]
+        positions = self.wrapper.positions[ACCOUNT]
+        for leg in legs:
+            leg_contract = self._by_conid.get(leg.conId, contract)
+            leg_sign = sign * (1 if leg.action == 'BUY' else -1)
+            held = positions.get(leg.conId)
+            size = (held.position if held else 0) + leg_sign * leg.ratio * quantity
+            position = Position(ACCOUNT, leg_contract, size, price)
+            if size:
+                positions[leg.conId] = position
+            else:
+                positions.pop(leg.conId, None)
+            self.positionEvent.emit(position)
+
+    async def reqPositionsAsync(self):
+        await self._request('reqPositions')
+        return self.positions()
+
+    async def reqOpenOrdersAsync(self):
+        await self._request('reqOpenOrders')
+        return self.openTrades()
+
+    async def reqCompletedOrdersAsync(self, apiOnly: bool):
+        await self._request('reqCompletedOrders')
+        return [t for t in self.trades() if t.isDone()]
+
+    async def reqExecutionsAsync(self, execFilter=None):
+        await self._request('reqExecutions')
+        return [fill for trade in self.trades() for fill in trade.fills]
+
+
+def install(**kwargs) -> SimIB:
+    """
+    Replace the ibstrat IB instance with a SimIB and switch off everything that would
+    reach outside the process or outlive it: market-data lanes, Pushover alerts and the
+    on-disk qualification cache. The trade log goes to the local stand-in backend
+    (cfg.trade_log_local_path) through an in-memory write-ahead log.
+    """
+    import ibstrat.ib_instance
+    try:
+        from ibstrat.trclass import get_trading_class_for_symbol
+        kwargs.setdefault('trading_class_for', get_trading_class_for_symbol)
+    except ImportError:
+        pass
+
+    from qualcache import qualification_cache
+
+    sim = SimIB(**kwargs)
+    ibstrat.ib_instance.ib = sim
+    # Simulated conIds differ between runs and must never reach the persistent cache
+    qualification_cache.path = cfg.qualification_cache_path = ':memory:'
+    cfg.ib_market_data_clientids = cfg.test_ib_market_data_clientids = []
+    cfg.pushover_alerts = False
+    cfg.trade_log_backend = 'local'
+    cfg.trade_log_wal_path = ':memory:'
+    logger.warning("Using the simulated IB gateway, no orders reach a broker")
+    return sim
@@ -0,0 +1,222 @@
+"""
+Strategy configuration compiled into frozen dataclasses.
+
+The schedules come from cfg.schedules, or from the TOML/YAML file named by
+cfg.strategy_config_path, which has the same layout:
+
+    [Friday57]
+    weekday = 4
+    entry_time = "10:00:00"
+    symbols = ["ES"]
+
+    [Friday57.params.ES]
+    strategy_tag = "FDC57"
+    exchange = "CME"
+    ...
+
+Every schedule and symbol is validated at load (unknown or missing keys, types,
+ranges) and all problems are reported together in one ConfigError, so a typo fails
+`main.py --check-config` rather than a trade. The pipeline then reads plain
+attributes of StrategyParams instead of string keys. Only the standard library is
+imported here, so checking a configuration takes milliseconds.
+"""
+import difflib
+import os
+from dataclasses import dataclass, fields, MISSING
+from datetime import datetime
+from types import MappingProxyType
+
+import cfg
+
+SEC_TYPES = ('FUT', 'IND', 'STK')
+
+SCHEDULE_KEYS = ('weekday', 'entry_time', 'symbols', 'params')
+
+
+class ConfigError(ValueError):
+    """Raised with every problem found in a strategy configuration."""
+
+    def __init__(self, errors: list):
+        super().__init__(f"{len(errors)} configuration error{'s' if len(errors) != 1 else ''}:\n  " +
+                         "\n  ".join(errors))
+        self.errors = errors
+
+
+@dataclass(frozen=True, slots=True)
+class StrategyParams:
+    """Double calendar parameters of one symbol in one schedule."""
+    strategy_tag: str
+    exchange: str
+    opt_exchange: str
+    sec_type: str
+    mult: str
+    quantity: int
+    target_put_delta: float  # In delta points, 22 means 0.22
+    target_call_delta: float
+    short_put_expiry_days: int
+    short_call_expiry_days: int
+    long_put_expiry_days: int
+    long_call_expiry_days: int
+    trading_class: str = ''
+    use_adaptive_on_combo: bool = False
+    use_adaptive_on_exit: bool = False
+    submit_auto_close: bool = False
+    close_time: str = '17:00:00'
+    profit_target_pct: float = -1
+
+    def expiry_days(self, leg: str) -> int:
+        """Expiry days of a leg: 'short_put', 'short_call', 'long_put' or 'long_call'."""
+        return getattr(self, f"{leg}_expiry_days")
+
+
+@dataclass(frozen=True, slots=True)
+class ScheduleConfig:
+    """One schedule: when it is entered and the parameters of its symbols."""
+    name: str
+    weekday: int  # 0 = Monday
+    entry_time: str  # HH:MM:SS local time, None while unset
+    symbols: tuple
+    params: MappingProxyType  # symbol -> StrategyParams
+
+    @property
+    def config(self) -> tuple:
+        """(name, symbols, params) as taken by main.run_configs_async."""
+        return self.name, list(self.symbols), self.params
+
+
+def _type_ok(value, expected) -> bool:
+    if expected is bool:
+        return isinstance(value, bool)
+    if expected is int:
+        return isinstance(value, int) and not isinstance(value, bool)
+    if expected is float:
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    return isinstance(value, expected)
+
+
+def _time_ok(value) -> bool:
+    try:
+        datetime.strptime(value, "%H:%M:%S")
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _unknown(where: str, keys, known, errors: list):
+    for key in keys:
+        if key not in known:
+            close = difflib.get_close_matches(str(key), known, 1)
+            errors.append(f"{where}: unknown key '{key}'" + (f", did you mean '{close[0]}'?" if close else ""))
+
+
+def compile_params(where: str, raw, errors: list):
+    """Validate one symbol's parameters and return StrategyParams, or None after adding to errors."""
+    if not isinstance(raw, dict):
+        errors.append(f"{where}: expected a table of parameters, got {type(raw).__name__}")
+        return None
+    schema = {f.name: f for f in fields(StrategyParams)}
+    count = len(errors)
+    _unknown(where, raw, schema, errors)
+    for name, field in schema.items():
+        if name not in raw:
+            if field.default is MISSING:
+                errors.append(f"{where}: missing '{name}'")
+        elif not _type_ok(raw[name], field.type):
+            errors.append(f"{where}.{name}: expected {field.type.__name__}, got {raw[name]!r}")
+    if len(errors) > count:
+        return None
+
+    params = StrategyParams(**raw)
+    if params.sec_type not in SEC_TYPES:
+        errors.append(f"{where}.sec_type: '{params.sec_type}' is not one of {', '.join(SEC_TYPES)}")
+    try:
+        float(params.mult)
+    except ValueError:
+        errors.append(f"{where}.mult: '{params.mult}' is not a number")
+    if params.quantity < 1:
+        errors.append(f"{where}.quantity: must be at least 1")
+    for right in ('put', 'call'):
+        delta = getattr(params, f"target_{right}_delta")
+        if not 0 < delta < 100:
+            errors.append(f"{where}.target_{right}_delta: {delta} is outside (0, 100)")
+        short, long = params.expiry_days(f"short_{right}"), params.expiry_days(f"long_{right}")
+        if short < 0:
+            errors.append(f"{where}.short_{right}_expiry_days: must not be negative")
+        if long <= short:
+            errors.append(f"{where}.long_{right}_expiry_days: {long} must be after short_{right}_expiry_days {short}")
+    if not _time_ok(params.close_time):
+        errors.append(f"{where}.close_time: '{params.close_time}' is not HH:MM:SS")
+    return params if len(errors) == count else None
+
+
+def compile_schedules(source: dict) -> MappingProxyType:
+    """Validate and compile {name: schedule} into a read-only {name: ScheduleConfig}."""
+    errors = []
+    compiled = {}
+    if not isinstance(source, dict) or not source:
+        raise ConfigError(["no schedules defined"])
+    for name, raw in source.items():
+        if not isinstance(raw, dict):
+            errors.append(f"{name}: expected a table, got {type(raw).__name__}")
+            continue
+        count = len(errors)
+        _unknown(name, raw, SCHEDULE_KEYS, errors)
+        for key in SCHEDULE_KEYS:
+            if key not in raw:
+                errors.append(f"{name}: missing '{key}'")
+        weekday, entry_time = raw.get('weekday'), raw.get('entry_time')
+        symbols, raw_params = raw.get('symbols', []), raw.get('params', {})
+        if 'weekday' in raw and not (_type_ok(weekday, int) and 0 <= weekday <= 6):
+            errors.append(f"{name}.weekday: {weekday!r} is not 0 (Monday) to 6")
+        if entry_time is not None and not _time_ok(entry_time):
+            errors.append(f"{name}.entry_time: {entry_time!r} is not HH:MM:SS")
+        if not isinstance(raw_params, dict):
+            errors.append(f"{name}.params: expected a table of symbols")
+            raw_params = {}
+        if not isinstance(symbols, (list, tuple)) or not all(isinstance(s, str) for s in symbols):
+            errors.append(f"{name}.symbols: expected a list of symbols")
+            symbols = []
+        for symbol in symbols:
+            if symbol not in raw_params:
+                errors.append(f"{name}.symbols: no params for '{symbol}'")
+        params = {symbol: compile_params(f"{name}.{symbol}", p, errors) for symbol, p in raw_params.items()}
+        if len(errors) == count:
+            compiled[name] = ScheduleConfig(name, weekday, entry_time, tuple(symbols), MappingProxyType(params))
+    if errors:
+        raise ConfigError(errors)
+    return MappingProxyType(compiled)
+
+
+def require_entry_times(schedules, names) -> None:
+    """Raise ConfigError naming every schedule of names whose entry_time is not set."""
+    unset = [f"{name}.entry_time: not set; give the local time the entry runs at" for name in names
+             if schedules[name].entry_time is None]
+    if unset:
+        raise ConfigError(unset)
+
+
+def read_file(path: str) -> dict:
+    """Read schedules from a .toml, .yaml or .yml file."""
+    if not os.path.isabs(path):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        if ext == '.toml':
+            import tomllib
+            with open(path, 'rb') as f:
+                return tomllib.load(f)
+        if ext in ('.yaml', '.yml'):
+            import yaml
+            with open(path) as f:
+                return yaml.safe_load(f)
+    except ImportError as e:
+        raise ConfigError([f"{path}: cannot read {ext} files: {e}"])
+    except Exception as e:
+        raise ConfigError([f"{path}: {e}"])
+    raise ConfigError([f"{path}: unsupported config format '{ext}', use .toml, .yaml or .yml"])
+
+
+def load_schedules(path: str = None) -> MappingProxyType:
+    """Compile the schedules from path, cfg.strategy_config_path, or cfg.schedules if neither is set."""
+    path = path or cfg.strategy_config_path
+    return compile_schedules(read_file(path) if path else cfg.schedules)
@@ -0,0 +1,219 @@
+"""
+Parameter sweep over the strategy schedules on the historical backtest (backtest.py).
+
+    python sweep.py --start 2023-01-01 -s Friday57 -g target_put_delta=15:30:5 -g target_call_delta=15:30:5
+    python sweep.py --start 2023-01-01 -s Friday57 -s Friday67 -g short_put_expiry_days=3,5,7 \
+        -g close_time=15:00:00,17:00:00 -g profit_target_pct=-1,20,40 --random 12
+
+Every -g FIELD=VALUES names a StrategyParams field and its values, as a list (a,b,c)
+or an inclusive numeric range (lo:hi:step). The variants are the grid of all values,
+or --random N of them drawn with cfg.sweep_seed, applied to every symbol of each
+schedule; the unchanged configuration is always run as variant 0. Variants that fail
+the strategy validation (a long expiry before the short one, say) are dropped, as are
+those whose short put expires after the short call: the backtest exits on the short
+put expiry and would be left without a quote for the expired short call.
+
+The snapshot days are packed once into a memory-mapped SnapshotStore under
+cfg.sweep_store_dir, reused while the day files are unchanged, and mapped read-only
+by every worker, so the chain data is shared through the page cache rather than
+parsed or pickled per process. Variants fan out over a process pool on every core
+(cfg.backtest_workers) and the summary of each goes to cfg.sweep_output_path, a
+Parquet file with one row per variant that also counts the entries ending in each
+untraded status (backtest.UNTRADED).
+"""
+import argparse
+import hashlib
+import itertools
+import logging
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import fields
+from datetime import date, timedelta
+
+import pandas as pd
+
+import cfg
+import backtest
+from strategies import ConfigError, StrategyParams, compile_params, load_schedules, require_entry_times
+
+logger = logging.getLogger('DC')
+
+# Fields a sweep can vary; the rest identify the instrument or the order handling
+SWEEPABLE = ('target_put_delta', 'target_call_delta', 'short_put_expiry_days', 'short_call_expiry_days',
+             'long_put_expiry_days', 'long_call_expiry_days', 'close_time', 'profit_target_pct',
+             'submit_auto_close')
+
+FIELD_TYPES = {field.name: field.type for field in fields(StrategyParams)}
+
+
+def parse_values(spec: str) -> tuple:
+    """Parse FIELD=a,b,c or FIELD=lo:hi:step into (field, [values]) typed as the StrategyParams field."""
+    name, _, values = spec.partition('=')
+    name = name.strip()
+    if name not in SWEEPABLE:
+        raise ValueError(f"cannot sweep '{name}', one of {', '.join(SWEEPABLE)}")
+    kind = FIELD_TYPES[name]
+    if kind is bool:
+        return name, [value.strip().lower() in ('1', 'true', 'yes') for value in values.split(',')]
+    if kind is str:
+        return name, [value.strip() for value in values.split(',')]
+    if ':' in values:
+        lo, hi, step = (float(value) for value in values.split(':'))
+        count = int(round((hi - lo) / step)) + 1
+        numbers = [lo + i * step for i in range(count)]
+    else:
+        numbers = [float(value) for value in values.split(',')]
+    return name, [int(number) if kind is int else round(number, 6) for number in numbers]
+
+
+def make_variants(schedules: list, grid: dict, sample: int = None) -> list:
+    """
+    Return (schedule name, variant number, overrides, {symbol: params}) for the baseline
+    and every valid grid point (or a random sample of them) of each schedule.
+    """
+    points = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    if sample is not None and sample < len(points):
+        points = random.Random(cfg.sweep_seed).sample(points, sample)
+    variants = []
+    for schedule in schedules:
+        variants.append((schedule.name, 0, {}, dict(schedule.params)))
+        dropped = 0
+        for number, overrides in enumerate(points, 1):
+            errors = []
+            params = {symbol: compile_params(f"{schedule.name}.{symbol}",
+                                             {field.name: getattr(base, field.name) for field in fields(base)}
+                                             | overrides, errors)
+                      for symbol, base in schedule.params.items()}
+            if not errors:
+                errors = [symbol for symbol, own in params.items()
+                          if own.short_put_expiry_days > own.short_call_expiry_days]
+            if errors:
+                dropped += 1
+                continue
+            variants.append((schedule.name, number, overrides, params))
+        if dropped:
+            logger.warning(f"{schedule.name}: {dropped} of {len(points)} variants fail validation or have the short "
+                           f"put expire after the short call, and are skipped")
+    return variants
+
+
+def store_for(symbols: list, first: date, last: date) -> backtest.SnapshotStore:
+    """Open the snapshot store of these days, building it when the day files changed or it is missing."""
+    files = [(symbol, day, path) for symbol in symbols for day, path in backtest.day_files(symbol, first, last)]
+    if not files:
+        raise SystemExit(f"No snapshot files for {', '.join(symbols)} from {first} to {last} in {backtest.data_dir()}")
+    key = hashlib.sha1(repr([(symbol, day, path, os.path.getsize(path), os.path.getmtime(path))
+                             for symbol, day, path in files]).encode()).hexdigest()[:16]
+    directory = cfg.sweep_store_dir
+    if not os.path.isabs(directory):
+        directory = os.path.join(backtest.HERE, directory)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"snapshots_{key}")
+    if os.path.exists(path + '.bin') and os.path.exists(path + '.index.npy'):
+        return backtest.SnapshotStore(path)
+    logger.info(f"Packing {len(files)} snapshot days into {path}.bin")
+    return backtest.SnapshotStore.build(path, files)
+
+
+_entries = {}
+
+
+def _init_worker(years_back: int, store_path: str, entries: dict):
+    global _entries
+    cfg.trading_calendar_years_back = years_back
+    backtest.use_store(backtest.SnapshotStore(store_path))
+    _entries = entries
+
+
+def evaluate(variant: tuple) -> dict:
+    """Backtest one variant over its schedule's entries and return its summary row."""
+    name, number, overrides, params = variant
+    records = [backtest.simulate_entry(name, symbol, params[symbol], day, entry_seconds)
+               for _, symbol, _, day, entry_seconds in _entries[name]]
+    [summary] = backtest.summarize(records) or [{'schedule': name, 'entries': 0,
+                                                 **{status: 0 for status in backtest.UNTRADED}}]
+    return {**summary, 'variant': number, **overrides}
+
+
+def run_sweep(variants: list, entries: dict, store: backtest.SnapshotStore, workers: int = None) -> pd.DataFrame:
+    """Evaluate the variants in a process pool sharing the snapshot store; one row per variant."""
+    workers = workers or cfg.backtest_workers or os.cpu_count()
+    initargs = (cfg.trading_calendar_years_back, store.path, entries)
+    if workers == 1:
+        _init_worker(*initargs)
+        rows = [evaluate(variant) for variant in variants]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as executor:
+            rows = list(executor.map(evaluate, variants, chunksize=max(1, len(variants) // (workers * 4))))
+    return pd.DataFrame(rows)
+
+
+def print_best(results: pd.DataFrame, swept: list, top: int):
+    for name, rows in results.groupby('schedule', sort=False):
+        print(f"\n{name}: {len(rows)} variants, best {min(top, len(rows))} by total P&L")
+        columns = [column for column in ['variant'] + swept + ['entries', 'trades', 'win_rate', 'total_pnl',
+                                                                'mean_pnl', 'max_drawdown'] if column in rows]
+        best = rows.sort_values('total_pnl', ascending=False).head(top)
+        baseline = rows[rows['variant'] == 0]
+        print(pd.concat([best, baseline]).drop_duplicates('variant')[columns].to_string(index=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep strategy parameters over the historical backtest.")
+    parser.add_argument('--start', type=date.fromisoformat, required=True, help="First entry date, YYYY-MM-DD.")
+    parser.add_argument('--end', type=date.fromisoformat, default=date.today(), help="Last entry date, YYYY-MM-DD.")
+    parser.add_argument('-s', '--schedule', action='append', help="Schedule to sweep (repeatable); default all.")
+    parser.add_argument('-g', '--grid', action='append', default=[], metavar='FIELD=VALUES',
+                        help="Values of one field: a,b,c or lo:hi:step (repeatable).")
+    parser.add_argument('--random', type=int, metavar='N', help="Run N variants drawn from the grid.")
+    parser.add_argument('-w', '--workers', type=int, default=cfg.backtest_workers,
+                        help="Worker processes; 0 uses every CPU, 1 runs in-process.")
+    parser.add_argument('--data', type=str, default=cfg.backtest_data_dir, help="Snapshot directory.")
+    parser.add_argument('--config', type=str, help="Strategy configuration file (TOML/YAML) instead of cfg.")
+    parser.add_argument('--top', type=int, default=10, help="Variants printed per schedule.")
+    parser.add_argument('-o', '--output', type=str, default=cfg.sweep_output_path, help="Results Parquet file.")
+    args = parser.parse_args()
+
+    try:
+        grid = dict(parse_values(spec) for spec in args.grid)
+    except ValueError as e:
+        parser.error(str(e))
+    cfg.backtest_data_dir = args.data
+    schedules = load_schedules(args.config)
+    names = args.schedule or list(schedules)
+    unknown = [name for name in names if name not in schedules]
+    if unknown:
+        parser.error(f"unknown schedule {', '.join(unknown)}; one of {', '.join(schedules)}")
+    try:
+        require_entry_times(schedules, names)
+    except ConfigError as e:
+        parser.error(str(e))
+    selected = [schedules[name] for name in names]
+
+    backtest.cover_calendar(args.start)
+    backtest.calendar('NYSE')
+    backtest.calendar('CME')
+    variants = make_variants(selected, grid, args.random)
+    entries = {name: [] for name in names}
+    for entry in backtest.entries_for(selected, args.start, args.end):
+        entries[entry[0]].append(entry)
+
+    longest = max(params.short_put_expiry_days for _, _, _, by_symbol in variants for params in by_symbol.values())
+    symbols = sorted({symbol for schedule in selected for symbol in schedule.symbols})
+    store = store_for(symbols, args.start, args.end + timedelta(days=longest + cfg.sweep_exit_margin_days))
+    logger.info(f"Sweeping {len(variants)} variants of {', '.join(names)} over "
+                f"{sum(len(own) for own in entries.values())} entries")
+
+    started = time.perf_counter()
+    results = run_sweep(variants, entries, store, args.workers)
+    logger.info(f"Sweep finished in {time.perf_counter() - started:.1f}s")
+    output = args.output if os.path.isabs(args.output) else os.path.join(backtest.HERE, args.output)
+    results.to_parquet(output, index=False)
+    logger.info(f"{len(results)} variant results written to {output}")
+    print_best(results, list(grid), args.top)
+
+
+if __name__ == "__main__":
+    main()
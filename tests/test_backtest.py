@@ -0,0 +1,110 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+import backtest
+import cfg
+from strategies import compile_params
+
+ENTRY_DAY = date(2024, 1, 8)  # Monday; short legs expire Friday 2024-01-12, long legs 2024-01-19
+
+PARAMS = {'strategy_tag': 'TDC', 'exchange': 'CME', 'opt_exchange': 'CME', 'sec_type': 'FUT', 'mult': '50',
+          'quantity': 1, 'target_put_delta': 20, 'target_call_delta': 20,
+          'short_put_expiry_days': 4, 'short_call_expiry_days': 4,
+          'long_put_expiry_days': 11, 'long_call_expiry_days': 11,
+          'submit_auto_close': True, 'close_time': '15:00:00'}
+
+
+def params(**overrides):
+    errors = []
+    compiled = compile_params('test.ES', PARAMS | overrides, errors)
+    assert not errors
+    return compiled
+
+
+def quotes(time: str, short: tuple, long: tuple) -> list:
+    """One snapshot: 20 and 30 delta puts and calls of both expiries, short and long legs priced (bid, ask)."""
+    rows = []
+    for expiry, (bid, ask) in (('20240112', short), ('20240119', long)):
+        for right, strike, delta in (('P', 4900, -0.20), ('P', 4950, -0.30), ('C', 5100, 0.20), ('C', 5050, 0.30)):
+            rows.append(f"{time},{expiry},{right},{strike},{bid},{ask},5000,{delta}")
+    return rows
+
+
+@pytest.fixture
+def data(tmp_path, monkeypatch):
+    directory = tmp_path / 'ES'
+    directory.mkdir()
+    header = "time,expiry,right,strike,bid,ask,underlying,delta"
+    days = {'20240108': quotes('10:00:00', (10, 11), (20, 21)),
+            '20240112': quotes('10:00:00', (10, 11), (20, 21)) + quotes('15:00:00', (1, 2), (13, 14))}
+    for day, rows in days.items():
+        (directory / f"{day}.csv").write_text("\n".join([header] + rows) + "\n")
+    monkeypatch.setattr(cfg, 'backtest_data_dir', str(tmp_path))
+    monkeypatch.setattr(cfg, 'backtest_slippage', 0.25)
+    monkeypatch.setattr(cfg, 'backtest_commission', 1.0)
+    monkeypatch.setattr(cfg, 'trading_calendar_years_back', cfg.trading_calendar_years_back)
+    backtest.cover_calendar(ENTRY_DAY)
+    backtest.use_store(None)
+    yield tmp_path
+    backtest.load_day.cache_clear()
+
+
+def test_entry_held_to_close_time_on_short_expiry(data):
+    record = backtest.simulate_entry('Test', 'ES', params(), ENTRY_DAY, backtest._seconds('09:45:00'))
+    assert record['status'] == 'closed'
+    assert record['entry_time'] == '10:00:00'
+    assert record['short_put_expiry'] == '20240112' and record['long_call_expiry'] == '20240119'
+    assert (record['short_put_strike'], record['short_call_strike']) == (4900.0, 5100.0)
+    assert (record['long_put_strike'], record['long_call_strike']) == (4900.0, 5100.0)
+    # Combo 18/22 at entry, paid a quarter of the half-spread over the mid; 22/26 at 15:00 on the exit day
+    assert record['entry_price'] == 20.5
+    assert (record['exit_date'], record['exit_time'], record['exit_price']) == ('2024-01-12', '15:00:00', 23.5)
+    assert record['pnl'] == (23.5 - 20.5) * 50 - 8
+
+
+def test_profit_target_exits_at_the_target(data):
+    record = backtest.simulate_entry('Test', 'ES', params(profit_target_pct=15), ENTRY_DAY,
+                                     backtest._seconds('10:00:00'))
+    assert record['status'] == 'profit_target'
+    assert record['exit_time'] == '15:00:00'
+    assert record['exit_price'] == pytest.approx(20.5 * 1.15)
+    assert record['pnl'] == round((20.5 * 1.15 - 20.5) * 50 - 8, 2)
+
+
+def test_untraded_statuses(data):
+    assert backtest.simulate_entry('Test', 'ES', params(), date(2024, 1, 9), 0)['status'] == 'no_data'
+    assert backtest.simulate_entry('Test', 'ES', params(), ENTRY_DAY, backtest._seconds('11:00:00'))['status'] == \
+        'no_snapshot'
+    assert backtest.simulate_entry('Test', 'ES', params(long_put_expiry_days=30), ENTRY_DAY, 0)['status'] == \
+        'no_expiry'
+
+
+def day_rows(rows: list) -> np.ndarray:
+    return np.array([(backtest._seconds(t), expiry, right, strike, bid, ask, 5000.0, np.nan)
+                     for t, expiry, right, strike, bid, ask in rows], dtype=backtest.DAY_DTYPE)
+
+
+def test_combo_marks_nets_the_legs_at_common_valid_times():
+    rows = day_rows([('10:00:00', 20240119, 'C', 5100, 20, 21), ('10:00:00', 20240112, 'C', 5100, 10, 11),
+                     ('11:00:00', 20240119, 'C', 5100, 22, 23), ('11:00:00', 20240112, 'C', 5100, 9, 10),
+                     ('12:00:00', 20240119, 'C', 5100, 24, 23),  # crossed
+                     ('12:00:00', 20240112, 'C', 5100, 8, 9),
+                     ('13:00:00', 20240119, 'C', 5100, 25, 26)])  # short leg not quoted
+    legs = [('20240119', 'C', 5100.0, 1), ('20240112', 'C', 5100.0, -1)]
+    times, bid, ask = backtest.combo_marks(rows, legs)
+    assert [backtest._hms(int(t)) for t in times] == ['10:00:00', '11:00:00']
+    assert list(bid) == [20 - 11, 22 - 10]
+    assert list(ask) == [21 - 10, 23 - 9]
+
+
+def test_summarize_counts_untraded_statuses():
+    records = [{'schedule': 'Test', 'status': 'closed', 'pnl': 100.0},
+               {'schedule': 'Test', 'status': 'profit_target', 'pnl': -40.0},
+               {'schedule': 'Test', 'status': 'no_exit'}, {'schedule': 'Test', 'status': 'no_exit'},
+               {'schedule': 'Test', 'status': 'no_quote'}]
+    [row] = backtest.summarize(records)
+    assert (row['entries'], row['trades'], row['profit_targets']) == (5, 2, 1)
+    assert (row['no_exit'], row['no_quote'], row['no_data']) == (2, 1, 0)
+    assert row['total_pnl'] == 60.0 and row['max_drawdown'] == 40.0
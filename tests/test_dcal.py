@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('ibstrat')
+
+import cfg
+from strategies import load_schedules
+
+SYMBOL = 'ES'
+
+
+@pytest.fixture(scope='module')
+def sim(tmp_path_factory):
+    """A connected SimIB standing in for the gateway, installed before the trading modules bind it."""
+    from simgw import install, instruments_for
+
+    saved = {name: getattr(cfg, name) for name in ('qualification_cache_path', 'ib_market_data_clientids',
+                                                   'test_ib_market_data_clientids', 'pushover_alerts',
+                                                   'trade_log_backend', 'trade_log_wal_path', 'trade_log_local_path',
+                                                   'sim_latency')}
+    cfg.sim_latency = 0.001
+    cfg.trade_log_local_path = str(tmp_path_factory.mktemp('sim') / 'trade_log.jsonl')
+    params = load_schedules()['Friday57'].params[SYMBOL]
+    sim = install(instruments=instruments_for({SYMBOL: params}))
+
+    from ibstrat.ib_instance import connect_to_ib
+    from ibpool import pool
+    from posindex import position_index
+
+    connect_to_ib(cfg.ib_host, cfg.ib_port, cfg.ib_clientid, 2)
+    sim.run(pool.connect_async(cfg.ib_host, cfg.ib_port, cfg.ib_market_data_clientids, cfg.ib_clientid))
+    position_index.start(pool.orders)
+    yield sim, params
+    from notify import notifier
+    from tradewriter import trade_log
+
+    sim.run(trade_log.drain())
+    sim.run(notifier.drain())
+    position_index.stop()
+    pool.disconnect()
+    sim.disconnect()
+    sim.run(asyncio.sleep(0))  # let the cancelled watchdog and tick tasks finish
+    for name, value in saved.items():
+        setattr(cfg, name, value)
+
+
+@pytest.fixture(autouse=True)
+def fresh_session(sim):
+    yield
+    sim[0].reset(sim[0].instruments)
+
+
+def held(sim) -> dict:
+    return {(p.contract.right, p.contract.strike, p.contract.lastTradeDateOrContractMonth): p.position
+            for p in sim.positions()}
+
+
+def test_open_double_calendar_buys_the_combo_and_holds_its_legs(sim):
+    from main import open_double_calendar
+
+    sim, params = sim
+    trade = open_double_calendar(SYMBOL, params, True)
+    assert trade is not None
+    assert trade.orderStatus.status == 'Filled'
+    assert trade.order.action == 'BUY' and trade.order.totalQuantity == params.quantity
+
+    legs = {leg.conId: leg for leg in trade.contract.comboLegs}
+    assert trade.contract.secType == 'BAG' and len(legs) == 4
+    positions = held(sim)
+    contracts = {p.contract.conId: p.contract for p in sim.positions()}
+    for con_id, leg in legs.items():
+        contract = contracts[con_id]
+        size = positions[(contract.right, contract.strike, contract.lastTradeDateOrContractMonth)]
+        assert size == (params.quantity if leg.action == 'BUY' else -params.quantity)
+
+    # A calendar per right: the short leg expires before the long one
+    for right in ('P', 'C'):
+        by_action = {leg.action: contracts[con_id] for con_id, leg in legs.items() if contracts[con_id].right == right}
+        assert set(by_action) == {'BUY', 'SELL'}
+        assert by_action['SELL'].lastTradeDateOrContractMonth < by_action['BUY'].lastTradeDateOrContractMonth
+
+
+def test_submit_double_calendar_places_the_given_legs(sim):
+    from dcal import submit_double_calendar
+    from ib_async import Future
+
+    sim, params = sim
+    [und] = sim.qualifyContracts(Future(SYMBOL, exchange=params.exchange))
+    chains = sim.reqSecDefOptParams(und.symbol, und.exchange, und.secType, und.conId)
+    chain = chains[0]
+    expiries = sorted(chain.expirations)
+    short_expiry, long_expiry = expiries[2], expiries[6]
+    strikes = sorted(chain.strikes)
+    spot = cfg.sim_spot_prices[SYMBOL]
+    put = max(strike for strike in strikes if strike <= spot * 0.98)
+    call = min(strike for strike in strikes if strike >= spot * 1.02)
+
+    trade = submit_double_calendar(und, put, call, put, call, short_expiry, long_expiry, short_expiry, long_expiry,
+                                   True, params)
+    assert trade is not None and trade.orderStatus.status == 'Filled'
+    assert held(sim) == {('P', put, short_expiry): -params.quantity, ('C', call, short_expiry): -params.quantity,
+                         ('P', put, long_expiry): params.quantity, ('C', call, long_expiry): params.quantity}
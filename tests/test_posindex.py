@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+
+import pytest
+from ib_async import IB, Contract, Execution, Fill
+from ib_async.objects import Position
+
+from posindex import PositionIndex
+
+EXPIRY = '20240119'
+
+
+def option(strike: float, right: str, expiry: str = EXPIRY, symbol: str = 'ES', con_id: int = None) -> Contract:
+    return Contract(secType='FOP', symbol=symbol, right=right, strike=strike, lastTradeDateOrContractMonth=expiry,
+                    conId=con_id or hash((symbol, right, strike, expiry)) % 1000000)
+
+
+def held(contract: Contract, size: float, account: str = 'U1') -> Position:
+    return Position(account, contract, size, 0.0)
+
+
+def leg(strike: float, right: str, position_type: str, expiry: str = EXPIRY) -> dict:
+    return {'strike': strike, 'right': right, 'expiry': expiry, 'position_type': position_type}
+
+
+def index_of(positions: list) -> tuple:
+    ib = IB()
+    ib.positions = lambda account='': list(positions)
+    return ib, PositionIndex().start(ib)
+
+
+# (held positions, check list, collision) under the ibstrat check_positions rule
+CASES = [
+    ([], [leg(5000, 'P', 'long')], False),
+    ([held(option(5000, 'P'), 1)], [leg(5000, 'P', 'long')], True),
+    ([held(option(5000, 'P'), 2)], [leg(5000, 'P', 'short')], False),
+    ([held(option(5000, 'P'), -1)], [leg(5000, 'P', 'short')], True),
+    ([held(option(5000, 'P'), -1)], [leg(5000, 'P', 'long')], False),
+    ([held(option(5000, 'P'), 1)], [leg(5000, 'C', 'long'), leg(5005, 'P', 'long'),
+                                    leg(5000, 'P', 'long', '20240126')], False),
+    ([held(option(5000, 'P', symbol='NQ'), 1)], [leg(5000, 'P', 'long')], False),
+    ([held(Contract(secType='FUT', symbol='ES', conId=1), 1)], [leg(5000, 'P', 'long')], False),
+    ([held(option(5000, 'P', expiry='20240119 16:00:00 US/Eastern'), 1)], [leg(5000, 'P', 'long')], True),
+    ([held(option(5100, 'C'), -1), held(option(4900, 'P'), 1)],
+     [leg(4900, 'P', 'long'), leg(5100, 'C', 'long'), leg(4900, 'P', 'short', '20240126')], True),
+]
+
+
+@pytest.mark.parametrize('positions, check_list, collision', CASES)
+def test_check_applies_the_ibstrat_rule(positions, check_list, collision):
+    _, index = index_of(positions)
+    assert index.check('ES', check_list) is collision
+
+
+@pytest.mark.parametrize('positions, check_list, collision', CASES)
+def test_check_matches_ibstrat_check_positions(positions, check_list, collision, monkeypatch):
+    ib_instance = pytest.importorskip('ibstrat.ib_instance')
+    from ibstrat import positions as ibstrat_positions
+
+    ib, index = index_of(positions)
+    monkeypatch.setattr(ib_instance, 'ib', ib)
+    monkeypatch.setattr(ibstrat_positions, 'ib', ib, raising=False)
+    ibstrat_positions.load_positions()
+    assert index.check('ES', check_list) is bool(ibstrat_positions.check_positions('ES', check_list)) is collision
+
+
+def test_index_follows_fills_positions_and_reconnects():
+    contract = option(5000, 'P', con_id=11)
+    positions = []
+    ib, index = index_of(positions)
+    check_list = [leg(5000, 'P', 'long')]
+    assert not index.check('ES', check_list)
+
+    # An execution counts at once, before its position update arrives
+    fill = Fill(contract, Execution(acctNumber='U1', side='BOT', shares=1), None, None)
+    ib.execDetailsEvent.emit(SimpleNamespace(), fill)
+    assert index.position('ES', 'P', EXPIRY, 5000) == 1 and index.check('ES', check_list)
+    ib.positionEvent.emit(held(contract, 1))
+    assert index.position('ES', 'P', EXPIRY, 5000) == 1
+
+    # Selling it out clears the strike
+    ib.execDetailsEvent.emit(SimpleNamespace(), Fill(contract, Execution(acctNumber='U1', side='SLD', shares=1),
+                                                     None, None))
+    assert not index.check('ES', check_list)
+
+    # A reconnect re-seeds the index from the connection's positions
+    positions.append(held(contract, 3, account='U2'))
+    ib.connectedEvent.emit()
+    assert index.position('ES', 'P', EXPIRY, 5000) == 3 and index.check('ES', check_list)
+
+    index.stop()
+    ib.positionEvent.emit(held(contract, 0, account='U2'))
+    assert index.position('ES', 'P', EXPIRY, 5000) == 3
@@ -0,0 +1,55 @@
+import pytest
+
+import sweep
+from strategies import compile_schedules
+
+PARAMS = {'strategy_tag': 'TDC', 'exchange': 'CME', 'opt_exchange': 'CME', 'sec_type': 'FUT', 'mult': '50',
+          'quantity': 1, 'target_put_delta': 20, 'target_call_delta': 20,
+          'short_put_expiry_days': 4, 'short_call_expiry_days': 4,
+          'long_put_expiry_days': 11, 'long_call_expiry_days': 11}
+
+
+@pytest.fixture
+def schedule():
+    compiled = compile_schedules({'Test': {'weekday': 0, 'entry_time': '10:00:00', 'symbols': ['ES', 'NQ'],
+                                           'params': {'ES': PARAMS, 'NQ': PARAMS | {'strategy_tag': 'TDCNQ'}}}})
+    return compiled['Test']
+
+
+def test_parse_values_lists_and_ranges():
+    assert sweep.parse_values('target_put_delta=15:30:5') == ('target_put_delta', [15, 20, 25, 30])
+    assert sweep.parse_values('profit_target_pct=0.1:0.3:0.1') == ('profit_target_pct', [0.1, 0.2, 0.3])
+    assert sweep.parse_values('short_put_expiry_days=3,5,7') == ('short_put_expiry_days', [3, 5, 7])
+    assert sweep.parse_values(' close_time = 15:00:00, 17:00:00') == ('close_time', ['15:00:00', '17:00:00'])
+    assert sweep.parse_values('submit_auto_close=true,0') == ('submit_auto_close', [True, False])
+
+
+def test_parse_values_rejects_fields_outside_the_sweep():
+    with pytest.raises(ValueError, match="cannot sweep 'quantity'"):
+        sweep.parse_values('quantity=1,2')
+
+
+def test_make_variants_overrides_every_symbol_after_the_baseline(schedule):
+    variants = sweep.make_variants([schedule], {'target_put_delta': [15, 25], 'close_time': ['15:00:00']})
+    assert [(name, number, overrides) for name, number, overrides, _ in variants] == [
+        ('Test', 0, {}), ('Test', 1, {'target_put_delta': 15, 'close_time': '15:00:00'}),
+        ('Test', 2, {'target_put_delta': 25, 'close_time': '15:00:00'})]
+    assert variants[0][3] == dict(schedule.params)
+    for _, _, overrides, params in variants[1:]:
+        assert {symbol: own.target_put_delta for symbol, own in params.items()} == \
+            {'ES': overrides['target_put_delta'], 'NQ': overrides['target_put_delta']}
+        assert params['NQ'].strategy_tag == 'TDCNQ'
+
+
+def test_make_variants_drops_invalid_and_late_short_put_variants(schedule):
+    variants = sweep.make_variants([schedule], {'short_put_expiry_days': [2, 4, 6, 11]})
+    # 6 expires after the short call (4), 11 is not before the long put
+    assert [overrides for _, _, overrides, _ in variants] == [{}, {'short_put_expiry_days': 2},
+                                                              {'short_put_expiry_days': 4}]
+
+
+def test_make_variants_samples_reproducibly(schedule):
+    grid = {'target_put_delta': [10, 15, 20, 25, 30], 'target_call_delta': [10, 15, 20, 25, 30]}
+    first = sweep.make_variants([schedule], grid, sample=6)
+    assert len(first) == 7
+    assert [v[2] for v in first] == [v[2] for v in sweep.make_variants([schedule], grid, sample=6)]
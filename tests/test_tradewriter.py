@@ -0,0 +1,108 @@
+import asyncio
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import cfg
+import tradewriter
+from tradewriter import TradeLogWriter, WriteAheadLog
+
+
+def record(order_id: int) -> dict:
+    return {'time': '2024-01-08T10:00:00', 'strategy_tag': 'TDC', 'symbol': 'ES', 'order_id': order_id,
+            'status': 'Submitted', 'legs': []}
+
+
+class FailingBackend:
+    def __init__(self):
+        self.calls = 0
+
+    def append(self, records: list):
+        self.calls += 1
+        raise ConnectionError("sheet down")
+
+
+@pytest.fixture
+def log_paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(cfg, 'trade_log_backend', 'local')
+    monkeypatch.setattr(cfg, 'trade_log_local_path', str(tmp_path / 'trade_log.jsonl'))
+    monkeypatch.setattr(cfg, 'trade_log_wal_path', str(tmp_path / 'tradelog.sqlite3'))
+    monkeypatch.setattr(cfg, 'trade_log_flush_interval', 0)
+    monkeypatch.setattr(cfg, 'trade_log_max_attempts', 2)
+    monkeypatch.setattr(cfg, 'trade_fill_timeout', 120)
+    monkeypatch.setattr(tradewriter, 'backoff_delay', lambda attempt: 0)
+    return tmp_path / 'trade_log.jsonl'
+
+
+def delivered(path) -> list:
+    return [json.loads(line)['order_id'] for line in path.read_text().splitlines()] if path.exists() else []
+
+
+def test_unsent_records_are_replayed_by_the_next_run(log_paths):
+    # An earlier run: one record completed, one still waiting for its fill, and a sheet that is down
+    wal = WriteAheadLog(cfg.trade_log_wal_path)
+    wal.complete(wal.add(record(1)), record(1) | {'status': 'Filled'})
+    wal.add(record(2))
+    earlier = TradeLogWriter()
+    earlier.backend = FailingBackend()
+
+    async def earlier_run():
+        earlier._start()
+        await earlier.drain()
+
+    asyncio.run(earlier_run())
+    assert earlier.backend.calls >= cfg.trade_log_max_attempts
+    assert delivered(log_paths) == []
+    assert [row[1]['order_id'] for row in wal.unsent(10)] == [1]
+
+    # The next run delivers the completed record once it starts
+    writer = TradeLogWriter()
+
+    async def next_run():
+        writer._start()
+        await writer.drain()
+
+    asyncio.run(next_run())
+    assert delivered(log_paths) == [1]
+    assert json.loads(log_paths.read_text())['status'] == 'Filled'
+
+    # The record whose fill wait never finished goes out once it is older than the wait
+    cfg.trade_fill_timeout = -1
+    asyncio.run(next_run())
+    assert delivered(log_paths) == [1, 2]
+    asyncio.run(next_run())
+    assert delivered(log_paths) == [1, 2]
+    assert WriteAheadLog(cfg.trade_log_wal_path).unsent(10) == []
+
+
+def test_ibstrat_backend_logs_filled_trades_off_the_event_loop(log_paths, monkeypatch):
+    tradelog = pytest.importorskip('ibstrat.tradelog')
+    calls = []
+
+    def log_trade_details(**kwargs):
+        calls.append((threading.current_thread(), kwargs))
+
+    monkeypatch.setattr(tradelog, 'log_trade_details', log_trade_details)
+    monkeypatch.setattr(cfg, 'trade_log_backend', 'ibstrat')
+    order = SimpleNamespace(action='BUY', totalQuantity=1, orderType='LMT', orderId=7, permId=70, lmtPrice=20.5)
+    trade = SimpleNamespace(order=order, contract=SimpleNamespace(symbol='ES', secType='BAG'),
+                            orderStatus=SimpleNamespace(status='Filled', filled=1, avgFillPrice=20.25),
+                            isDone=lambda: True)
+    und = SimpleNamespace(symbol='ES')
+    writer = TradeLogWriter()
+
+    async def run():
+        writer.submit(trade, und, [], [], 20.0, 'TDC')
+        assert calls == []  # submit returns before anything is logged
+        await writer.drain()
+
+    asyncio.run(run())
+    [(thread, kwargs)] = calls
+    assert thread is not threading.main_thread()
+    assert kwargs['trade'] is trade and kwargs['und_contract'] is und and kwargs['trade_contract'] is trade.contract
+    assert (kwargs['mid_price'], kwargs['strategy_tag'], kwargs['timeout']) == (20.0, 'TDC', 0)
+    assert kwargs['sheet_id'] == cfg.trade_log_sheet_id
+    assert writer._trades == {}
+    assert WriteAheadLog(cfg.trade_log_wal_path).unsent(10) == []
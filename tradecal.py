@@ -0,0 +1,202 @@
+"""
+Precomputed NYSE and CME trading-day calendars.
+
+Each calendar covers cfg.trading_calendar_years_back years before and
+cfg.trading_calendar_years_forward years after the current year. It is built once
+from the holidays package and cached to disk as a one-byte-per-day bitmap. On load
+the bitmap is expanded into lookup tables, so is-trading-day, next/previous trading
+day and trading-days-between are all O(1) array lookups.
+"""
+import logging
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+
+import cfg
+
+logger = logging.getLogger('DC')
+
+EXCHANGES = ('NYSE', 'CME')
+_HEADER = struct.Struct('<4sII')  # magic, first day ordinal, number of days
+_MAGIC = b'TCAL'
+
+_calendars = {}
+
+
+def _to_date(d) -> date:
+    if isinstance(d, datetime):
+        return d.date()
+    if isinstance(d, date):
+        return d
+    return datetime.strptime(d, "%Y-%m-%d" if "-" in d else "%Y%m%d").date()
+
+
+class TradingCalendar:
+    """Trading days of one exchange over a fixed window, with O(1) queries."""
+
+    def __init__(self, exchange: str, first: date, open_days: bytes):
+        self.exchange = exchange
+        self.first = first
+        self.last = first + timedelta(days=len(open_days) - 1)
+        self._open = open_days
+        n = len(open_days)
+        # _rank[i]: trading days on or before day i; _days: offsets of the trading days
+        self._rank = array('i', bytes(4 * n))
+        self._days = array('i')
+        count = 0
+        for i, is_open in enumerate(open_days):
+            if is_open:
+                self._days.append(i)
+                count += 1
+            self._rank[i] = count
+
+    def _offset(self, d) -> int:
+        d = _to_date(d)
+        i = d.toordinal() - self.first.toordinal()
+        if not 0 <= i < len(self._open):
+            raise ValueError(f"{d} is outside the {self.exchange} calendar window {self.first} - {self.last}")
+        return i
+
+    def _day(self, offset: int) -> date:
+        return date.fromordinal(self.first.toordinal() + offset)
+
+    def is_trading_day(self, d) -> bool:
+        return bool(self._open[self._offset(d)])
+
+    def next_trading_day(self, d, inclusive: bool = False) -> date:
+        """Return the first trading day after d (on or after d if inclusive)."""
+        i = self._offset(d)
+        rank = self._rank[i] - (1 if inclusive and self._open[i] else 0)
+        if rank >= len(self._days):
+            raise ValueError(f"No {self.exchange} trading day after {d} within the calendar window")
+        return self._day(self._days[rank])
+
+    def prev_trading_day(self, d, inclusive: bool = False) -> date:
+        """Return the last trading day before d (on or before d if inclusive)."""
+        i = self._offset(d)
+        rank = self._rank[i] - (0 if inclusive or not self._open[i] else 1)
+        if rank <= 0:
+            raise ValueError(f"No {self.exchange} trading day before {d} within the calendar window")
+        return self._day(self._days[rank - 1])
+
+    def trading_days_between(self, start, end) -> int:
+        """Return the number of trading days in (start, end]; negative if end is before start."""
+        return self._rank[self._offset(end)] - self._rank[self._offset(start)]
+
+    def add_trading_days(self, d, n: int) -> date:
+        """Return the trading day n trading days after d (before d for negative n)."""
+        if n == 0:
+            return self.next_trading_day(d, inclusive=True)
+        i = self._offset(d)
+        if n > 0:
+            index = self._rank[i] + n - 1
+        else:
+            index = self._rank[i] - self._open[i] + n
+        if not 0 <= index < len(self._days):
+            raise ValueError(f"{d} {n:+d} trading days is outside the {self.exchange} calendar window")
+        return self._day(self._days[index])
+
+    def dte(self, expiry, today=None) -> int:
+        """Trading days from today (exclusive) to expiry (inclusive)."""
+        return self.trading_days_between(today or date.today(), expiry)
+
+
+def _cache_path(exchange: str) -> str:
+    path = cfg.trading_calendar_cache_dir
+    if not os.path.isabs(path):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+    return os.path.join(path, f"tradecal_{exchange}.bin")
+
+
+def _window(today: date):
+    return (date(today.year - cfg.trading_calendar_years_back, 1, 1),
+            date(today.year + cfg.trading_calendar_years_forward, 12, 31))
+
+
+def build(exchange: str, first: date, last: date) -> TradingCalendar:
+    """Build a calendar from the holidays package: weekdays that are not exchange holidays."""
+    import holidays
+
+    closed = holidays.financial_holidays(exchange, years=range(first.year, last.year + 1))
+    days = (last - first).days + 1
+    open_days = bytes(1 if (d := first + timedelta(days=i)).weekday() < 5 and d not in closed else 0
+                      for i in range(days))
+    return TradingCalendar(exchange, first, open_days)
+
+
+def _load(path: str, exchange: str):
+    with open(path, 'rb') as f:
+        magic, first_ordinal, n = _HEADER.unpack(f.read(_HEADER.size))
+        open_days = f.read(n)
+    if magic != _MAGIC or len(open_days) != n:
+        raise ValueError(f"Corrupt trading calendar cache {path}")
+    return TradingCalendar(exchange, date.fromordinal(first_ordinal), open_days)
+
+
+def _save(path: str, calendar: TradingCalendar):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, calendar.first.toordinal(), len(calendar._open)))
+        f.write(calendar._open)
+    os.replace(tmp, path)
+
+
+def calendar(exchange: str = 'NYSE') -> TradingCalendar:
+    """
+    Return the trading calendar for an exchange, loading it from the disk cache or
+    building and caching it if the cache is missing, stale or does not cover the window.
+    """
+    if exchange in _calendars:
+        return _calendars[exchange]
+    if exchange not in EXCHANGES:
+        raise ValueError(f"Unsupported trading calendar: {exchange}")
+
+    first, last = _window(date.today())
+    path = _cache_path(exchange)
+    cal = None
+    try:
+        if time.time() - os.path.getmtime(path) < cfg.trading_calendar_max_age_days * 86400:
+            cal = _load(path, exchange)
+            if cal.first > first or cal.last < last:
+                cal = None
+    except (OSError, ValueError, struct.error) as e:
+        logger.debug(f"Trading calendar cache for {exchange} not usable: {e}")
+    if cal is None:
+        logger.info(f"Building {exchange} trading calendar {first} - {last}")
+        cal = build(exchange, first, last)
+        _save(path, cal)
+    _calendars[exchange] = cal
+    return cal
+
+
+def calendar_for_sec_type(sec_type: str) -> TradingCalendar:
+    """Futures and futures options trade on the CME calendar, everything else on NYSE."""
+    return calendar('CME' if sec_type in ('FUT', 'FOP') else 'NYSE')
+
+
+def is_friday_before_monday_holiday(d) -> bool:
+    """
+    Return True if d (a date, YYYYMMDD or YYYY-MM-DD) is a Friday immediately
+    before a Monday the NYSE is closed, for a holiday or a special closure.
+    """
+    d = _to_date(d)
+    return d.weekday() == 4 and not calendar('NYSE').is_trading_day(d + timedelta(days=3))
+
+
+def next_closest_expiry(expirations: list, target_expiry: str):
+    """Return the first expiry in the sorted expirations (YYYYMMDD) on or after target_expiry."""
+    i = bisect_left(expirations, target_expiry)
+    return expirations[i] if i < len(expirations) else None
+
+
+def expiry_target_date(days: int, sec_type: str = 'IND', today=None) -> str:
+    """
+    Return the target expiry (YYYYMMDD) days calendar days from today, rolled forward
+    to the next trading day when it falls on a weekend or holiday.
+    """
+    target = (today or date.today()) + timedelta(days=days)
+    return calendar_for_sec_type(sec_type).next_trading_day(target, inclusive=True).strftime("%Y%m%d")
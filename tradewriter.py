@@ -0,0 +1,293 @@
+"""
+Background trade log, kept off the order path.
+
+dcal hands each submitted entry to `trade_log.submit`, which returns at once. The entry
+is written to a local SQLite write-ahead log straight away. A background task then
+waits up to cfg.trade_fill_timeout for the fill, completes the record in the log and
+queues it. A worker flushes queued records to the backend in batches, retrying with
+backoff. Rows are marked sent only once the backend accepted them, so records that
+could not be delivered (sheet down, queue full, process stopped) go out with a later
+flush, in this run or the next.
+
+The backend (cfg.trade_log_backend) is one of:
+
+- 'ibstrat', the default: ibstrat log_trade_details writes each entry to the sheet
+  in its own layout, on a worker thread once the fill wait is over. It needs the
+  live trade, so records left by an earlier run are only logged locally.
+- 'sheets': one row of SHEET_COLUMNS per entry, legs in the last column, appended
+  with the Sheets API. This is not the ibstrat layout, so give it its own tab
+  (cfg.trade_log_sheet_range).
+- 'local': a JSON lines stand-in, which the simulator uses.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+import cfg
+from reconnect import backoff_delay
+
+logger = logging.getLogger('DC')
+
+# Sheet columns, in order
+SHEET_COLUMNS = ('time', 'strategy_tag', 'symbol', 'status', 'action', 'quantity', 'order_type', 'mid_price',
+                 'limit_price', 'avg_fill_price', 'filled', 'order_id', 'perm_id', 'legs')
+
+
+def _resolve(path: str) -> str:
+    if path != ':memory:' and not os.path.isabs(path):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+    return path
+
+
+def trade_record(trade, und_contract, legs: list, leg_actions: list, mid_price: float, strategy_tag: str) -> dict:
+    order = trade.order
+    record = {'time': datetime.now().isoformat(timespec='seconds'), 'strategy_tag': strategy_tag,
+              'symbol': und_contract.symbol, 'action': order.action, 'quantity': order.totalQuantity,
+              'order_type': order.orderType, 'mid_price': mid_price, 'order_id': order.orderId,
+              'legs': [{'action': action, 'right': leg.right, 'strike': leg.strike,
+                        'expiry': leg.lastTradeDateOrContractMonth} for leg, action in zip(legs, leg_actions)]}
+    return update_record(record, trade)
+
+
+def update_record(record: dict, trade) -> dict:
+    """Refresh the order state fields of a record from the trade."""
+    status = trade.orderStatus
+    record.update(status=status.status, filled=status.filled, avg_fill_price=status.avgFillPrice or None,
+                  perm_id=trade.order.permId,
+                  limit_price=trade.order.lmtPrice if trade.order.orderType == 'LMT' else None)
+    return record
+
+
+def sheet_row(record: dict) -> list:
+    legs = "; ".join(f"{leg['action']} {leg['right']} {leg['strike']} {leg['expiry']}" for leg in record['legs'])
+    return ['' if record.get(column) is None else record[column] for column in SHEET_COLUMNS[:-1]] + [legs]
+
+
+class SheetsBackend:
+    """Appends records as rows to a Google Sheet with the Sheets API and service-account credentials."""
+
+    def __init__(self, sheet_id: str, sheet_range: str, credentials_path: str):
+        self.sheet_id = sheet_id
+        self.sheet_range = sheet_range
+        self.credentials_path = _resolve(credentials_path)
+        self._service = None
+
+    @property
+    def service(self):
+        if self._service is None:
+            from google.oauth2.service_account import Credentials
+            from googleapiclient.discovery import build
+
+            credentials = Credentials.from_service_account_file(
+                self.credentials_path, scopes=['https://www.googleapis.com/auth/spreadsheets'])
+            self._service = build('sheets', 'v4', credentials=credentials, cache_discovery=False)
+        return self._service
+
+    def append(self, rows: list):
+        records = [record for _, record in rows]
+        self.service.spreadsheets().values().append(
+            spreadsheetId=self.sheet_id, range=self.sheet_range, valueInputOption='USER_ENTERED',
+            insertDataOption='INSERT_ROWS', body={'values': [sheet_row(record) for record in records]}).execute()
+
+
+class LocalBackend:
+    """Stand-in for the sheet that appends records to a JSON lines file."""
+
+    def __init__(self, path: str):
+        self.path = _resolve(path)
+
+    def append(self, rows: list):
+        with open(self.path, 'a') as f:
+            for _, record in rows:
+                f.write(json.dumps(record) + "\n")
+
+
+class IbstratBackend:
+    """
+    Logs entries with ibstrat log_trade_details, in the sheet layout it has always written.
+    It is called off the event loop after the fill wait, so it gets no timeout of its own.
+    """
+
+    def __init__(self, sheet_id: str, trades: dict):
+        self.sheet_id = sheet_id
+        self.trades = trades  # WAL row id -> (trade, und_contract) of this run
+        self._logged = set()  # rows of a batch already logged, skipped when the batch is retried
+
+    def append(self, rows: list):
+        import ibstrat.ib_instance
+        from ibstrat.tradelog import log_trade_details
+
+        for row_id, record in rows:
+            if row_id in self._logged:
+                continue
+            if row_id not in self.trades:
+                logger.warning(f"Trade log record {row_id} is from an earlier run, without the trade "
+                               f"log_trade_details needs: {record}")
+            else:
+                trade, und_contract = self.trades[row_id]
+                log_trade_details(ib=ibstrat.ib_instance.ib, und_contract=und_contract, trade_contract=trade.contract,
+                                  mid_price=record['mid_price'], trade=trade, timeout=0, sheet_id=self.sheet_id,
+                                  strategy_tag=record['strategy_tag'])
+            self._logged.add(row_id)
+        self._logged.difference_update(row_id for row_id, _ in rows)
+
+
+def make_backend(trades: dict):
+    if cfg.trade_log_backend == 'ibstrat':
+        return IbstratBackend(cfg.trade_log_sheet_id, trades)
+    if cfg.trade_log_backend == 'local':
+        return LocalBackend(cfg.trade_log_local_path)
+    if cfg.trade_log_backend != 'sheets':
+        raise ValueError(f"Unknown trade_log_backend '{cfg.trade_log_backend}', use 'ibstrat', 'sheets' or 'local'")
+    return SheetsBackend(cfg.trade_log_sheet_id, cfg.trade_log_sheet_range, cfg.trade_log_credentials_path)
+
+
+class WriteAheadLog:
+    """
+    Trade records in a local SQLite file. A row is ready once its fill wait is over
+    and sent once the backend accepted it.
+    """
+
+    def __init__(self, path: str):
+        self.path = _resolve(path)
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS trade_log ("
+                               " id INTEGER PRIMARY KEY AUTOINCREMENT, created REAL, ready INTEGER,"
+                               " sent REAL, record TEXT)")
+        return self._conn
+
+    def add(self, record: dict) -> int:
+        cursor = self.conn.execute("INSERT INTO trade_log (created, ready, sent, record) VALUES (?, 0, NULL, ?)",
+                                   (time.time(), json.dumps(record)))
+        self.conn.commit()
+        return cursor.lastrowid
+
+    def complete(self, row_id: int, record: dict):
+        self.conn.execute("UPDATE trade_log SET ready = 1, record = ? WHERE id = ?", (json.dumps(record), row_id))
+        self.conn.commit()
+
+    def unsent(self, limit: int) -> list:
+        """
+        Return up to limit unsent (id, record) rows, oldest first. Rows whose fill wait
+        never finished (the process stopped) are included once they are older than it.
+        """
+        stale = time.time() - cfg.trade_fill_timeout
+        rows = self.conn.execute("SELECT id, record FROM trade_log WHERE sent IS NULL AND (ready = 1 OR created < ?)"
+                                 " ORDER BY id LIMIT ?", (stale, limit)).fetchall()
+        return [(row_id, json.loads(record)) for row_id, record in rows]
+
+    def mark_sent(self, row_ids: list):
+        now = time.time()
+        self.conn.executemany("UPDATE trade_log SET sent = ? WHERE id = ?", [(now, row_id) for row_id in row_ids])
+        self.conn.execute("DELETE FROM trade_log WHERE sent < ?", (now - cfg.trade_log_keep_days * 86400,))
+        self.conn.commit()
+
+
+class TradeLogWriter:
+    """Queue, write-ahead log and batching flush worker for the trade log."""
+
+    def __init__(self):
+        self._wal = None
+        self.backend = None
+        self._queue = None
+        self._worker = None
+        self._waiting = set()
+        self._flush_lock = None
+        self._trades = {}  # WAL row id -> (trade, und_contract) until the record is sent
+
+    @property
+    def wal(self) -> WriteAheadLog:
+        if self._wal is None:
+            self._wal = WriteAheadLog(cfg.trade_log_wal_path)
+        return self._wal
+
+    def _start(self):
+        if self._worker is None or self._worker.done():
+            self.backend = self.backend or make_backend(self._trades)
+            self._queue = asyncio.Queue(maxsize=cfg.trade_log_queue_size)
+            self._flush_lock = asyncio.Lock()
+            self._worker = asyncio.ensure_future(self._run())
+            self._queue.put_nowait(None)  # deliver anything left unsent by an earlier run
+
+    def submit(self, trade, und_contract, legs: list, leg_actions: list, mid_price: float, strategy_tag: str):
+        """Log a submitted entry once it fills or cfg.trade_fill_timeout passes. Returns at once."""
+        self._start()
+        record = trade_record(trade, und_contract, legs, leg_actions, mid_price, strategy_tag)
+        row_id = self.wal.add(record)
+        self._trades[row_id] = (trade, und_contract)
+        task = asyncio.ensure_future(self._complete_on_fill(row_id, trade, record))
+        self._waiting.add(task)
+        task.add_done_callback(self._waiting.discard)
+
+    async def _complete_on_fill(self, row_id: int, trade, record: dict):
+        from aio import wait_for_fill_async
+
+        if not await wait_for_fill_async(trade, cfg.trade_fill_timeout):
+            logger.warning(f"Order {trade.order.orderId} for {record['symbol']} not filled within "
+                           f"{cfg.trade_fill_timeout}s, logging it as {trade.orderStatus.status}")
+        self.wal.complete(row_id, update_record(record, trade))
+        try:
+            self._queue.put_nowait(row_id)
+        except asyncio.QueueFull:
+            logger.warning(f"Trade log queue full, record {row_id} waits in the write-ahead log")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._queue.get()
+            # Collect what else arrives within the flush interval into the same batch
+            deadline = loop.time() + cfg.trade_log_flush_interval
+            batch = 1
+            while batch < cfg.trade_log_batch_size and (remaining := deadline - loop.time()) > 0:
+                try:
+                    await asyncio.wait_for(self._queue.get(), remaining)
+                    batch += 1
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.exception(f"Trade log flush failed: {e}")
+
+    async def flush(self) -> bool:
+        """Send every ready unsent record in batches; return False if the backend kept failing."""
+        async with self._flush_lock:
+            while rows := self.wal.unsent(cfg.trade_log_batch_size):
+                for attempt in range(cfg.trade_log_max_attempts):
+                    try:
+                        await asyncio.to_thread(self.backend.append, rows)
+                        break
+                    except Exception as e:
+                        logger.warning(f"Trade log flush of {len(rows)} records failed (attempt {attempt + 1}): {e}")
+                        await asyncio.sleep(backoff_delay(attempt))
+                else:
+                    logger.error(f"Trade log backend unavailable, {len(rows)} records stay in {self.wal.path}")
+                    return False
+                self.wal.mark_sent([row_id for row_id, _ in rows])
+                for row_id, _ in rows:
+                    self._trades.pop(row_id, None)
+                logger.info(f"Trade log: {len(rows)} records written")
+        return True
+
+    async def drain(self):
+        """Wait for the pending fill waits, then flush. Called before the process exits."""
+        if self._worker is None:
+            return
+        if self._waiting:
+            logger.info(f"Waiting for {len(self._waiting)} trade log records to complete")
+            await asyncio.gather(*self._waiting, return_exceptions=True)
+        await self.flush()
+        self._worker.cancel()
+        self._worker = None
+
+
+trade_log = TradeLogWriter()
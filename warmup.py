@@ -0,0 +1,140 @@
+import asyncio
+import logging
+from datetime import datetime, date
+
+from ibstrat.trclass import get_trading_class_for_symbol
+from aio import resolve_underlying_async, fetch_chain_snapshot_async, apply_greeks_source, valid_price
+from ibpool import pool
+from strategies import StrategyParams
+import cfg
+
+logger = logging.getLogger('DC')
+
+
+class Warmup:
+    """
+    Time-independent entry work for one symbol, done ahead of the entry time.
+
+    Resolves the underlying and the four expiries, lists their chains and holds
+    streaming subscriptions to the underlying and to cfg.warmup_candidate_strikes
+    strikes either side of the current target-delta strikes. At entry time the mid
+    price and chain quotes are read from those subscriptions without a request.
+    """
+
+    def __init__(self, symbol: str, params: StrategyParams):
+        self.symbol = symbol
+        self.params = params
+        self.und_contract = None
+        self.expiries = None
+        self.chain = None
+        self.und_ticker = None
+        self._prepared_mid = None
+        self._option_tickers = {}  # expiry -> streaming tickers of the candidate strikes
+        self._subscribed = []
+        self._ib = None
+
+    @property
+    def market_data_lines(self) -> int:
+        return len(self._subscribed)
+
+    async def prepare(self) -> bool:
+        resolved = await resolve_underlying_async(self.symbol, self.params, get_trading_class_for_symbol(self.symbol))
+        if resolved is None:
+            return False
+        self.und_contract, self._prepared_mid, self.expiries = resolved
+        short_put_expiry, short_call_expiry, long_put_expiry, long_call_expiry = self.expiries
+
+        self.chain = await fetch_chain_snapshot_async(self.und_contract, self.params.opt_exchange,
+                                                      [short_put_expiry, short_call_expiry],
+                                                      [long_put_expiry, long_call_expiry],
+                                                      self._prepared_mid, trading_class=self.params.trading_class)
+
+        candidates = {}
+        n = cfg.warmup_candidate_strikes
+        for expiry, right, key in ((short_call_expiry, 'C', 'target_call_delta'),
+                                   (short_put_expiry, 'P', 'target_put_delta')):
+            strikes = self.chain.strikes(expiry, right)
+            if not strikes:
+                logger.error(f"No {right} strikes listed for {self.symbol} {expiry}, warmup failed")
+                return False
+            target = self.chain.strike_by_target_delta(expiry, right, getattr(self.params, key))
+            centre = self.chain.nearest_strike(expiry, right, target if target is not None else self._prepared_mid)
+            i = strikes.index(centre)
+            candidates.setdefault(expiry, []).extend(self.chain.contract(expiry, right, strike)
+                                                     for strike in strikes[max(0, i - n):i + n + 1])
+
+        contracts = [self.und_contract] + [c for expiry_contracts in candidates.values() for c in expiry_contracts]
+        self._ib = pool.market_data()
+        async with pool.pacer_for(self._ib).slot(cost=len(contracts)):
+            self.und_ticker = self._ib.reqMktData(self.und_contract, '', False, False)
+            for expiry, expiry_contracts in candidates.items():
+                self._option_tickers[expiry] = [self._ib.reqMktData(c, '', False, False)
+                                                 for c in expiry_contracts]
+        self._subscribed = contracts
+        logger.info(f"Warmup for {self.symbol} holding {len(contracts)} subscriptions, expiries {self.expiries}")
+        return True
+
+    def mid(self) -> float:
+        """Return the underlying mid from the streaming ticker, or the warmup mid if it has no quote."""
+        mid = self.und_ticker.midpoint()
+        if not valid_price(mid):
+            mid = self.und_ticker.marketPrice()
+        if not valid_price(mid):
+            logger.warning(f"No live quote for {self.symbol}, using warmup mid {self._prepared_mid}")
+            mid = self._prepared_mid
+        return mid
+
+    def chain_snapshot(self, current_mid: float):
+        """Return a ChainSnapshot of the warm listings holding the live candidate-strike tickers."""
+        snapshot = self.chain.listings_copy()
+        for expiry, tickers in self._option_tickers.items():
+            snapshot.add_tickers(expiry, tickers)
+            apply_greeks_source(snapshot, expiry, current_mid)
+        return snapshot
+
+    def covers(self, snapshot) -> bool:
+        """
+        Return False if a target-delta strike falls on the edge of the held candidates,
+        meaning the market has moved and the full chain should be fetched instead.
+        """
+        short_put_expiry, short_call_expiry = self.expiries[:2]
+        for expiry, right, key in ((short_call_expiry, 'C', 'target_call_delta'),
+                                   (short_put_expiry, 'P', 'target_put_delta')):
+            held = sorted(t.contract.strike for t in snapshot.tickers(expiry, right))
+            strike = snapshot.strike_by_target_delta(expiry, right, getattr(self.params, key))
+            if strike is None or strike in (held[0], held[-1]):
+                logger.warning(f"Target {right} strike for {self.symbol} is outside the warm candidates, "
+                               f"fetching the full chain")
+                return False
+        return True
+
+    def release(self):
+        for contract in self._subscribed:
+            self._ib.cancelMktData(contract)
+        self._subscribed = []
+
+
+async def warm_up_symbols_async(symbols: list, params: dict) -> dict:
+    """Prepare a Warmup for every symbol concurrently; symbols that fail run cold."""
+    warmups = {symbol: Warmup(symbol, params[symbol]) for symbol in symbols}
+    results = await asyncio.gather(*(warmup.prepare() for warmup in warmups.values()), return_exceptions=True)
+    for symbol, result in zip(list(warmups), results):
+        if result is not True:
+            logger.error(f"Warmup failed for {symbol}, it will run cold: {result}")
+            warmups.pop(symbol).release()
+    lines = sum(warmup.market_data_lines for warmup in warmups.values())
+    if lines > cfg.max_market_data_lines:
+        logger.warning(f"Warmup holds {lines} market data lines, above cfg.max_market_data_lines "
+                       f"({cfg.max_market_data_lines}); lower cfg.warmup_candidate_strikes")
+    return warmups
+
+
+async def sleep_until_async(entry_time: str):
+    """Sleep until entry_time (HH:MM:SS, local time) today; return at once if it has passed."""
+    target = datetime.combine(date.today(), datetime.strptime(entry_time, "%H:%M:%S").time())
+    delay = (target - datetime.now()).total_seconds()
+    if delay <= 0:
+        logger.warning(f"Entry time {entry_time} has already passed, firing now")
+        return
+    logger.info(f"Warmup complete, waiting {delay:.1f}s until {entry_time}")
+    await asyncio.sleep(delay)